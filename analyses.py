@@ -0,0 +1,112 @@
+import ast_nodes as ast
+
+
+class Analysis:
+    """A fact computed from one FunctionDefNode, cached by AnalysisManager.
+
+    Subclasses implement run(function, manager) and may get other analyses
+    of the same function from `manager`. Results must not be modified by
+    their users.
+    """
+
+    @classmethod
+    def run(cls, function, manager):
+        raise NotImplementedError("Each analysis must implement 'run'")
+
+
+class LocalSymbols(Analysis):
+    """(parameter symbol IDs, local variable symbol IDs) of a function, in declaration order.
+
+    Locals are those declared in the body's blocks, if/while/for bodies and
+    for initializers; a name declared twice is listed twice.
+    """
+
+    @classmethod
+    def run(cls, function, manager):
+        params = tuple(param.name.symbol_id for param in function.params or ()
+                       if param.name and param.name.name)
+        local_vars = []
+        pending = [function.body] if function.body else []
+        while pending:
+            node = pending.pop()
+            if isinstance(node, ast.BlockNode) and node.statements:
+                pending.extend(reversed(node.statements))
+            elif isinstance(node, ast.VarDeclNode):
+                if node.name and node.name.name:
+                    local_vars.append(node.name.symbol_id)
+            elif isinstance(node, ast.IfNode):
+                if node.else_block: pending.append(node.else_block)
+                if node.then_block: pending.append(node.then_block)
+            elif isinstance(node, ast.WhileNode) and node.body:
+                pending.append(node.body)
+            elif isinstance(node, ast.ForNode):
+                if node.body: pending.append(node.body)
+                if node.init and isinstance(node.init, ast.VarDeclNode):
+                    pending.append(node.init)
+        return params, tuple(local_vars)
+
+
+class Callees(Analysis):
+    """Symbol IDs of the functions a function calls, in order of first call (its call graph edges)."""
+
+    @classmethod
+    def run(cls, function, manager):
+        callees = {}
+        pending = [function.body]
+        while pending:
+            node = pending.pop()
+            if node is None:
+                continue
+            if isinstance(node, ast.Node):
+                if isinstance(node, ast.FunctionCallNode) and isinstance(node.name, ast.IdentifierNode):
+                    callees[node.name.symbol_id] = None
+                pending.extend(getattr(node, field) for field in reversed(node._child_fields))
+            else:
+                pending.extend(reversed(node))
+        return tuple(callees)
+
+
+class AnalysisManager:
+    """Computes analyses of FunctionDefNodes on first request and caches them until invalidated.
+
+    Passes report the functions they modify with invalidate(), naming the
+    analyses they keep valid. `hits` and `misses` count requests per
+    analysis class.
+    """
+
+    def __init__(self):
+        # Function node -> {analysis class: result}.
+        self._results = {}
+        self.hits = {}
+        self.misses = {}
+
+    def get(self, analysis, function):
+        results = self._results.get(function)
+        if results is None:
+            results = self._results[function] = {}
+        elif analysis in results:
+            self.hits[analysis] = self.hits.get(analysis, 0) + 1
+            return results[analysis]
+        self.misses[analysis] = self.misses.get(analysis, 0) + 1
+        result = results[analysis] = analysis.run(function, self)
+        return result
+
+    def invalidate(self, function, preserved=()):
+        """Forget the results for `function`, except those of the analyses in `preserved`."""
+        results = self._results.get(function)
+        if results is None:
+            return
+        if not preserved:
+            del self._results[function]
+            return
+        for analysis in list(results):
+            if analysis not in preserved:
+                del results[analysis]
+
+    def clear(self):
+        self._results = {}
+
+    def counters(self):
+        """{analysis name: (hits, misses)} for every analysis requested so far."""
+        return {analysis.__name__: (self.hits.get(analysis, 0), self.misses.get(analysis, 0))
+                for analysis in {**self.misses, **self.hits}}
@@ -0,0 +1,400 @@
+from array import array
+from collections import Counter
+from collections.abc import MutableSequence
+
+import ast_nodes as ast
+
+NONE = -1
+
+# How each node class's fields are stored. "node" and "list" fields are
+# children and live in the node's block of `children` (a list is its length,
+# or NONE for None, followed by the item indexes); a "value" field indexes
+# `constants` and an "op" field indexes OPERATORS.
+SCHEMA = {
+    ast.ProgramNode: (("declarations", "list"),),
+    ast.FunctionDefNode: (("return_type", "node"), ("name", "node"), ("params", "list"), ("body", "node")),
+    ast.ParamNode: (("param_type", "node"), ("name", "node")),
+    ast.TypeNode: (("type_name", "value"),),
+    ast.BlockNode: (("statements", "list"),),
+    ast.VarDeclNode: (("var_type", "node"), ("name", "node"), ("initializer", "node")),
+    ast.AssignmentNode: (("lvalue", "node"), ("rvalue", "node")),
+    ast.IfNode: (("condition", "node"), ("then_block", "node"), ("else_block", "node")),
+    ast.WhileNode: (("condition", "node"), ("body", "node")),
+    ast.ForNode: (("init", "node"), ("condition", "node"), ("update", "node"), ("body", "node")),
+    ast.ReturnNode: (("expr", "node"),),
+    ast.FunctionCallNode: (("name", "node"), ("args", "list")),
+    ast.ExprStatementNode: (("expr", "node"),),
+    ast.BinaryOpNode: (("left", "node"), ("op", "op"), ("right", "node")),
+    ast.UnaryOpNode: (("op", "op"), ("expr", "node")),
+    ast.IdentifierNode: (("symbol_id", "value"),),
+    ast.NumberLiteralNode: (("value", "value"),),
+    ast.CharLiteralNode: (("value", "value"),),
+    ast.StringLiteralNode: (("value", "value"),),
+    ast.BoolLiteralNode: (("value", "value"),),
+}
+
+NODE_CLASSES = tuple(SCHEMA)
+OPERATORS = ("+", "-", "*", "/", "%", "<", ">", "<=", ">=", "==", "!=", "&&", "||", "!")
+
+_KINDS = {cls: kind for kind, cls in enumerate(NODE_CLASSES)}
+_KINDS.update({shared: _KINDS[cls] for cls, shared in ast.SHARED_LEAF_CLASSES.items()})
+_OPERATOR_CODES = {op: code for code, op in enumerate(OPERATORS)}
+# Per kind, the "node"/"list" layout of its child block.
+_CHILD_LAYOUTS = tuple(tuple(slot for _, slot in SCHEMA[cls] if slot in ("node", "list")) for cls in NODE_CLASSES)
+
+
+class ArenaNodeView:
+    """Marker base of the view classes ASTArena.view() hands out."""
+    __slots__ = ()
+
+
+class ArenaList(MutableSequence):
+    """A "list" field of an arena node; reads and writes go straight to the arena."""
+
+    def __init__(self, arena, index, position):
+        self._arena = arena
+        self._index = index
+        self._position = position
+
+    def _items(self):
+        offset = self._arena._child_offset(self._index, self._position)
+        count = self._arena.children[offset]
+        return offset + 1, max(count, 0)
+
+    def __len__(self):
+        return self._items()[1]
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        first, count = self._items()
+        return self._arena._node_at(self._arena.children[first + range(count)[i]])
+
+    def __setitem__(self, i, value):
+        if isinstance(i, slice):
+            items = list(self)
+            items[i] = value
+            self._arena._set_child(self._index, self._position, items)
+            return
+        child = self._arena.add(value)
+        first, count = self._items()
+        self._arena.children[first + range(count)[i]] = child
+
+    def __delitem__(self, i):
+        items = list(self)
+        del items[i]
+        self._arena._set_child(self._index, self._position, items)
+
+    def insert(self, i, value):
+        items = list(self)
+        items.insert(i, value)
+        self._arena._set_child(self._index, self._position, items)
+
+    def __repr__(self):
+        return f"ArenaList({list(self)!r})"
+
+
+def _view_property(field, slot, position):
+    if slot == "value":
+        def get(self):
+            return self._arena.constants[self._arena.values[self._index]]
+
+        def set(self, value):
+            self._arena.values[self._index] = self._arena._constant(value)
+    elif slot == "op":
+        def get(self):
+            code = self._arena.ops[self._index]
+            return None if code == NONE else OPERATORS[code]
+
+        def set(self, value):
+            self._arena.ops[self._index] = _operator_code(value)
+    else:
+        def get(self):
+            return self._arena._get_child(self._index, position)
+
+        def set(self, value):
+            self._arena._set_child(self._index, position, value)
+    return property(get, set)
+
+
+def _get_line(self):
+    line = self._arena.lines[self._index]
+    return None if line == NONE else line
+
+
+def _set_line(self, value):
+    self._arena.lines[self._index] = NONE if value is None else value
+
+
+def _make_view_class(cls):
+    # Same name and a subclass of the node class, so visit_<name> dispatch and
+    # isinstance checks in the passes and CodeGenerator work unchanged.
+    namespace = {"__slots__": ("_arena", "_index"), "line_no": property(_get_line, _set_line),
+                 "__repr__": lambda self: f"<{cls.__name__} view of node {self._index}>"}
+    position = 0
+    for field, slot in SCHEMA[cls]:
+        namespace[field] = _view_property(field, slot, position)
+        if slot in ("node", "list"):
+            position += 1
+    return type(cls.__name__, (ArenaNodeView, cls), namespace)
+
+
+_VIEW_CLASSES = tuple(_make_view_class(cls) for cls in NODE_CLASSES)
+
+
+def _operator_code(op):
+    if op is None:
+        return NONE
+    try:
+        return _OPERATOR_CODES[op]
+    except KeyError:
+        raise ValueError(f"Unknown operator {op!r}, expected one of {OPERATORS}") from None
+
+
+class ASTArena:
+    """An AST stored as parallel typed arrays instead of one object per node.
+
+    Node i has kind `kinds[i]` (an index into NODE_CLASSES), line `lines[i]`,
+    operator `ops[i]`, literal, type name or identifier symbol ID
+    `constants[values[i]]` and its child
+    block at `children[child_start[i]:]`, laid out as described by SCHEMA.
+    Children are node indexes and NONE stands for None. Equal constants are
+    stored once.
+
+    view() returns node objects backed by the arena, so ObfuscationPass
+    subclasses and CodeGenerator run over it unchanged. Assigning a node
+    that lives elsewhere copies it in. Resizing a list moves the node's
+    child block to the end of `children`; the old block and any detached
+    nodes stay behind until compact().
+    """
+
+    def __init__(self):
+        self.kinds = array('B')
+        self.lines = array('i')
+        self.ops = array('b')
+        self.values = array('i')
+        self.child_start = array('i')
+        self.children = array('i')
+        self.constants = []
+        self._constant_index = {}
+        self._views = {}
+        self.root = NONE
+
+    @classmethod
+    def from_tree(cls, program):
+        arena = cls()
+        arena.root = arena.add(program)
+        return arena
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def nbytes(self):
+        return sum(a.itemsize * len(a) for a in (self.kinds, self.lines, self.ops, self.values,
+                                                  self.child_start, self.children))
+
+    def copy(self):
+        other = ASTArena()
+        for name in ("kinds", "lines", "ops", "values", "child_start", "children"):
+            setattr(other, name, array(getattr(self, name).typecode, getattr(self, name)))
+        other.constants = list(self.constants)
+        other._constant_index = dict(self._constant_index)
+        other.root = self.root
+        return other
+
+    def compact(self):
+        return ASTArena.from_tree(self.to_tree())
+
+    def _constant(self, value):
+        # Keyed by type too, so True and 1 stay distinct.
+        key = (type(value), value)
+        index = self._constant_index.get(key)
+        if index is None:
+            index = self._constant_index[key] = len(self.constants)
+            self.constants.append(value)
+        return index
+
+    def add(self, node):
+        """Copy `node` and its subtree into the arena and return its index."""
+        root = NONE
+        # (node, offset in `children` that takes its index, or None for the root) still to copy, on an
+        # explicit stack so deep trees do not hit the recursion limit.
+        pending = [(node, None)]
+        while pending:
+            node, offset = pending.pop()
+            index = self._add_node(node, pending)
+            if offset is None:
+                root = index
+            else:
+                self.children[offset] = index
+        return root
+
+    def _add_node(self, node, pending):
+        """Copy `node` into the arena with an empty child block, push its children on `pending` and return its index."""
+        if node is None:
+            return NONE
+        if isinstance(node, ArenaNodeView):
+            if node._arena is self:
+                return node._index
+            node = node._arena.to_tree(node._index)
+        cls = type(node)
+        kind = _KINDS.get(cls)
+        if kind is None:
+            raise TypeError(f"{cls.__name__} cannot be stored in an ASTArena")
+
+        index = len(self.kinds)
+        self.kinds.append(kind)
+        self.lines.append(NONE if node.line_no is None else node.line_no)
+        self.ops.append(NONE)
+        self.values.append(NONE)
+        self.child_start.append(len(self.children))
+
+        child_fields = []
+        for field, slot in SCHEMA[NODE_CLASSES[kind]]:
+            value = getattr(node, field)
+            if slot == "value":
+                self.values[index] = self._constant(value)
+            elif slot == "op":
+                self.ops[index] = _operator_code(value)
+            else:
+                child_fields.append(value)
+        # Reserve the block first; the children's own blocks go after it.
+        self._write_block(index, [NONE if value is None else [NONE] * len(value) if isinstance(value, list)
+                                  else NONE for value in child_fields])
+        children = []
+        for position, value in enumerate(child_fields):
+            if isinstance(value, list):
+                offset = self._child_offset(index, position) + 1
+                children.extend((item, offset + i) for i, item in enumerate(value))
+            elif value is not None:
+                children.append((value, self._child_offset(index, position)))
+        # Reversed, so the children are copied in order, each before the next one's subtree.
+        pending.extend(reversed(children))
+        return index
+
+    def _child_offset(self, index, position):
+        offset = self.child_start[index]
+        layout = _CHILD_LAYOUTS[self.kinds[index]]
+        children = self.children
+        for slot in layout[:position]:
+            offset += 1 if slot == "node" else 1 + max(children[offset], 0)
+        return offset
+
+    def _read_block(self, index):
+        entries = []
+        offset = self.child_start[index]
+        children = self.children
+        for slot in _CHILD_LAYOUTS[self.kinds[index]]:
+            if slot == "node":
+                entries.append(children[offset])
+                offset += 1
+            else:
+                count = children[offset]
+                entries.append(None if count == NONE else list(children[offset + 1:offset + 1 + count]))
+                offset += 1 + max(count, 0)
+        return entries, offset - self.child_start[index]
+
+    def _write_block(self, index, entries, old_size=None):
+        block = []
+        for entry in entries:
+            if entry is None:
+                block.append(NONE)
+            elif isinstance(entry, list):
+                block.append(len(entry))
+                block.extend(entry)
+            else:
+                block.append(entry)
+        if len(block) == old_size:
+            start = self.child_start[index]
+            self.children[start:start + old_size] = array('i', block)
+        else:
+            self.child_start[index] = len(self.children)
+            self.children.extend(block)
+
+    def _node_at(self, index):
+        return None if index == NONE else self.view(index)
+
+    def _get_child(self, index, position):
+        offset = self._child_offset(index, position)
+        if _CHILD_LAYOUTS[self.kinds[index]][position] == "node":
+            return self._node_at(self.children[offset])
+        return None if self.children[offset] == NONE else ArenaList(self, index, position)
+
+    def _set_child(self, index, position, value):
+        if _CHILD_LAYOUTS[self.kinds[index]][position] == "node":
+            child = self.add(value)
+            self.children[self._child_offset(index, position)] = child
+            return
+        items = None if value is None else [self.add(item) for item in value]
+        entries, size = self._read_block(index)
+        entries[position] = items
+        self._write_block(index, entries, size)
+
+    def view(self, index=None):
+        """Return the node object backed by node `index` (the root by default)."""
+        if index is None:
+            index = self.root
+        view = self._views.get(index)
+        if view is None:
+            view = object.__new__(_VIEW_CLASSES[self.kinds[index]])
+            view._arena = self
+            view._index = index
+            self._views[index] = view
+        return view
+
+    def to_tree(self, index=None):
+        """Rebuild an ast_nodes object tree from node `index` (the root by default)."""
+        if index is None:
+            index = self.root
+        result = [None]
+        # (node index, list or node to put its object in, list index or field name) still to rebuild.
+        pending = [(index, result, 0)]
+        while pending:
+            index, target, key = pending.pop()
+            node = None
+            if index != NONE:
+                cls = NODE_CLASSES[self.kinds[index]]
+                node = object.__new__(cls)
+                line = self.lines[index]
+                node.line_no = None if line == NONE else line
+                entries = iter(self._read_block(index)[0])
+                for field, slot in SCHEMA[cls]:
+                    if slot == "value":
+                        setattr(node, field, self.constants[self.values[index]])
+                    elif slot == "op":
+                        code = self.ops[index]
+                        setattr(node, field, None if code == NONE else OPERATORS[code])
+                    else:
+                        entry = next(entries)
+                        if isinstance(entry, list):
+                            items = [None] * len(entry)
+                            setattr(node, field, items)
+                            pending.extend((child, items, i) for i, child in enumerate(entry))
+                        else:
+                            setattr(node, field, None)
+                            if entry is not None:
+                                pending.append((entry, node, field))
+            if isinstance(target, list):
+                target[key] = node
+            else:
+                setattr(target, key, node)
+        return result[0]
+
+    def kind_histogram(self):
+        """Count nodes by class name, including nodes detached since the last compact()."""
+        return {NODE_CLASSES[kind].__name__: count for kind, count in Counter(self.kinds).items()}
+
+    def indexes_of(self, node_class):
+        kind = _KINDS[node_class]
+        return [i for i, k in enumerate(self.kinds) if k == kind]
+
+    def map_values(self, node_class, func):
+        """Replace the value/name of every `node_class` node with func(old); returns how many changed."""
+        changed = 0
+        for i in self.indexes_of(node_class):
+            old = self.constants[self.values[i]]
+            new = func(old)
+            if new is not old:
+                self.values[i] = self._constant(new)
+                changed += 1
+        return changed
@@ -0,0 +1,302 @@
+import mmap
+import os
+import tempfile
+from collections.abc import MutableSequence
+
+import ast_nodes as ast
+
+MAGIC = b"MCAST"
+FORMAT_VERSION = 1
+
+# Value tags. A tag of _FIRST_KIND + k starts a node of kind k in the file's
+# kind table; its line follows (0 for None, otherwise zigzag(line) + 1) and
+# then one value per field of the class, in _fields order.
+_NONE, _LIST, _INT, _STR, _TRUE, _FALSE = range(6)
+_FIRST_KIND = 6
+
+# What follows the string table: one value, or a ProgramNode whose function
+# definitions are length-prefixed so they can be decoded one at a time.
+_ROOT_VALUE, _ROOT_PROGRAM = 0, 1
+
+NODE_CLASSES = tuple(ast.Node.__subclasses__())
+# By name, which shared leaves and ast_arena views have in common with their class.
+_KINDS_BY_NAME = {cls.__name__: kind for kind, cls in enumerate(NODE_CLASSES)}
+_CLASSES_BY_NAME = {cls.__name__: cls for cls in NODE_CLASSES}
+
+
+class ASTFormatError(ValueError):
+    """Raised when bytes are not an AST written by this version of ast_binary."""
+
+
+def _write_varint(out, value):
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _zigzag(value):
+    return value << 1 if value >= 0 else ((-value) << 1) - 1
+
+
+def _unzigzag(value):
+    return value >> 1 if not value & 1 else -((value + 1) >> 1)
+
+
+class _Encoder:
+    def __init__(self):
+        self.strings = {}
+
+    def string(self, text):
+        index = self.strings.get(text)
+        if index is None:
+            index = self.strings[text] = len(self.strings)
+        return index
+
+    def value(self, out, value):
+        # The values still to write, on an explicit stack so deep trees do not hit the recursion limit.
+        pending = [value]
+        while pending:
+            value = pending.pop()
+            if value is None:
+                out.append(_NONE)
+            elif value is True:
+                out.append(_TRUE)
+            elif value is False:
+                out.append(_FALSE)
+            elif isinstance(value, ast.Node):
+                kind = _KINDS_BY_NAME[type(value).__name__]
+                _write_varint(out, _FIRST_KIND + kind)
+                line = value.line_no
+                _write_varint(out, 0 if line is None else _zigzag(line) + 1)
+                pending.extend([getattr(value, field) for field in reversed(NODE_CLASSES[kind]._fields)])
+            elif isinstance(value, str):
+                out.append(_STR)
+                _write_varint(out, self.string(value))
+            elif isinstance(value, int):
+                out.append(_INT)
+                _write_varint(out, _zigzag(value))
+            elif isinstance(value, MutableSequence):
+                out.append(_LIST)
+                _write_varint(out, len(value))
+                pending.extend(reversed(value))
+            else:
+                raise TypeError(f"Cannot serialize {type(value).__name__} in an AST")
+
+
+def dumps(node):
+    """Serialize an ast_nodes tree (usually a ProgramNode) to bytes."""
+    encoder = _Encoder()
+    body = bytearray()
+    if isinstance(node, ast.ProgramNode) and isinstance(node.declarations, MutableSequence):
+        root = _ROOT_PROGRAM
+        _write_varint(body, 0 if node.line_no is None else _zigzag(node.line_no) + 1)
+        _write_varint(body, len(node.declarations))
+        for declaration in node.declarations:
+            encoded = bytearray()
+            encoder.value(encoded, declaration)
+            _write_varint(body, len(encoded))
+            body += encoded
+    else:
+        root = _ROOT_VALUE
+        encoder.value(body, node)
+
+    out = bytearray(MAGIC)
+    out.append(FORMAT_VERSION)
+    out.append(root)
+    for table in ([cls.__name__ for cls in NODE_CLASSES], encoder.strings):
+        _write_varint(out, len(table))
+        for text in table:
+            encoded = text.encode('utf-8')
+            _write_varint(out, len(encoded))
+            out += encoded
+    out += body
+    return bytes(out)
+
+
+class _Decoder:
+    def __init__(self, buffer):
+        self.buffer = buffer
+        if bytes(buffer[:len(MAGIC)]) != MAGIC:
+            raise ASTFormatError("not a binary AST")
+        if len(buffer) < len(MAGIC) + 2 or buffer[len(MAGIC)] != FORMAT_VERSION:
+            raise ASTFormatError(f"unsupported binary AST version, expected {FORMAT_VERSION}")
+        self.root = buffer[len(MAGIC) + 1]
+        pos = len(MAGIC) + 2
+        kind_names, pos = self.string_table(pos)
+        try:
+            self.classes = [_CLASSES_BY_NAME[name] for name in kind_names]
+        except KeyError as e:
+            raise ASTFormatError(f"unknown node kind {e.args[0]!r}") from None
+        self.strings, self.body_start = self.string_table(pos)
+
+    def varint(self, pos):
+        buffer = self.buffer
+        result = 0
+        shift = 0
+        while True:
+            byte = buffer[pos]
+            pos += 1
+            result |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                return result, pos
+            shift += 7
+
+    def string_table(self, pos):
+        count, pos = self.varint(pos)
+        strings = []
+        for _ in range(count):
+            length, pos = self.varint(pos)
+            strings.append(str(self.buffer[pos:pos + length], 'utf-8'))
+            pos += length
+        return strings, pos
+
+    def value(self, pos):
+        buffer = self.buffer
+        result = []
+        # The nodes and lists being filled in, as [node or list, its field names (None for a list), values
+        # left to read], on an explicit stack so deep trees do not hit the recursion limit.
+        stack = [[result, None, 1]]
+        while stack:
+            frame = stack[-1]
+            if not frame[2]:
+                stack.pop()
+                continue
+            frame[2] -= 1
+            tag = buffer[pos]
+            pos += 1
+            if tag & 0x80:
+                tag, pos = self.varint(pos - 1)
+            filled = None
+            if tag >= _FIRST_KIND:
+                cls = self.classes[tag - _FIRST_KIND]
+                line = buffer[pos]
+                pos += 1
+                if line & 0x80:
+                    line, pos = self.varint(pos - 1)
+                value = object.__new__(cls)
+                value.line_no = None if line == 0 else _unzigzag(line - 1)
+                filled = [value, cls._fields, len(cls._fields)]
+            elif tag == _STR:
+                index, pos = self.varint(pos)
+                value = self.strings[index]
+            elif tag == _LIST:
+                count, pos = self.varint(pos)
+                value = []
+                filled = [value, None, count]
+            elif tag == _INT:
+                value, pos = self.varint(pos)
+                value = _unzigzag(value)
+            elif tag == _NONE:
+                value = None
+            elif tag == _TRUE:
+                value = True
+            elif tag == _FALSE:
+                value = False
+            else:
+                raise ASTFormatError(f"bad value tag {tag} at offset {pos - 1}")
+            target, fields, left = frame
+            if fields is None:
+                target.append(value)
+            else:
+                setattr(target, fields[len(fields) - left - 1], value)
+            if filled is not None and filled[2]:
+                stack.append(filled)
+        return result[0], pos
+
+
+class LazyDeclarations(MutableSequence):
+    """ProgramNode.declarations that decodes each function definition on first access."""
+
+    _UNDECODED = object()
+
+    def __init__(self, decoder, spans):
+        self._decoder = decoder
+        self._spans = spans
+        self._items = [self._UNDECODED] * len(spans)
+
+    def decoded_count(self):
+        return sum(item is not self._UNDECODED for item in self._items)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        item = self._items[i]
+        if item is self._UNDECODED:
+            start, end = self._spans[i]
+            try:
+                item, pos = self._decoder.value(start)
+            except IndexError:
+                # Not passed on as IndexError, which would quietly end iteration.
+                raise ASTFormatError("truncated or corrupt binary AST") from None
+            if pos != end:
+                raise ASTFormatError(f"function definition {i} ends at offset {pos}, expected {end}")
+            self._items[i] = item
+        return item
+
+    def __setitem__(self, i, value):
+        if isinstance(i, slice):
+            items = list(self)
+            items[i] = value
+            self._spans = [None] * len(items)
+            self._items = items
+            return
+        self._items[i] = value
+
+    def __delitem__(self, i):
+        del self._spans[i]
+        del self._items[i]
+
+    def insert(self, i, value):
+        self._spans.insert(i, None)
+        self._items.insert(i, value)
+
+
+def loads(data, lazy=True):
+    """Rebuild the tree dumps() wrote from bytes, a memoryview or an mmap.
+
+    With lazy=True a ProgramNode's declarations are a LazyDeclarations that
+    keeps a reference to `data` and decodes each function when it is first
+    used; otherwise everything is decoded now.
+    """
+    try:
+        decoder = _Decoder(memoryview(data))
+        if decoder.root == _ROOT_PROGRAM:
+            line, pos = decoder.varint(decoder.body_start)
+            count, pos = decoder.varint(pos)
+            spans = []
+            for _ in range(count):
+                length, pos = decoder.varint(pos)
+                spans.append((pos, pos + length))
+                pos += length
+            if pos > len(decoder.buffer):
+                raise ASTFormatError("truncated or corrupt binary AST")
+            declarations = LazyDeclarations(decoder, spans)
+            if not lazy:
+                declarations = list(declarations)
+            return ast.ProgramNode(declarations, line_no=None if line == 0 else _unzigzag(line - 1))
+        value, _ = decoder.value(decoder.body_start)
+        return value
+    except (IndexError, UnicodeDecodeError):
+        raise ASTFormatError("truncated or corrupt binary AST") from None
+
+
+def save(node, path):
+    data = dumps(node)
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temporary_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.replace(temporary_path, path)
+
+
+def load(path, lazy=True):
+    """loads() from a memory-mapped file; lazily decoded functions read straight from the mapping."""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise ASTFormatError(f"'{path}' is empty")
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return loads(mapped, lazy=lazy)
@@ -0,0 +1,211 @@
+import logging
+
+from antlr4 import ParseTreeListener, Token
+
+if __name__ is not None and "." in __name__:
+
+    from .generated_parser.MiniCParser import MiniCParser
+else:
+
+    from generated_parser.MiniCParser import MiniCParser
+
+import ast_nodes as custom_ast
+from native_frontend import decode_char_literal, decode_string_literal
+
+logger = logging.getLogger(__name__)
+
+
+class ASTBuilderListener(ParseTreeListener):
+    """Builds the custom AST from parse events while the parser runs.
+
+    Register it with parser.addParseListener() and set parser.buildParseTrees
+    to False: every rule's tokens and finished sub-results are collected in a
+    frame that is turned into AST nodes as soon as the rule exits, so no parse
+    tree is kept. The result matches what ASTBuilderVisitor builds.
+
+    It deliberately extends ParseTreeListener rather than MiniCListener so the
+    parser does not make a no-op enterX/exitX call per rule on top of the
+    generic events used here.
+    """
+
+    def __init__(self, leaves=None):
+        self.leaves = leaves or custom_ast.LeafFactory()
+        self.frames = [[]]
+        self.program = None
+        self.builders = {
+            MiniCParser.RULE_program: self._build_program,
+            MiniCParser.RULE_declaration: self._first_item,
+            MiniCParser.RULE_functionDefinition: self._build_function_definition,
+            MiniCParser.RULE_typeSpecifier: self._build_type_specifier,
+            MiniCParser.RULE_parameters: self._non_token_items,
+            MiniCParser.RULE_parameter: self._build_parameter,
+            MiniCParser.RULE_blockContent: self._all_items,
+            MiniCParser.RULE_statement: self._build_statement,
+            MiniCParser.RULE_variableDeclaration: self._build_variable_declaration,
+            MiniCParser.RULE_ifStatement: self._build_if_statement,
+            MiniCParser.RULE_whileStatement: self._build_while_statement,
+            MiniCParser.RULE_forStatement: self._build_for_statement,
+            MiniCParser.RULE_forInitializer: self._first_item,
+            MiniCParser.RULE_returnStatement: self._build_return_statement,
+            MiniCParser.RULE_expression: self._first_item,
+            MiniCParser.RULE_assignmentExpression: self._build_assignment_expression,
+            MiniCParser.RULE_logicalOrExpression: self._build_binary_expression,
+            MiniCParser.RULE_logicalAndExpression: self._build_binary_expression,
+            MiniCParser.RULE_equalityExpression: self._build_binary_expression,
+            MiniCParser.RULE_relationalExpression: self._build_binary_expression,
+            MiniCParser.RULE_additiveExpression: self._build_binary_expression,
+            MiniCParser.RULE_multiplicativeExpression: self._build_binary_expression,
+            MiniCParser.RULE_unaryExpression: self._build_unary_expression,
+            MiniCParser.RULE_primaryExpression: self._build_primary_expression,
+            MiniCParser.RULE_functionCall: self._build_function_call,
+            MiniCParser.RULE_argumentList: self._non_token_items,
+            MiniCParser.RULE_literal: self._build_literal,
+        }
+
+    def reset(self):
+        self.frames = [[]]
+        self.program = None
+
+    def enterEveryRule(self, ctx):
+        self.frames.append([])
+
+    def exitEveryRule(self, ctx):
+        items = self.frames.pop()
+        try:
+            result = self.builders[ctx.getRuleIndex()](ctx, items)
+        except (IndexError, AttributeError, TypeError):
+            # Only happens while the parser recovers from a syntax error, which
+            # the error listeners already report.
+            result = None
+        self.frames[-1].append(result)
+        if len(self.frames) == 1:
+            self.program = result
+
+    def visitTerminal(self, node):
+        self.frames[-1].append(node.symbol)
+
+    def visitErrorNode(self, node):
+        self.frames[-1].append(node.symbol)
+
+    def _first_item(self, ctx, items):
+        return items[0]
+
+    def _all_items(self, ctx, items):
+        return items
+
+    def _non_token_items(self, ctx, items):
+        return [item for item in items if not isinstance(item, Token)]
+
+    def _build_program(self, ctx, items):
+        declarations = [item for item in items if item is not None and not isinstance(item, Token)]
+        return custom_ast.ProgramNode(declarations, line_no=ctx.start.line)
+
+    def _build_function_definition(self, ctx, items):
+        # typeSpecifier ID LPAREN parameters? RPAREN LBRACE blockContent RBRACE
+        name_token = items[1]
+        func_name_node = custom_ast.IdentifierNode(name_token.text, line_no=name_token.line)
+        param_nodes = items[3] if isinstance(items[3], list) else []
+        lbrace_token = items[-3]
+        body_block_node = custom_ast.BlockNode(items[-2], line_no=lbrace_token.line)
+        return custom_ast.FunctionDefNode(items[0], func_name_node, param_nodes, body_block_node,
+                                          line_no=ctx.start.line)
+
+    def _build_type_specifier(self, ctx, items):
+        token = items[0]
+        return self.leaves.type_node(token.text, line_no=token.line)
+
+    def _build_parameter(self, ctx, items):
+        name_token = items[1]
+        param_name_node = custom_ast.IdentifierNode(name_token.text, line_no=name_token.line)
+        return custom_ast.ParamNode(items[0], param_name_node, line_no=ctx.start.line)
+
+    def _build_statement(self, ctx, items):
+        first = items[0]
+        if isinstance(first, Token):
+            # LBRACE blockContent RBRACE
+            return custom_ast.BlockNode(items[1], line_no=first.line)
+        if len(items) == 1 or isinstance(first, (custom_ast.VarDeclNode, custom_ast.ReturnNode)):
+            return first
+        return custom_ast.ExprStatementNode(first, line_no=ctx.start.line)
+
+    def _build_variable_declaration(self, ctx, items):
+        name_token = items[1]
+        var_name_node = custom_ast.IdentifierNode(name_token.text, line_no=name_token.line)
+        initializer_node = items[3] if len(items) > 3 else None
+        return custom_ast.VarDeclNode(items[0], var_name_node, initializer_node, line_no=ctx.start.line)
+
+    def _build_if_statement(self, ctx, items):
+        # IF LPAREN expression RPAREN statement (ELSE statement)?
+        else_stmt_node = items[6] if len(items) > 6 else None
+        return custom_ast.IfNode(items[2], items[4], else_stmt_node, line_no=ctx.start.line)
+
+    def _build_while_statement(self, ctx, items):
+        return custom_ast.WhileNode(items[2], items[4], line_no=ctx.start.line)
+
+    def _build_for_statement(self, ctx, items):
+        # FOR LPAREN forInitializer? SEMICOLON expression? SEMICOLON expression? RPAREN statement
+        header = [None, None, None]
+        section = 0
+        for item in items[2:-2]:
+            if isinstance(item, Token):
+                section += 1
+            else:
+                header[section] = item
+        return custom_ast.ForNode(header[0], header[1], header[2], items[-1], line_no=ctx.start.line)
+
+    def _build_return_statement(self, ctx, items):
+        expr_node = items[1] if len(items) > 1 else None
+        return custom_ast.ReturnNode(expr_node, line_no=ctx.start.line)
+
+    def _build_assignment_expression(self, ctx, items):
+        left_expr = items[0]
+        if len(items) == 1:
+            return left_expr
+
+        if not isinstance(left_expr, custom_ast.IdentifierNode):
+            logger.warning("Line %s: LHS of assignment is not a simple Identifier. AST structure "
+                           "for AssignmentNode might be problematic.", ctx.start.line)
+        return custom_ast.AssignmentNode(left_expr, items[2], line_no=items[1].line)
+
+    def _build_binary_expression(self, ctx, items):
+        left_operand = items[0]
+        for i in range(1, len(items), 2):
+            op_token = items[i]
+            left_operand = custom_ast.BinaryOpNode(left_operand, op_token.text, items[i + 1], line_no=op_token.line)
+        return left_operand
+
+    def _build_unary_expression(self, ctx, items):
+        if len(items) == 1:
+            return items[0]
+        op_token = items[0]
+        return custom_ast.UnaryOpNode(op_token.text, items[1], line_no=op_token.line)
+
+    def _build_primary_expression(self, ctx, items):
+        if len(items) == 3:
+            # LPAREN expression RPAREN
+            return items[1]
+        item = items[0]
+        if isinstance(item, Token):
+            return custom_ast.IdentifierNode(item.text, line_no=item.line)
+        return item
+
+    def _build_function_call(self, ctx, items):
+        name_token = items[0]
+        func_name_node = custom_ast.IdentifierNode(name_token.text, line_no=name_token.line)
+        arg_nodes = items[2] if isinstance(items[2], list) else []
+        return custom_ast.FunctionCallNode(func_name_node, arg_nodes, line_no=ctx.start.line)
+
+    def _build_literal(self, ctx, items):
+        token = items[0]
+        token_type = token.type
+        if token_type == MiniCParser.NUMBER:
+            return self.leaves.number(int(token.text), line_no=token.line)
+        elif token_type == MiniCParser.CHAR_LITERAL:
+            return self.leaves.char(decode_char_literal(token.text), line_no=token.line)
+        elif token_type == MiniCParser.STRING_LITERAL:
+            return custom_ast.StringLiteralNode(decode_string_literal(token.text), line_no=token.line)
+        elif token_type == MiniCParser.TRUE:
+            return self.leaves.boolean(True, line_no=token.line)
+        elif token_type == MiniCParser.FALSE:
+            return self.leaves.boolean(False, line_no=token.line)
+        return None
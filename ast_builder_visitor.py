@@ -1,3 +1,5 @@
+import logging
+
 from antlr4 import *
 
 if __name__ is not None and "." in __name__:
@@ -11,9 +13,16 @@ else:
 
 import ast_nodes as custom_ast
 
+logger = logging.getLogger(__name__)
+
 
 class ASTBuilderVisitor(MiniCVisitor):
 
+    def __init__(self, leaves=None):
+        super().__init__()
+        # Where type and literal leaves come from; an ast_nodes.LeafPool shares them.
+        self.leaves = leaves or custom_ast.LeafFactory()
+
     def get_line_number(self, ctx_or_token):
         if hasattr(ctx_or_token, 'start'):
             return ctx_or_token.start.line
@@ -51,7 +60,7 @@ class ASTBuilderVisitor(MiniCVisitor):
 
     def visitTypeSpecifier(self, ctx: MiniCParser.TypeSpecifierContext):
         type_name = ctx.getText()
-        return custom_ast.TypeNode(type_name, line_no=self.get_line_number(ctx))
+        return self.leaves.type_node(type_name, line_no=self.get_line_number(ctx))
 
     def visitParameters(self, ctx: MiniCParser.ParametersContext):
         params = []
@@ -117,20 +126,16 @@ class ASTBuilderVisitor(MiniCVisitor):
         if ctx.forInitializer():
             init_node = self.visit(ctx.forInitializer())
 
-        expr_contexts = ctx.expression()
         condition_node = None
         update_node = None
 
-        if len(expr_contexts) == 1:
-            if ctx.forInitializer() or (not ctx.forInitializer() and ctx.getChild(3) == ctx.SEMICOLON(0)):
-
-                condition_node = self.visit(expr_contexts[0])
+        # The condition is whichever expression sits before the second ';'.
+        second_semicolon_index = ctx.SEMICOLON(1).symbol.tokenIndex
+        for expr_ctx in ctx.expression():
+            if expr_ctx.start.tokenIndex < second_semicolon_index:
+                condition_node = self.visit(expr_ctx)
             else:
-                update_node = self.visit(expr_contexts[0])
-
-        elif len(expr_contexts) == 2:
-            condition_node = self.visit(expr_contexts[0])
-            update_node = self.visit(expr_contexts[1])
+                update_node = self.visit(expr_ctx)
 
         body_stmt_node = self.visit(ctx.statement())
         return custom_ast.ForNode(init_node, condition_node, update_node, body_stmt_node,
@@ -158,9 +163,8 @@ class ASTBuilderVisitor(MiniCVisitor):
         if ctx.ASSIGN():
 
             if not isinstance(left_expr, custom_ast.IdentifierNode):
-                print(
-                    f"Warning: Line {self.get_line_number(ctx)}: LHS of assignment is not a simple Identifier. AST "
-                    f"structure for AssignmentNode might be problematic.")
+                logger.warning("Line %s: LHS of assignment is not a simple Identifier. AST structure "
+                               "for AssignmentNode might be problematic.", self.get_line_number(ctx))
 
             rvalue_node = self.visit(ctx.expression())
             return custom_ast.AssignmentNode(left_expr, rvalue_node, line_no=self.get_line_number(ctx.ASSIGN()))
@@ -265,7 +269,7 @@ class ASTBuilderVisitor(MiniCVisitor):
     def visitLiteral(self, ctx: MiniCParser.LiteralContext):
         line_num = self.get_line_number(ctx.getChild(0))
         if ctx.NUMBER():
-            return custom_ast.NumberLiteralNode(int(ctx.NUMBER().getText()), line_no=line_num)
+            return self.leaves.number(int(ctx.NUMBER().getText()), line_no=line_num)
         elif ctx.CHAR_LITERAL():
             text = ctx.CHAR_LITERAL().getText()
             val_str = text[1:-1]
@@ -281,7 +285,7 @@ class ASTBuilderVisitor(MiniCVisitor):
                 val = '\\'
             else:
                 val = val_str
-            return custom_ast.CharLiteralNode(val, line_no=line_num)
+            return self.leaves.char(val, line_no=line_num)
         elif ctx.STRING_LITERAL():
             text = ctx.STRING_LITERAL().getText()
             val_str = text[1:-1]
@@ -292,7 +296,84 @@ class ASTBuilderVisitor(MiniCVisitor):
                 val = val_str
             return custom_ast.StringLiteralNode(val, line_no=line_num)
         elif ctx.TRUE():
-            return custom_ast.BoolLiteralNode(True, line_no=line_num)
+            return self.leaves.boolean(True, line_no=line_num)
         elif ctx.FALSE():
-            return custom_ast.BoolLiteralNode(False, line_no=line_num)
+            return self.leaves.boolean(False, line_no=line_num)
         return None
+
+
+class FastASTBuilderVisitor(ASTBuilderVisitor):
+    """ASTBuilderVisitor with a fast path through the expression precedence chain.
+
+    Most expression contexts are pass-throughs with a single child and no
+    operator (a lone `x` is wrapped in nine of them), so the chain is skipped
+    down to the first context that actually has an operator, a literal or an
+    identifier. Operators are read straight from the odd child positions of a
+    binary context instead of scanning every child. The AST is identical to
+    the one ASTBuilderVisitor builds.
+    """
+
+    def _visit_expression_chain(self, ctx):
+        children = ctx.children
+        while len(children) == 1:
+            child = children[0]
+            if isinstance(child, TerminalNode):
+                # primaryExpression: ID
+                symbol = child.symbol
+                return custom_ast.IdentifierNode(symbol.text, line_no=symbol.line)
+            if isinstance(child, MiniCParser.LiteralContext):
+                return self.visitLiteral(child)
+            ctx = child
+            children = ctx.children
+        return ctx.accept(self)
+
+    def _build_binary_from_children(self, ctx):
+        children = ctx.children
+        left_operand = self._visit_expression_chain(children[0])
+        for i in range(1, len(children), 2):
+            op_token = children[i].symbol
+            right_operand = self._visit_expression_chain(children[i + 1])
+            left_operand = custom_ast.BinaryOpNode(left_operand, op_token.text, right_operand, line_no=op_token.line)
+        return left_operand
+
+    def visitExpression(self, ctx: MiniCParser.ExpressionContext):
+        return self._visit_expression_chain(ctx)
+
+    def visitAssignmentExpression(self, ctx: MiniCParser.AssignmentExpressionContext):
+        children = ctx.children
+        left_expr = self._visit_expression_chain(children[0])
+        if len(children) == 1:
+            return left_expr
+
+        if not isinstance(left_expr, custom_ast.IdentifierNode):
+            logger.warning("Line %s: LHS of assignment is not a simple Identifier. AST structure "
+                           "for AssignmentNode might be problematic.", self.get_line_number(ctx))
+
+        rvalue_node = self._visit_expression_chain(children[2])
+        return custom_ast.AssignmentNode(left_expr, rvalue_node, line_no=children[1].symbol.line)
+
+    visitLogicalOrExpression = _build_binary_from_children
+    visitLogicalAndExpression = _build_binary_from_children
+    visitEqualityExpression = _build_binary_from_children
+    visitRelationalExpression = _build_binary_from_children
+    visitAdditiveExpression = _build_binary_from_children
+    visitMultiplicativeExpression = _build_binary_from_children
+
+    def visitUnaryExpression(self, ctx: MiniCParser.UnaryExpressionContext):
+        children = ctx.children
+        if len(children) == 1:
+            return self._visit_expression_chain(ctx)
+        op_token = children[0].symbol
+        expr_node = self._visit_expression_chain(children[1])
+        return custom_ast.UnaryOpNode(op_token.text, expr_node, line_no=op_token.line)
+
+    def visitPrimaryExpression(self, ctx: MiniCParser.PrimaryExpressionContext):
+        children = ctx.children
+        if len(children) == 3:
+            # LPAREN expression RPAREN
+            return self._visit_expression_chain(children[1])
+        return self._visit_expression_chain(ctx)
+
+    def visitArgumentList(self, ctx: MiniCParser.ArgumentListContext):
+        children = ctx.children
+        return [self._visit_expression_chain(children[i]) for i in range(0, len(children), 2)]
@@ -0,0 +1,151 @@
+import hashlib
+import os
+import tempfile
+import zlib
+
+import ast_binary
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+CACHE_FORMAT_VERSION = 3
+ENTRY_SUFFIX = ".ast"
+
+# Anything that can change the AST built from the same source bytes.
+_FINGERPRINT_FILES = ("MiniC.g4", "ast_nodes.py", "ast_binary.py", "ast_builder_visitor.py", "ast_builder_listener.py",
+                      "native_frontend.py", "regex_lexer.py", "parallel_parse.py", "source_splitter.py", "streams.py",
+                      "symbols.py", "pipeline.py")
+
+_tool_fingerprint = None
+
+
+def tool_fingerprint():
+    global _tool_fingerprint
+    if _tool_fingerprint is None:
+        digest = hashlib.sha256(f"ast-cache-v{CACHE_FORMAT_VERSION}".encode())
+        here = os.path.dirname(os.path.abspath(__file__))
+        for file_name in _FINGERPRINT_FILES:
+            with open(os.path.join(here, file_name), 'rb') as f:
+                digest.update(f.read())
+        _tool_fingerprint = digest.digest()
+    return _tool_fingerprint
+
+
+def source_key(source_bytes):
+    digest = hashlib.sha256(tool_fingerprint())
+    digest.update(source_bytes)
+    return digest.hexdigest()
+
+
+def file_key(path, chunk_size=2 ** 20):
+    digest = hashlib.sha256(tool_fingerprint())
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ASTCache:
+    """Content-addressed on-disk cache of ProgramNode trees.
+
+    Entries are keyed by a hash of the source bytes and the grammar/AST
+    definitions, and stored as compressed ast_binary data under
+    <directory>/<key[:2]>/<key>.ast. Entries are written to a temporary file
+    and renamed into place, so concurrent readers never see a partial entry.
+    A hit refreshes the entry's mtime, and once the directory grows past
+    max_bytes the least recently used entries are evicted under an exclusive
+    lock file.
+    """
+
+    source_key = staticmethod(source_key)
+    file_key = staticmethod(file_key)
+
+    def __init__(self, directory, max_bytes=512 * 2 ** 20):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+        self._lock_path = os.path.join(directory, ".lock")
+        self._estimated_bytes = self._total_size()
+
+    def _entry_path(self, key):
+        return os.path.join(self.directory, key[:2], key + ENTRY_SUFFIX)
+
+    def _entries(self):
+        for dir_path, dir_names, file_names in os.walk(self.directory):
+            for file_name in file_names:
+                if file_name.endswith(ENTRY_SUFFIX):
+                    path = os.path.join(dir_path, file_name)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    yield path, stat.st_size, stat.st_mtime
+
+    def _total_size(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def get(self, key):
+        path = self._entry_path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            program = ast_binary.loads(zlib.decompress(data), lazy=False)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except (OSError, zlib.error, ast_binary.ASTFormatError):
+            # Unreadable or stale entry: drop it and rebuild.
+            self._remove(path)
+            self.misses += 1
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits += 1
+        return program
+
+    def put(self, key, program):
+        data = zlib.compress(ast_binary.dumps(program))
+        path = self._entry_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temporary_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temporary_path, path)
+        except OSError:
+            self._remove(temporary_path)
+            return
+        self._estimated_bytes += len(data)
+        if self._estimated_bytes > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        """Delete least recently used entries until the cache is below 90% of max_bytes."""
+        with open(self._lock_path, 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                entries = sorted(self._entries(), key=lambda entry: entry[2])
+                total = sum(size for _, size, _ in entries)
+                target = self.max_bytes * 0.9
+                for path, size, _ in entries:
+                    if total <= target:
+                        break
+                    self._remove(path)
+                    total -= size
+                self._estimated_bytes = total
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -1,27 +1,43 @@
+from symbols import SYMBOLS
+
+
 class Node:
-    """Base class for all AST nodes."""
+    """Base class for all AST nodes.
+
+    Nodes use __slots__ instead of a per-instance __dict__, so they cannot
+    carry ad-hoc attributes; passes keep scratch data in side tables keyed
+    by node. `_fields` lists each class's own attributes besides line_no,
+    and `_child_fields` the ones that hold child nodes or lists of them.
+    """
+    __slots__ = ("line_no",)
+    _fields = _child_fields = ()
 
     def __init__(self, line_no=None):
         self.line_no = line_no
 
 
 class ProgramNode(Node):
+    __slots__ = _fields = _child_fields = ("declarations",)
+
     def __init__(self, declarations, line_no=None):
         super().__init__(line_no)
         self.declarations = declarations
 
 
 class FunctionDefNode(Node):
+    __slots__ = _fields = _child_fields = ("return_type", "name", "params", "body")
+
     def __init__(self, return_type, name, params, body, line_no=None):
         super().__init__(line_no)
         self.return_type = return_type
         self.name = name
         self.params = params
         self.body = body
-        self.temp_local_scope_map = {}
 
 
 class ParamNode(Node):
+    __slots__ = _fields = _child_fields = ("param_type", "name")
+
     def __init__(self, param_type, name, line_no=None):
         super().__init__(line_no)
         self.param_type = param_type
@@ -29,18 +45,24 @@ class ParamNode(Node):
 
 
 class TypeNode(Node):
+    __slots__ = _fields = ("type_name",)
+
     def __init__(self, type_name, line_no=None):
         super().__init__(line_no)
         self.type_name = type_name
 
 
 class BlockNode(Node):
+    __slots__ = _fields = _child_fields = ("statements",)
+
     def __init__(self, statements, line_no=None):
         super().__init__(line_no)
         self.statements = statements
 
 
 class VarDeclNode(Node):
+    __slots__ = _fields = _child_fields = ("var_type", "name", "initializer")
+
     def __init__(self, var_type, name, initializer=None, line_no=None):
         super().__init__(line_no)
         self.var_type = var_type
@@ -49,6 +71,8 @@ class VarDeclNode(Node):
 
 
 class AssignmentNode(Node):
+    __slots__ = _fields = _child_fields = ("lvalue", "rvalue")
+
     def __init__(self, lvalue, rvalue, line_no=None):
         super().__init__(line_no)
         self.lvalue = lvalue
@@ -56,6 +80,8 @@ class AssignmentNode(Node):
 
 
 class IfNode(Node):
+    __slots__ = _fields = _child_fields = ("condition", "then_block", "else_block")
+
     def __init__(self, condition, then_block, else_block=None, line_no=None):
         super().__init__(line_no)
         self.condition = condition
@@ -64,6 +90,8 @@ class IfNode(Node):
 
 
 class WhileNode(Node):
+    __slots__ = _fields = _child_fields = ("condition", "body")
+
     def __init__(self, condition, body, line_no=None):
         super().__init__(line_no)
         self.condition = condition
@@ -71,6 +99,8 @@ class WhileNode(Node):
 
 
 class ForNode(Node):
+    __slots__ = _fields = _child_fields = ("init", "condition", "update", "body")
+
     def __init__(self, init, condition, update, body, line_no=None):
         super().__init__(line_no)
         self.init = init
@@ -80,12 +110,16 @@ class ForNode(Node):
 
 
 class ReturnNode(Node):
+    __slots__ = _fields = _child_fields = ("expr",)
+
     def __init__(self, expr=None, line_no=None):
         super().__init__(line_no)
         self.expr = expr
 
 
 class FunctionCallNode(Node):
+    __slots__ = _fields = _child_fields = ("name", "args")
+
     def __init__(self, name, args, line_no=None):
         super().__init__(line_no)
         self.name = name
@@ -93,13 +127,17 @@ class FunctionCallNode(Node):
 
 
 class ExprStatementNode(Node):
+    __slots__ = _fields = _child_fields = ("expr",)
+
     def __init__(self, expr, line_no=None):
         super().__init__(line_no)
         self.expr = expr
 
 
-
 class BinaryOpNode(Node):
+    __slots__ = _fields = ("left", "op", "right")
+    _child_fields = ("left", "right")
+
     def __init__(self, left, op, right, line_no=None):
         super().__init__(line_no)
         self.left = left
@@ -108,6 +146,9 @@ class BinaryOpNode(Node):
 
 
 class UnaryOpNode(Node):
+    __slots__ = _fields = ("op", "expr")
+    _child_fields = ("expr",)
+
     def __init__(self, op, expr, line_no=None):
         super().__init__(line_no)
         self.op = op
@@ -115,30 +156,187 @@ class UnaryOpNode(Node):
 
 
 class IdentifierNode(Node):
+    """`name` is interned in symbols.SYMBOLS; the node only keeps its symbol_id."""
+    __slots__ = ("symbol_id",)
+    _fields = ("name",)
+
     def __init__(self, name, line_no=None):
         super().__init__(line_no)
-        self.name = name
+        self.symbol_id = SYMBOLS.intern(name)
+
+    @property
+    def name(self):
+        return SYMBOLS.names[self.symbol_id]
+
+    @name.setter
+    def name(self, name):
+        self.symbol_id = SYMBOLS.intern(name)
+
+    def __getstate__(self):
+        return self.line_no, self.name
+
+    def __setstate__(self, state):
+        self.line_no, self.name = state
 
 
 class NumberLiteralNode(Node):
+    __slots__ = _fields = ("value",)
+
     def __init__(self, value, line_no=None):
         super().__init__(line_no)
         self.value = value
 
 
 class CharLiteralNode(Node):
+    __slots__ = _fields = ("value",)
+
     def __init__(self, value, line_no=None):
         super().__init__(line_no)
         self.value = value
 
 
 class StringLiteralNode(Node):
+    __slots__ = _fields = ("value",)
+
     def __init__(self, value, line_no=None):
         super().__init__(line_no)
         self.value = value
 
 
 class BoolLiteralNode(Node):
+    __slots__ = _fields = ("value",)
+
     def __init__(self, value, line_no=None):
         super().__init__(line_no)
-        self.value = value
\ No newline at end of file
+        self.value = value
+
+
+_NODE_CLASSES = frozenset(Node.__subclasses__())
+
+
+class DispatchTable(dict):
+    """Maps node classes to a visitor class's <prefix><class name in lower case> function.
+
+    Built once per visitor class, so visiting a node is one dict lookup.
+    Node classes not seen yet (ast_arena views, shared leaves) are resolved
+    by name on first use; nodes without a method get `fallback`.
+    """
+
+    def __init__(self, visitor_class, fallback, prefix='visit_'):
+        super().__init__()
+        self.visitor_class = visitor_class
+        self.fallback = fallback
+        self.prefix = prefix
+        for node_class in _NODE_CLASSES:
+            self.__missing__(node_class)
+
+    def __missing__(self, node_class):
+        method = self[node_class] = getattr(self.visitor_class, self.prefix + node_class.__name__.lower(),
+                                            self.fallback)
+        return method
+
+
+class LeafFactory:
+    """Makes the leaf nodes that AST builders and passes create; a fresh node every time."""
+    type_node = TypeNode
+    number = NumberLiteralNode
+    char = CharLiteralNode
+    boolean = BoolLiteralNode
+
+
+class SharedNodeError(TypeError):
+    """Raised when something tries to modify a leaf shared through a LeafPool."""
+
+
+def _refuse_shared_setattr(self, name, value):
+    raise SharedNodeError(f"This {type(self).__name__} is shared through a LeafPool and cannot be modified; "
+                          f"replace it with unshare(node) first")
+
+
+def _make_shared_leaf_class(cls):
+    # Same name as `cls`, so visit_<name> dispatch is unchanged. Pickling or
+    # copying one gives an ordinary, unshared node.
+    field, = cls._fields
+    return type(cls.__name__, (cls,), {
+        "__slots__": (),
+        "__setattr__": _refuse_shared_setattr,
+        "__reduce__": lambda self: (cls, (getattr(self, field),)),
+    })
+
+
+SHARED_LEAF_CLASSES = {cls: _make_shared_leaf_class(cls)
+                       for cls in (TypeNode, NumberLiteralNode, CharLiteralNode, BoolLiteralNode)}
+_SHARED_LEAF_BASES = {shared: cls for cls, shared in SHARED_LEAF_CLASSES.items()}
+
+
+def unshare(node):
+    """Return `node`, or a private copy that can be modified if it is a shared leaf."""
+    cls = _SHARED_LEAF_BASES.get(type(node))
+    if cls is None:
+        return node
+    field, = cls._fields
+    return cls(getattr(node, field))
+
+
+class LeafPool(LeafFactory):
+    """A LeafFactory that hash-conses immutable leaves.
+
+    Types, booleans, integers in SHARED_INTS and ASCII characters get one
+    shared node per value; other literals are allocated as usual. Shared
+    leaves have no line_no and raise SharedNodeError when modified, so code
+    that changes a leaf must put unshare(leaf) in its place first
+    (ObfuscationPass.update() does).
+    """
+    SHARED_INTS = range(-128, 1024)
+
+    def __init__(self):
+        self._table = {}
+
+    def _shared(self, cls, value):
+        node = self._table.get((cls, value))
+        if node is None:
+            node = object.__new__(SHARED_LEAF_CLASSES[cls])
+            Node.line_no.__set__(node, None)
+            getattr(cls, cls._fields[0]).__set__(node, value)
+            self._table[(cls, value)] = node
+        return node
+
+    def type_node(self, type_name, line_no=None):
+        return self._shared(TypeNode, type_name)
+
+    def number(self, value, line_no=None):
+        if value in self.SHARED_INTS:
+            return self._shared(NumberLiteralNode, value)
+        return NumberLiteralNode(value, line_no)
+
+    def char(self, value, line_no=None):
+        if len(value) == 1 and value < "\x80":
+            return self._shared(CharLiteralNode, value)
+        return CharLiteralNode(value, line_no)
+
+    def boolean(self, value, line_no=None):
+        return self._shared(BoolLiteralNode, value)
+
+
+def replace(node, **changes):
+    """Return a shallow copy of `node` with `changes` applied, or `node` itself if they change nothing.
+
+    Used by passes in persistent mode, so an edited tree shares every
+    unchanged subtree with the original. Shared leaves and ast_arena views
+    are copied as their ordinary class.
+    """
+    for field, value in changes.items():
+        current = getattr(node, field)
+        if value is not current and value != current:
+            break
+    else:
+        return node
+    # The plain class, also for ast_arena views and shared leaves.
+    cls = next(c for c in type(node).__mro__ if c in _NODE_CLASSES)
+    copy = object.__new__(cls)
+    copy.line_no = node.line_no
+    for slot in cls.__slots__:
+        setattr(copy, slot, getattr(node, slot))
+    for field, value in changes.items():
+        setattr(copy, field, value)
+    return copy
@@ -0,0 +1,243 @@
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import sys
+
+from ast_cache import ASTCache
+from tracing import Tracer
+from pipeline import AST_BACKENDS, FRONTENDS, INPUT_MODES, LEXER_MODES, PARSE_MODES, Pipeline, PipelineError
+
+SOURCE_SUFFIX = ".mc"
+
+_worker_pipeline = None
+
+
+def _has_magic(pattern):
+    return any(ch in pattern for ch in "*?[")
+
+
+def collect_jobs(sources, output_dir):
+    """Expand files, directories and glob patterns into (input, output) pairs.
+
+    Each source contributes paths relative to its own root (the directory
+    itself, the non-wildcard prefix of a glob, or a file's parent), and
+    those relative paths are mirrored under output_dir.
+    """
+    jobs = []
+    seen_outputs = {}
+    problems = []
+
+    for source in sources:
+        if _has_magic(source):
+            root = source
+            while _has_magic(root):
+                root = os.path.dirname(root)
+            paths = [p for p in glob.glob(source, recursive=True) if os.path.isfile(p)]
+        elif os.path.isdir(source):
+            root = source
+            paths = []
+            for dir_path, dir_names, file_names in os.walk(source):
+                dir_names.sort()
+                for file_name in sorted(file_names):
+                    if file_name.endswith(SOURCE_SUFFIX):
+                        paths.append(os.path.join(dir_path, file_name))
+        elif os.path.isfile(source):
+            root = os.path.dirname(source)
+            paths = [source]
+        else:
+            problems.append((source, "no such file, directory or matching pattern"))
+            continue
+
+        if not paths:
+            problems.append((source, "no input files found"))
+
+        for path in sorted(paths):
+            relative = os.path.relpath(path, root or ".")
+            output_path = os.path.join(output_dir, relative)
+            if output_path in seen_outputs:
+                if seen_outputs[output_path] == path:
+                    continue
+                problems.append((path, f"output '{output_path}' already produced from '{seen_outputs[output_path]}'"))
+                continue
+            seen_outputs[output_path] = path
+            jobs.append((path, output_path))
+
+    return jobs, problems
+
+
+def _init_worker(techniques, parse_mode, frontend, input_mode, lexer_mode, cache_dir, cache_size, dfa_path,
+                 ast_backend, shared_leaves, collect_metrics, trace):
+    global _worker_pipeline
+    if dfa_path and frontend != "native":
+        # A no-op in forked workers, which already inherited it.
+        from dfa_cache import load_dfa
+        load_dfa(dfa_path)
+    metrics = None
+    if collect_metrics:
+        from metrics import Metrics
+        metrics = Metrics()
+    cache = ASTCache(cache_dir, max_bytes=cache_size) if cache_dir else None
+    _worker_pipeline = Pipeline(techniques=techniques, parse_mode=parse_mode, frontend=frontend,
+                                input_mode=input_mode, cache=cache, lexer_mode=lexer_mode,
+                                ast_backend=ast_backend, shared_leaves=shared_leaves,
+                                metrics=metrics,
+                                tracer=Tracer(process_name=f"worker {os.getpid()}") if trace else None)
+
+
+def _process_file(job):
+    input_path, output_path = job
+    try:
+        generated_code = _worker_pipeline.run_file(input_path)
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        with open(output_path, 'w') as f:
+            f.write(generated_code)
+        error = None
+    except (PipelineError, OSError, UnicodeDecodeError) as e:
+        error = str(e)
+    except Exception as e:
+        error = f"{e.__class__.__name__}: {e}"
+    records = []
+    if _worker_pipeline.metrics is not None:
+        records, _worker_pipeline.metrics.records = _worker_pipeline.metrics.records, []
+    events = _worker_pipeline.tracer.take_events() if _worker_pipeline.tracer is not None else []
+    return input_path, error, records, events
+
+
+def _warm_up(jobs, parse_mode, frontend, input_mode, lexer_mode):
+    pipeline = Pipeline(parse_mode=parse_mode, frontend=frontend, input_mode=input_mode, lexer_mode=lexer_mode)
+    for input_path, _ in jobs:
+        try:
+            pipeline.file_to_ast(input_path)
+        except (PipelineError, OSError, UnicodeDecodeError):
+            pass
+
+
+def run_batch(sources, output_dir, techniques=None, workers=None, chunksize=8, parse_mode="ll",
+              frontend="antlr", input_mode="memory", cache_dir=None, cache_size=512 * 2 ** 20,
+              dfa_path=None, warmup=0, lexer_mode="antlr", ast_backend="objects",
+              shared_leaves=False, metrics_path=None, trace_path=None):
+    """Obfuscate every source into a mirrored tree under output_dir.
+
+    Returns (number_of_successes, failures), where failures is a list of
+    (path, message) pairs. A failing file never stops the rest of the run.
+    Options Pipeline rejects raise ValueError, and a cache_dir that cannot
+    be created raises OSError, before any worker starts.
+
+    With ANTLR frontends, the DFA cache saved by dfa_cache.py at dfa_path is
+    loaded and the first `warmup` files are parsed once in this process
+    before the workers are forked, so they start with the warmed DFA.
+
+    With a metrics_path, the workers record metrics.Metrics for every
+    stage of every file, written there as JSON lines. With a trace_path,
+    they record tracing.Tracer spans for every file, merged with a span for
+    the whole run into one Chrome trace-event file there.
+    """
+    jobs, failures = collect_jobs(sources, output_dir)
+    succeeded = 0
+    if not jobs:
+        return succeeded, failures
+
+    # Checked once here: multiprocessing.Pool replaces a worker whose initializer raises with another
+    # that raises the same, so the batch would hang instead of reporting the error.
+    cache = ASTCache(cache_dir, max_bytes=cache_size) if cache_dir else None
+    Pipeline(techniques=techniques, parse_mode=parse_mode, frontend=frontend, input_mode=input_mode,
+             cache=cache, lexer_mode=lexer_mode, ast_backend=ast_backend, shared_leaves=shared_leaves).close()
+
+    tracer = Tracer(process_name="batch.py") if trace_path else None
+    run_started = tracer.now() if tracer is not None else None
+    workers = workers or os.cpu_count() or 1
+    workers = min(workers, len(jobs))
+    if frontend != "native":
+        if dfa_path:
+            from dfa_cache import load_dfa
+            if not load_dfa(dfa_path):
+                print(f"Warning: DFA cache '{dfa_path}' is missing, unreadable or for another grammar; "
+                      f"starting cold.")
+        if warmup:
+            _warm_up(jobs[:warmup], parse_mode, frontend, input_mode, lexer_mode)
+
+    metrics_file = open(metrics_path, 'w') if metrics_path else None
+    try:
+        with multiprocessing.Pool(processes=workers, initializer=_init_worker,
+                                  initargs=(techniques, parse_mode, frontend, input_mode, lexer_mode,
+                                            cache_dir, cache_size, dfa_path, ast_backend, shared_leaves,
+                                            metrics_file is not None, tracer is not None)) as pool:
+            for input_path, error, records, events in pool.imap_unordered(_process_file, jobs,
+                                                                          chunksize=chunksize):
+                if error is None:
+                    succeeded += 1
+                else:
+                    failures.append((input_path, error))
+                for record in records:
+                    metrics_file.write(json.dumps(record) + "\n")
+                if tracer is not None:
+                    tracer.events.extend(events)
+    finally:
+        if metrics_file is not None:
+            metrics_file.close()
+
+    if tracer is not None:
+        tracer.complete("batch", "batch", run_started, files=len(jobs), workers=workers)
+        tracer.write(trace_path)
+
+    return succeeded, failures
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Obfuscate many Mini-C files in parallel.")
+    arg_parser.add_argument("sources", nargs="+", help="input files, directories or glob patterns")
+    arg_parser.add_argument("-o", "--output-dir", required=True, help="root of the mirrored output tree")
+    arg_parser.add_argument("-j", "--jobs", type=int, default=None, help="worker processes (default: CPU count)")
+    arg_parser.add_argument("--techniques", nargs="+", default=None,
+                            help="obfuscation techniques (default: rename_identifiers dead_code)")
+    arg_parser.add_argument("--parse-mode", choices=PARSE_MODES, default="ll",
+                            help="'sll' tries fast SLL prediction first and falls back to full LL on failure")
+    arg_parser.add_argument("--frontend", choices=FRONTENDS, default="antlr",
+                            help="'native' parses with the hand-written parser instead of ANTLR")
+    arg_parser.add_argument("--input-mode", choices=INPUT_MODES, default="memory",
+                            help="'mmap' reads files through a memory map and a windowed token stream")
+    arg_parser.add_argument("--lexer", choices=LEXER_MODES, default="antlr",
+                            help="'regex' lexes with one compiled regex instead of the generated ANTLR lexer")
+    arg_parser.add_argument("--ast-backend", choices=AST_BACKENDS, default="objects",
+                            help="'arena' obfuscates a flat array copy of each AST (see ast_arena.py)")
+    arg_parser.add_argument("--shared-leaves", action="store_true",
+                            help="share one read-only node per type, boolean, small integer and ASCII character")
+    arg_parser.add_argument("--cache-dir", default=None, help="directory of the on-disk AST cache (off by default)")
+    arg_parser.add_argument("--cache-size", type=int, default=512, help="AST cache size limit in MiB")
+    arg_parser.add_argument("--dfa-cache", default=None, help="warmed ANTLR DFA cache written by dfa_cache.py")
+    arg_parser.add_argument("--warmup", type=int, default=0,
+                            help="parse this many files before starting the workers so they inherit a warm DFA")
+    arg_parser.add_argument("--metrics-out", default=None,
+                            help="write per-file, per-stage metrics here as JSON lines (see metrics.py)")
+    arg_parser.add_argument("--trace", default=None, metavar="OUT_JSON",
+                            help="write every worker's file, stage, pass and function spans in Chrome trace-event format")
+    args = arg_parser.parse_args()
+    if args.input_mode == "mmap" and args.frontend == "native":
+        arg_parser.error("--input-mode mmap needs an ANTLR frontend")
+    if args.lexer == "regex" and (args.frontend == "native" or args.input_mode == "mmap"):
+        arg_parser.error("--lexer regex needs an ANTLR frontend and --input-mode memory")
+
+    try:
+        succeeded, failures = run_batch(args.sources, args.output_dir, techniques=args.techniques,
+                                        workers=args.jobs, parse_mode=args.parse_mode,
+                                        frontend=args.frontend, input_mode=args.input_mode,
+                                        cache_dir=args.cache_dir, cache_size=args.cache_size * 2 ** 20,
+                                        dfa_path=args.dfa_cache, warmup=args.warmup, lexer_mode=args.lexer,
+                                        ast_backend=args.ast_backend, shared_leaves=args.shared_leaves,
+                                        metrics_path=args.metrics_out, trace_path=args.trace)
+    except (ValueError, OSError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    print(f"Obfuscated {succeeded} file(s) into '{args.output_dir}', {len(failures)} failure(s).")
+    if failures:
+        print("\n--- Failures ---")
+        for path, message in sorted(failures):
+            print(f"{path}: {message}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
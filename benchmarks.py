@@ -0,0 +1,1560 @@
+import argparse
+import contextlib
+import copy
+import io
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from types import GeneratorType
+
+import ast_nodes as custom_ast
+import traversal
+from analyses import LocalSymbols
+from obfuscator_passes import ObfuscationPass
+from symbols import SYMBOLS
+
+
+def generate_program(functions=50, statements=30, seed=0):
+    """Deterministically generate a valid Mini-C program exercising the whole grammar."""
+    rng = random.Random(seed)
+    lines = []
+    function_names = [f"func_{i}" for i in range(functions)]
+
+    def expression(variables, depth=0):
+        choice = rng.random()
+        if depth > 3 or choice < 0.3:
+            leaf = rng.random()
+            if leaf < 0.6:
+                return rng.choice(variables)
+            elif leaf < 0.9:
+                return str(rng.randint(0, 1000))
+            return rng.choice(["true", "false", "'a'", "'\\n'"])
+        elif choice < 0.75:
+            op = rng.choice(["+", "-", "*", "/", "%", "<", "<=", ">", ">=", "==", "!=", "&&", "||"])
+            return f"{expression(variables, depth + 1)} {op} {expression(variables, depth + 1)}"
+        elif choice < 0.85:
+            return f"({expression(variables, depth + 1)})"
+        elif choice < 0.92:
+            return f"{rng.choice(['-', '!', '+'])}{expression(variables, depth + 1)}"
+        callee = rng.choice(function_names)
+        return f"{callee}({expression(variables, depth + 1)}, {expression(variables, depth + 1)})"
+
+    def statement_lines(variables, indent, budget, depth=0):
+        out = []
+        pad = "    " * indent
+        while budget > 0:
+            budget -= 1
+            kind = rng.random()
+            if kind < 0.25:
+                name = f"v{len(variables)}"
+                out.append(f"{pad}int {name} = {expression(variables)};")
+                variables = variables + [name]
+            elif kind < 0.5:
+                out.append(f"{pad}{rng.choice(variables)} = {expression(variables)}; // update")
+            elif kind < 0.6 and depth < 3:
+                out.append(f"{pad}if ({expression(variables)}) {{")
+                out.extend(statement_lines(variables, indent + 1, 3, depth + 1))
+                out.append(f"{pad}}} else {{")
+                out.extend(statement_lines(variables, indent + 1, 2, depth + 1))
+                out.append(f"{pad}}}")
+            elif kind < 0.68 and depth < 3:
+                out.append(f"{pad}while ({expression(variables)}) {{")
+                out.extend(statement_lines(variables, indent + 1, 3, depth + 1))
+                out.append(f"{pad}}}")
+            elif kind < 0.76 and depth < 3:
+                counter = rng.choice(variables)
+                loop_variables = variables
+                header = rng.choice([
+                    f"{counter} = 0; {counter} < 10; {counter} = {counter} + 1",
+                    f"; {counter} < 10;",
+                    f";; {counter} = {counter} - 1",
+                    None,
+                ])
+                if header is None:
+                    header = f"int i{depth} = 0; i{depth} < {counter}; i{depth} = i{depth} + 1"
+                    loop_variables = variables + [f"i{depth}"]
+                out.append(f"{pad}for ({header}) {{")
+                out.extend(statement_lines(loop_variables, indent + 1, 2, depth + 1))
+                out.append(f"{pad}}}")
+            elif kind < 0.84:
+                out.append(f'{pad}printf("value: %d\\n", {expression(variables)});')
+            elif kind < 0.9 and depth < 3:
+                out.append(f"{pad}{{")
+                out.extend(statement_lines(variables, indent + 1, 2, depth + 1))
+                out.append(f"{pad}}}")
+            else:
+                out.append(f"{pad}{expression(variables)};")
+        return out
+
+    for name in function_names + ["main"]:
+        if name == "main":
+            lines.append("int main() {")
+            lines.append("    int x = 0;")
+            variables = ["x"]
+        else:
+            lines.append(f"int {name}(int a, char c, bool b) {{")
+            variables = ["a", "b"]
+        lines.extend(statement_lines(variables, 1, statements))
+        lines.append(f"    return {variables[0]};")
+        lines.append("}")
+        lines.append("")
+    return "\n".join(lines)
+
+
+def generate_expression_program(statements=2000, seed=0, variables=("a", "b", "c", "d")):
+    """Generate a program that is almost entirely expressions, from single leaves to deep operator chains."""
+    rng = random.Random(seed)
+    variables = list(variables)
+    lines = ["int main() {"] + [f"    int {name} = {i};" for i, name in enumerate(variables)]
+    for i in range(statements):
+        operands = [rng.choice(variables + [str(rng.randint(0, 99))]) for _ in range(rng.randint(1, 8))]
+        expression = operands[0]
+        for operand in operands[1:]:
+            expression += f" {rng.choice(['+', '-', '*', '<', '==', '&&'])} {operand}"
+        lines.append(f"    {rng.choice(variables)} = {expression};")
+    lines.append("    return a;")
+    lines.append("}")
+    return "\n".join(lines)
+
+
+def count_nodes(node):
+    if isinstance(node, list):
+        return sum(count_nodes(item) for item in node)
+    if not isinstance(node, custom_ast.Node):
+        return 0
+    return 1 + sum(count_nodes(getattr(node, field)) for field in node._fields)
+
+
+def first_ast_difference(a, b, path="program"):
+    """Return a description of the first place two AST trees differ, or None if they are equal."""
+    if type(a) is not type(b):
+        return f"{path}: {type(a).__name__} != {type(b).__name__}"
+    if isinstance(a, list):
+        if len(a) != len(b):
+            return f"{path}: {len(a)} items != {len(b)} items"
+        for i, (item_a, item_b) in enumerate(zip(a, b)):
+            difference = first_ast_difference(item_a, item_b, f"{path}[{i}]")
+            if difference:
+                return difference
+        return None
+    if not isinstance(a, custom_ast.Node):
+        return None if a == b else f"{path}: {a!r} != {b!r}"
+    for field in ("line_no",) + a._fields:
+        difference = first_ast_difference(getattr(a, field), getattr(b, field, None), f"{path}.{field}")
+        if difference:
+            return difference
+    return None
+
+
+def _best_of(repeat, func, *args):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def _best_of_on_copies(repeat, program, func):
+    """Like _best_of, but each run gets its own deep copy of `program`, made outside the timing."""
+    best = None
+    for _ in range(repeat):
+        tree = copy.deepcopy(program)
+        start = time.perf_counter()
+        func(tree)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def _load_sources(paths, functions, statements):
+    if paths:
+        sources = []
+        for path in paths:
+            with open(path, 'r', encoding='utf-8') as f:
+                sources.append((path, f.read()))
+        return sources
+    return [(f"<generated {functions}x{statements}>", generate_program(functions, statements))]
+
+
+def bench_frontend(args):
+    from pipeline import Pipeline
+
+    antlr_pipeline = Pipeline(frontend="antlr")
+    native_pipeline = Pipeline(frontend="native")
+
+    print(f"{'source':<32} {'bytes':>9} {'antlr ms':>10} {'native ms':>10} {'speedup':>8}  AST")
+    for name, source_text in _load_sources(args.files, args.functions, args.statements):
+        # One untimed run warms the ANTLR DFA cache so both sides are measured in steady state.
+        antlr_pipeline.source_to_ast(source_text, name)
+        antlr_seconds, antlr_ast = _best_of(args.repeat, antlr_pipeline.source_to_ast, source_text, name)
+        native_seconds, native_ast = _best_of(args.repeat, native_pipeline.source_to_ast, source_text, name)
+
+        difference = first_ast_difference(antlr_ast, native_ast)
+        print(f"{name[-32:]:<32} {len(source_text):>9} {antlr_seconds * 1000:>10.2f} "
+              f"{native_seconds * 1000:>10.2f} {antlr_seconds / native_seconds:>7.1f}x  "
+              f"{'identical' if difference is None else 'DIFFERENT: ' + difference}")
+        if difference is not None:
+            return 1
+    return 0
+
+
+# Inputs that exercise the lexer's corners, including ones MiniCLexer reports errors for.
+LEXER_EDGE_CASES = [
+    "",
+    "int main() { return 0; } // comment without a newline",
+    "x = 'a' + '\\n' + '\\'';\r\n\tprintf(\"a \\\"quoted\\\" string\\n\");",
+    "\"spans\nlines\" y '\n' z",
+    "a<=b>=c==d!=e&&f||!g<h>i=j+-*/%k",
+    "ifx if_ int9 9int __ _9",
+    "a @ b # c",
+    "a & b | c",
+    "&\n&& 'ab' x",
+    "'a\n' '\\",
+    "x = \"unterminated \\\" string",
+]
+
+
+def _lex_tokens(token_source):
+    from antlr4 import CommonTokenStream
+    from syntax_errors import SyntaxErrorCollector
+
+    collector = SyntaxErrorCollector()
+    token_source.removeErrorListeners()
+    token_source.addErrorListener(collector)
+    token_stream = CommonTokenStream(token_source)
+    token_stream.fill()
+    return token_stream.tokens, collector.errors
+
+
+def _lex_with_antlr(source_text):
+    from antlr4 import InputStream
+    from generated_parser.MiniCLexer import MiniCLexer
+
+    return _lex_tokens(MiniCLexer(InputStream(source_text)))
+
+
+def _lex_with_regex(source_text):
+    from regex_lexer import RegexLexer
+
+    return _lex_tokens(RegexLexer(source_text))
+
+
+def first_token_difference(a, b):
+    """Return a description of the first token where two token lists differ, or None if they are equal."""
+    fields = ("type", "channel", "start", "stop", "line", "column", "text", "tokenIndex")
+    for token_a, token_b in zip(a, b):
+        for field in fields:
+            if getattr(token_a, field) != getattr(token_b, field):
+                return (f"token {token_a.tokenIndex} {field}: "
+                        f"{getattr(token_a, field)!r} != {getattr(token_b, field)!r}")
+    if len(a) != len(b):
+        return f"{len(a)} tokens != {len(b)} tokens"
+    return None
+
+
+def bench_lexer(args):
+    for source_text in LEXER_EDGE_CASES:
+        antlr_tokens, antlr_errors = _lex_with_antlr(source_text)
+        regex_tokens, regex_errors = _lex_with_regex(source_text)
+        difference = first_token_difference(antlr_tokens, regex_tokens)
+        if difference is None and antlr_errors != regex_errors:
+            difference = f"errors {antlr_errors} != {regex_errors}"
+        if difference is not None:
+            print(f"Edge case {source_text!r}: DIFFERENT: {difference}")
+            return 1
+    print(f"{len(LEXER_EDGE_CASES)} edge cases lex identically.")
+
+    print(f"{'source':<32} {'MiB':>7} {'tokens':>8} {'antlr MB/s':>11} {'regex MB/s':>11} {'speedup':>8}  tokens")
+    for name, source_text in _load_sources(args.files, args.functions, args.statements):
+        megabytes = len(source_text.encode('utf-8')) / 1e6
+        antlr_seconds, (antlr_tokens, _) = _best_of(args.repeat, _lex_with_antlr, source_text)
+        regex_seconds, (regex_tokens, _) = _best_of(args.repeat, _lex_with_regex, source_text)
+        difference = first_token_difference(antlr_tokens, regex_tokens)
+        print(f"{name[-32:]:<32} {megabytes * 1e6 / 2 ** 20:>7.2f} {len(antlr_tokens):>8} "
+              f"{megabytes / antlr_seconds:>11.2f} {megabytes / regex_seconds:>11.2f} "
+              f"{antlr_seconds / regex_seconds:>7.1f}x  {'identical' if difference is None else 'DIFFERENT: ' + difference}")
+        if difference is not None:
+            return 1
+    return 0
+
+
+def _peak_allocated(func, *args):
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        result = func(*args)
+        peak = tracemalloc.get_traced_memory()[1] - baseline
+    finally:
+        tracemalloc.stop()
+    return peak, result
+
+
+def bench_parse_memory(args):
+    from pipeline import FRONTENDS, Pipeline
+
+    pipelines = {frontend: Pipeline(frontend=frontend) for frontend in FRONTENDS}
+
+    print(f"{'source':<32} {'frontend':<13} {'ms':>10} {'peak MiB':>10}  AST")
+    for name, source_text in _load_sources(args.files, args.functions, args.statements):
+        reference_ast = None
+        for frontend, pipeline in pipelines.items():
+            pipeline.source_to_ast(source_text, name)
+            seconds, _ = _best_of(args.repeat, pipeline.source_to_ast, source_text, name)
+            peak, program = _peak_allocated(pipeline.source_to_ast, source_text, name)
+
+            if reference_ast is None:
+                reference_ast = program
+            difference = first_ast_difference(reference_ast, program)
+            print(f"{name[-32:]:<32} {frontend:<13} {seconds * 1000:>10.2f} {peak / 2 ** 20:>10.2f}  "
+                  f"{'identical' if difference is None else 'DIFFERENT: ' + difference}")
+            if difference is not None:
+                return 1
+    return 0
+
+
+def _dict_node_classes():
+    # Stand-ins with the __dict__ layout ast_nodes had before it used __slots__,
+    # including the temp_local_scope_map dict every FunctionDefNode carried.
+    classes = {}
+    for cls in custom_ast.Node.__subclasses__():
+        classes[cls] = type(cls.__name__, (), {})
+    return classes
+
+
+def _copy_tree(node, make_node):
+    if isinstance(node, list):
+        return [_copy_tree(item, make_node) for item in node]
+    if not isinstance(node, custom_ast.Node):
+        return node
+    return make_node(node, {field: _copy_tree(getattr(node, field), make_node) for field in node._fields})
+
+
+def bench_node_memory(args):
+    from code_generator import CodeGenerator
+    from pipeline import Pipeline
+
+    dict_classes = _dict_node_classes()
+
+    def make_slots_node(node, fields):
+        copy = object.__new__(type(node))
+        copy.line_no = node.line_no
+        for field, value in fields.items():
+            setattr(copy, field, value)
+        return copy
+
+    def make_dict_node(node, fields):
+        copy = dict_classes[type(node)]()
+        copy.line_no = node.line_no
+        for field, value in fields.items():
+            setattr(copy, field, value)
+        if isinstance(node, custom_ast.FunctionDefNode):
+            copy.temp_local_scope_map = {}
+        return copy
+
+    leaf_pool = custom_ast.LeafPool()
+    pooled_leaves = {custom_ast.TypeNode: leaf_pool.type_node, custom_ast.NumberLiteralNode: leaf_pool.number,
+                     custom_ast.CharLiteralNode: leaf_pool.char, custom_ast.BoolLiteralNode: leaf_pool.boolean}
+
+    def make_pooled_node(node, fields):
+        make_leaf = pooled_leaves.get(type(node))
+        if make_leaf is None:
+            return make_slots_node(node, fields)
+        return make_leaf(*fields.values())
+
+    sources = _load_sources(args.files, args.functions, args.statements)
+    if not args.files:
+        sources.append((f"<literals x{args.statements * 100}>",
+                        generate_expression_program(args.statements * 100, variables=("a",))))
+
+    pipeline = Pipeline(frontend="native")
+    shared_pipeline = Pipeline(frontend="native", shared_leaves=True)
+    print(f"{'source':<32} {'nodes':>9} {'layout':<8} {'MiB':>8} {'bytes/node':>11}")
+    for name, source_text in sources:
+        program = pipeline.source_to_ast(source_text, name)
+        nodes = count_nodes(program)
+        shared_program = shared_pipeline.source_to_ast(source_text, name)
+        if CodeGenerator().generate(shared_program) != CodeGenerator().generate(program):
+            print(f"{name[-32:]:<32} DIFFERENT: shared leaves change the generated code")
+            return 1
+        # The copies share the identifier strings and literal values, so the
+        # difference is purely node objects (plus the child lists in all).
+        for layout, make_node in (("__dict__", make_dict_node), ("__slots__", make_slots_node),
+                                  ("pooled", make_pooled_node)):
+            tracemalloc.start()
+            try:
+                copy = _copy_tree(program, make_node)
+                allocated = tracemalloc.get_traced_memory()[0]
+            finally:
+                tracemalloc.stop()
+            print(f"{name[-32:]:<32} {nodes:>9} {layout:<8} {allocated / 2 ** 20:>8.2f} {allocated / nodes:>11.1f}")
+            del copy
+    return 0
+
+
+def _string_identifier_class():
+    """IdentifierNode as it was before symbols.py, keeping its own name string, to compare against.
+
+    It has IdentifierNode's name, so the native frontend and visitors handle it as one.
+    """
+    def __init__(self, name, line_no=None):
+        self.line_no = line_no
+        self.name = name
+
+    return type("IdentifierNode", (), {"__slots__": ("line_no", "name"), "_fields": ("name",),
+                                       "_child_fields": (), "__init__": __init__})
+
+
+def _identifier_nodes(program, identifier_class):
+    found = []
+    pending = [program]
+    while pending:
+        node = pending.pop()
+        if isinstance(node, list):
+            pending.extend(node)
+        elif isinstance(node, identifier_class):
+            found.append(node)
+        elif isinstance(node, custom_ast.Node):
+            pending.extend(getattr(node, field) for field in node._child_fields)
+    return found
+
+
+def bench_symbols(args):
+    from code_generator import CodeGenerator
+    from pipeline import Pipeline
+
+    string_identifier = _string_identifier_class()
+
+    class StringNameGenerator(CodeGenerator):
+        def visit_identifiernode(self, node):
+            self._emit(node.name)
+
+    if args.files:
+        sources = _load_sources(args.files, args.functions, args.statements)
+    else:
+        variables = [f"identifier_{i}" for i in range(40)]
+        sources = [(f"<identifiers x{args.statements * 100}>",
+                    generate_expression_program(args.statements * 100, variables=variables))]
+
+    pipeline = Pipeline(frontend="native")
+    print(f"{'source':<32} {'names':<12} {'identifiers':>11} {'AST MiB':>8} {'rename ms':>10} {'generate ms':>12}")
+    for name, source_text in sources:
+        # Leaves the frontend's one-time allocations, and the table's copy of each name, out of both.
+        pipeline.source_to_ast(source_text, name)
+        programs = {}
+        for names in ("strings", "symbol IDs"):
+            saved = custom_ast.IdentifierNode
+            if names == "strings":
+                custom_ast.IdentifierNode = string_identifier
+            tracemalloc.start()
+            try:
+                program = pipeline.source_to_ast(source_text, name)
+                allocated = tracemalloc.get_traced_memory()[0]
+            finally:
+                tracemalloc.stop()
+                custom_ast.IdentifierNode = saved
+            programs[names] = (program, allocated)
+
+        # Give every distinct name a new one and rewrite each identifier, as the renaming passes do.
+        identifiers = _identifier_nodes(programs["strings"][0], string_identifier)
+        renames = {old: f"obf_{i}" for i, old in enumerate(sorted({node.name for node in identifiers}))}
+        renamed_symbols = list(range(len(SYMBOLS)))
+        for old, new in renames.items():
+            renamed_symbols[SYMBOLS.intern(old)] = SYMBOLS.intern(new)
+
+        def rename_strings(nodes):
+            for node in nodes:
+                node.name = renames[node.name]
+
+        def rename_symbols(nodes):
+            for node in nodes:
+                node.symbol_id = renamed_symbols[node.symbol_id]
+
+        outputs = []
+        for names, rename, generator, identifier_class in (
+                ("strings", rename_strings, StringNameGenerator, string_identifier),
+                ("symbol IDs", rename_symbols, CodeGenerator, custom_ast.IdentifierNode)):
+            program, allocated = programs[names]
+            rename_seconds = None
+            for _ in range(args.repeat):
+                renamed = copy.deepcopy(program)
+                nodes = _identifier_nodes(renamed, identifier_class)
+                start = time.perf_counter()
+                rename(nodes)
+                elapsed = time.perf_counter() - start
+                rename_seconds = elapsed if rename_seconds is None else min(rename_seconds, elapsed)
+            generate_seconds, _ = _best_of(args.repeat, generator().generate, program)
+            outputs.append((generator().generate(program), generator().generate(renamed)))
+            print(f"{name[-32:]:<32} {names:<12} {len(nodes):>11} {allocated / 2 ** 20:>8.2f} "
+                  f"{rename_seconds * 1000:>10.2f} {generate_seconds * 1000:>12.2f}")
+        if outputs[0] != outputs[1]:
+            print(f"{name[-32:]:<32} DIFFERENT: string and symbol ID names generate different code")
+            return 1
+        print(f"{name[-32:]:<32} generated code identical before and after renaming")
+    return 0
+
+
+def bench_binary_ast(args):
+    import pickle
+    import zlib
+
+    import ast_binary
+    from code_generator import CodeGenerator
+    from pipeline import Pipeline
+
+    pipeline = Pipeline(frontend="native")
+    print(f"{'source':<32} {'format':<16} {'KiB':>8} {'zlib KiB':>9} {'dump ms':>8} {'load ms':>8}")
+    for name, source_text in _load_sources(args.files, args.functions, args.statements):
+        program = pipeline.source_to_ast(source_text, name)
+        random.seed(0)
+        with contextlib.redirect_stdout(io.StringIO()):
+            obfuscated = pipeline.obfuscate(copy.deepcopy(program))
+        expected = CodeGenerator().generate(program)
+
+        formats = [
+            ("pickle", lambda tree: pickle.dumps(tree, protocol=pickle.HIGHEST_PROTOCOL), pickle.loads),
+            ("ast_binary", ast_binary.dumps, lambda data: ast_binary.loads(data, lazy=False)),
+            ("ast_binary lazy", ast_binary.dumps, ast_binary.loads),
+        ]
+        for format_name, dump, load in formats:
+            dump_seconds, data = _best_of(args.repeat, dump, program)
+            load_seconds, _ = _best_of(args.repeat, load, data)
+            print(f"{name[-32:]:<32} {format_name:<16} {len(data) / 1024:>8.1f} {len(zlib.compress(data)) / 1024:>9.1f} "
+                  f"{dump_seconds * 1000:>8.2f} {load_seconds * 1000:>8.2f}")
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "program.mcast")
+            ast_binary.save(program, path)
+            mapped = ast_binary.load(path)
+            first_function = mapped.declarations[0] if mapped.declarations else None
+            decoded = mapped.declarations.decoded_count()
+            mapped_code = CodeGenerator().generate(mapped)
+            del first_function, mapped
+
+        checks = [
+            ("eager round trip", first_ast_difference(program, ast_binary.loads(ast_binary.dumps(program), lazy=False))),
+            ("generated code", None if CodeGenerator().generate(ast_binary.loads(ast_binary.dumps(program))) == expected
+             else "differs"),
+            ("mmap generated code", None if mapped_code == expected else "differs"),
+            ("obfuscated code", None if CodeGenerator().generate(ast_binary.loads(ast_binary.dumps(obfuscated)))
+             == CodeGenerator().generate(obfuscated) else "differs"),
+        ]
+        for check, difference in checks:
+            if difference is not None:
+                print(f"{name[-32:]:<32} {check}: DIFFERENT: {difference}")
+                return 1
+        print(f"{name[-32:]:<32} lazy mmap load decoded {decoded} of {len(program.declarations)} function(s) "
+              f"to read the first; round trip and generated code identical")
+    return 0
+
+
+def _count_kinds(node, counts):
+    if isinstance(node, list):
+        for item in node:
+            _count_kinds(item, counts)
+    elif isinstance(node, custom_ast.Node):
+        name = type(node).__name__
+        counts[name] = counts.get(name, 0) + 1
+        for field in node._fields:
+            _count_kinds(getattr(node, field), counts)
+    return counts
+
+
+def _obfuscated_code(program, seed):
+    from code_generator import CodeGenerator
+    from obfuscator_passes import Obfuscator
+
+    random.seed(seed)
+    with contextlib.redirect_stdout(io.StringIO()):
+        obfuscated = Obfuscator().apply_passes(program)
+    return CodeGenerator().generate(obfuscated)
+
+
+def bench_arena(args):
+    from ast_arena import ASTArena
+    from code_generator import CodeGenerator
+    from pipeline import Pipeline
+
+    pipeline = Pipeline(frontend="native")
+    print(f"{'source':<32} {'operation':<24} {'objects ms':>11} {'arena ms':>9}")
+    for name, source_text in _load_sources(args.files, args.functions, args.statements):
+        program = pipeline.source_to_ast(source_text, name)
+        nodes = count_nodes(program)
+
+        tracemalloc.start()
+        try:
+            arena = ASTArena.from_tree(program)
+            arena_bytes = tracemalloc.get_traced_memory()[0]
+        finally:
+            tracemalloc.stop()
+        tracemalloc.start()
+        try:
+            tree_copy = _copy_tree(program, lambda node, fields: type(node)(**fields, line_no=node.line_no))
+            tree_bytes = tracemalloc.get_traced_memory()[0]
+        finally:
+            tracemalloc.stop()
+        del tree_copy
+        print(f"{name[-32:]:<32} {nodes} nodes: {tree_bytes / nodes:.1f} bytes/node as objects, "
+              f"{arena_bytes / nodes:.1f} in the arena")
+
+        checks = [
+            ("round trip", first_ast_difference(program, arena.to_tree())),
+            ("histogram", None if _count_kinds(program, {}) == arena.kind_histogram() else "counts differ"),
+            ("generate", None if CodeGenerator().generate(program) == CodeGenerator().generate(arena.view())
+             else "generated code differs"),
+            ("obfuscate", None if _obfuscated_code(copy.deepcopy(program), 0) == _obfuscated_code(arena.copy().view(), 0)
+             else "obfuscated code differs"),
+        ]
+        print(f"{name[-32:]:<32} tree -> arena {_best_of(args.repeat, ASTArena.from_tree, program)[0] * 1000:.2f} ms, "
+              f"arena -> tree {_best_of(args.repeat, arena.to_tree)[0] * 1000:.2f} ms")
+        timings = [
+            ("copy", _best_of(args.repeat, copy.deepcopy, program)[0], _best_of(args.repeat, arena.copy)[0]),
+            ("histogram", _best_of(args.repeat, _count_kinds, program, {})[0],
+             _best_of(args.repeat, arena.kind_histogram)[0]),
+            ("generate", _best_of(args.repeat, CodeGenerator().generate, program)[0],
+             _best_of(args.repeat, CodeGenerator().generate, arena.view())[0]),
+            ("copy+obfuscate+generate", _best_of(args.repeat, lambda: _obfuscated_code(copy.deepcopy(program), 0))[0],
+             _best_of(args.repeat, lambda: _obfuscated_code(arena.copy().view(), 0))[0]),
+        ]
+        for operation, objects_seconds, arena_seconds in timings:
+            print(f"{name[-32:]:<32} {operation:<24} {objects_seconds * 1000:>11.2f} {arena_seconds * 1000:>9.2f}")
+        for check, difference in checks:
+            if difference is not None:
+                print(f"{name[-32:]:<32} {check}: DIFFERENT: {difference}")
+                return 1
+        print(f"{name[-32:]:<32} round trip, histogram, generated and obfuscated code identical")
+    return 0
+
+
+def _variant_trees(strategy, pipeline, source_text, program, count):
+    trees = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        if strategy == "persistent":
+            trees.extend(pipeline.obfuscate_variants(program, count, seed=0))
+        else:
+            for i in range(count):
+                tree = pipeline.source_to_ast(source_text) if strategy == "reparse" else copy.deepcopy(program)
+                random.seed(i)
+                trees.append(pipeline.obfuscate(tree))
+    return trees
+
+
+def bench_variants(args):
+    import ast_binary
+    from pipeline import Pipeline
+
+    pipelines = {"reparse": Pipeline(frontend="native"), "deepcopy": Pipeline(frontend="native"),
+                 "persistent": Pipeline(frontend="native", persistent=True)}
+    print(f"{'source':<32} {'strategy':<11} {'variants':>8} {'ms':>9} {'ms/variant':>10} {'retained MiB':>12}")
+    for name, source_text in _load_sources(args.files, args.functions, args.statements):
+        program = pipelines["reparse"].source_to_ast(source_text, name)
+        original = ast_binary.dumps(program)
+        print(f"{name[-32:]:<32} {count_nodes(program)} nodes")
+        codes = {}
+        for strategy, pipeline in pipelines.items():
+            start = time.perf_counter()
+            trees = _variant_trees(strategy, pipeline, source_text, program, args.variants)
+            seconds = time.perf_counter() - start
+            codes[strategy] = [pipeline.generate(tree) for tree in trees]
+            del trees
+            tracemalloc.start()
+            try:
+                baseline = tracemalloc.get_traced_memory()[0]
+                trees = _variant_trees(strategy, pipeline, source_text, program, args.variants)
+                retained = tracemalloc.get_traced_memory()[0] - baseline
+            finally:
+                tracemalloc.stop()
+            del trees
+            print(f"{name[-32:]:<32} {strategy:<11} {args.variants:>8} {seconds * 1000:>9.1f} "
+                  f"{seconds * 1000 / args.variants:>10.2f} {retained / 2 ** 20:>12.1f}")
+        if ast_binary.dumps(program) != original:
+            print(f"{name[-32:]:<32} DIFFERENT: making variants modified the original tree")
+            return 1
+        for strategy in ("deepcopy", "persistent"):
+            if codes[strategy] != codes["reparse"]:
+                different = next(i for i, (a, b) in enumerate(zip(codes[strategy], codes["reparse"])) if a != b)
+                print(f"{name[-32:]:<32} {strategy}: DIFFERENT: variant {different} differs from the reparsed one")
+                return 1
+        print(f"{name[-32:]:<32} every variant identical across strategies, original tree unchanged")
+    return 0
+
+
+def _dispatch_visitors():
+    from collections.abc import MutableSequence
+
+    from code_generator import CodeGenerator
+
+    class TablePass(ObfuscationPass):
+        """Visits every node through the dispatch table and _child_fields."""
+
+        def apply(self, ast_root):
+            return self.visit(ast_root)
+
+    class LegacyPass(TablePass):
+        """The string-building getattr dispatch and dir() scan they replaced."""
+
+        def visit(self, node, symbol_map=None, **kwargs):
+            if node is None:
+                return None
+            visitor_method = getattr(self, 'visit_' + node.__class__.__name__.lower(), self.generic_visit)
+            return visitor_method(node, symbol_map, **kwargs)
+
+        def generic_visit(self, node, symbol_map=None, **kwargs):
+            changes = {}
+            for attr_name in dir(node):
+                if not attr_name.startswith('_') and attr_name not in ['line_no', 'parent']:
+                    try:
+                        attr_value = getattr(node, attr_name)
+                        if isinstance(attr_value, custom_ast.Node):
+                            new_child = self.visit(attr_value, symbol_map, **kwargs)
+                            if new_child is not attr_value:
+                                changes[attr_name] = new_child
+                        elif isinstance(attr_value, MutableSequence):
+                            new_list_content = []
+                            changed = False
+                            for item in attr_value:
+                                if isinstance(item, custom_ast.Node):
+                                    visited_item = self.visit(item, symbol_map, **kwargs)
+                                    new_list_content.append(visited_item)
+                                    if visited_item is not item:
+                                        changed = True
+                                else:
+                                    new_list_content.append(item)
+                            if changed:
+                                changes[attr_name] = new_list_content
+                    except AttributeError:
+                        pass
+            return self.update(node, **changes) if changes else node
+
+    class LegacyGenerator(CodeGenerator):
+        def visit(self, node):
+            if node is None:
+                return
+            result = getattr(self, 'visit_' + node.__class__.__name__.lower(), self.generic_visit)(node)
+            if isinstance(result, GeneratorType):
+                for child in result:
+                    self.visit(child)
+
+    return TablePass, LegacyPass, CodeGenerator, LegacyGenerator
+
+
+def bench_dispatch(args):
+    from pipeline import Pipeline
+
+    TablePass, LegacyPass, TableGenerator, LegacyGenerator = _dispatch_visitors()
+    pipeline = Pipeline(frontend="native")
+    print(f"{'source':<32} {'traversal':<24} {'old ms':>9} {'table ms':>9} {'old ns/node':>11} {'table ns/node':>13}")
+    for name, source_text in _load_sources(args.files, args.functions, args.statements):
+        program = pipeline.source_to_ast(source_text, name)
+        nodes = count_nodes(program)
+        if LegacyGenerator().generate(program) != TableGenerator().generate(program):
+            print(f"{name[-32:]:<32} DIFFERENT: generated code differs")
+            return 1
+        if LegacyPass().apply(program) is not program or TablePass().apply(program) is not program:
+            print(f"{name[-32:]:<32} DIFFERENT: a no-op traversal replaced the tree")
+            return 1
+        timings = [
+            ("generic pass traversal", _best_of(args.repeat, LegacyPass().apply, program)[0],
+             _best_of(args.repeat, TablePass().apply, program)[0]),
+            ("code generator", _best_of(args.repeat, LegacyGenerator().generate, program)[0],
+             _best_of(args.repeat, TableGenerator().generate, program)[0]),
+        ]
+        for traversal, old_seconds, table_seconds in timings:
+            print(f"{name[-32:]:<32} {traversal:<24} {old_seconds * 1000:>9.2f} {table_seconds * 1000:>9.2f} "
+                  f"{old_seconds * 1e9 / nodes:>11.0f} {table_seconds * 1e9 / nodes:>13.0f}")
+        print(f"{name[-32:]:<32} {nodes} nodes; generated code identical, no-op traversals left the tree as it was")
+    return 0
+
+
+def _run_recursive(visitor, node):
+    """traversal.run() with the call stack as the stack, to compare against."""
+    if node is None:
+        return None
+    result = visitor._dispatch[type(node)](visitor, node)
+    if type(result) is not GeneratorType:
+        return result
+    value = None
+    try:
+        while True:
+            value = _run_recursive(visitor, result.send(value))
+    except StopIteration as stop:
+        return stop.value
+
+
+def _walk_recursive(root, phases, update):
+    """traversal.walk() with the call stack as the stack, to compare against."""
+
+    def visit(node, parent, active):
+        descending = []
+        for hooks in active:
+            enter = hooks[0][type(node)]
+            if enter is None or enter(hooks[2], node) is not traversal.SKIP:
+                descending.append(hooks)
+        if descending:
+            changes = {}
+            for field in node._child_fields:
+                value = getattr(node, field)
+                if value is None:
+                    continue
+                if isinstance(value, custom_ast.Node):
+                    child = visit(value, node, descending)
+                    if child is not value:
+                        changes[field] = child
+                else:
+                    items = [visit(item, node, descending) for item in value]
+                    if any(item is not old for item, old in zip(items, value)):
+                        changes[field] = items
+            if changes:
+                node = update(node, **changes)
+        for hooks in active:
+            leave = hooks[1][type(node)]
+            if leave is not None:
+                node = leave(hooks[2], node, parent)
+        return node
+
+    for phase in phases:
+        phase.begin(root)
+    root = visit(root, None, [(phase._enter, phase._leave, phase) for phase in phases])
+    for phase in phases:
+        phase.end(root)
+    return root
+
+
+@contextlib.contextmanager
+def _recursive_traversal():
+    """Make the passes and code generator recurse instead of using traversal's explicit stacks."""
+
+    saved = traversal.run, traversal.walk
+    traversal.run, traversal.walk = _run_recursive, _walk_recursive
+    try:
+        yield
+    finally:
+        traversal.run, traversal.walk = saved
+
+
+def _deep_programs(depth):
+    """Mini-C programs nested `depth` levels deep, as (name, source text or None, AST builder)."""
+    from native_frontend import parse_program
+
+    def statement_function(statements):
+        return custom_ast.ProgramNode([custom_ast.FunctionDefNode(
+            custom_ast.TypeNode("int"), custom_ast.IdentifierNode("main"), [],
+            custom_ast.BlockNode([custom_ast.VarDeclNode(custom_ast.TypeNode("int"), custom_ast.IdentifierNode("a"),
+                                                         custom_ast.NumberLiteralNode(1))] + statements))])
+
+    def right_nested():
+        expr = custom_ast.IdentifierNode("a")
+        for i in range(depth - 1):
+            expr = custom_ast.BinaryOpNode(custom_ast.IdentifierNode("a"), "+", expr)
+        return statement_function([custom_ast.ReturnNode(expr)])
+
+    def nested_blocks():
+        statement = custom_ast.ExprStatementNode(custom_ast.AssignmentNode(custom_ast.IdentifierNode("a"),
+                                                                          custom_ast.NumberLiteralNode(0)))
+        for i in range(depth - 1):
+            statement = custom_ast.WhileNode(custom_ast.IdentifierNode("a"), custom_ast.BlockNode([statement]))
+        return statement_function([statement])
+
+    chain = "int main() {\n    int a = 1;\n    return " + " + ".join(["a"] * depth) + ";\n}\n"
+    return [
+        ("a + a + ... (parsed)", lambda: parse_program(chain)),
+        ("a + (a + (...))", right_nested),
+        ("while (a) { while ...", nested_blocks),
+    ]
+
+
+def bench_traversal(args):
+    from code_generator import CodeGenerator
+    from obfuscator_passes import DeadCodeInsertionPass, ScopedRenamingPass
+    from pipeline import Pipeline
+
+    def obfuscate_and_generate(program, recursive, generate=True):
+        with _recursive_traversal() if recursive else contextlib.nullcontext():
+            random.seed(0)
+            for obfuscation_pass in (ScopedRenamingPass(), DeadCodeInsertionPass()):
+                program = obfuscation_pass.apply(program)
+            return CodeGenerator().generate(program) if generate else program
+
+    pipeline = Pipeline(frontend="native")
+    print(f"{'source':<32} {'recursive ms':>12} {'stack ms':>9} {'recursive ns/node':>17} {'stack ns/node':>13}")
+    for name, source_text in _load_sources(args.files, args.functions, args.statements):
+        program = pipeline.source_to_ast(source_text, name)
+        nodes = count_nodes(program)
+        if (obfuscate_and_generate(copy.deepcopy(program), True)
+                != obfuscate_and_generate(copy.deepcopy(program), False)):
+            print(f"{name[-32:]:<32} DIFFERENT: recursive and explicit-stack traversals generated different code")
+            return 1
+        recursive_seconds = _best_of_on_copies(args.repeat, program, lambda tree: obfuscate_and_generate(tree, True))
+        stack_seconds = _best_of_on_copies(args.repeat, program, lambda tree: obfuscate_and_generate(tree, False))
+        print(f"{name[-32:]:<32} {recursive_seconds * 1000:>12.2f} {stack_seconds * 1000:>9.2f} "
+              f"{recursive_seconds * 1e9 / nodes:>17.0f} {stack_seconds * 1e9 / nodes:>13.0f}")
+    print(f"{nodes} nodes; rename + dead code + generate, identical output from both traversals")
+
+    print(f"\n{'nested ' + str(args.depth) + ' levels deep':<32} {'recursive':>14} {'stack ms':>9}")
+    for (name, build), (_, build_shallow) in zip(_deep_programs(args.depth), _deep_programs(200)):
+        if obfuscate_and_generate(build_shallow(), True) != obfuscate_and_generate(build_shallow(), False):
+            print(f"{name:<32} DIFFERENT: recursive and explicit-stack traversals differ at depth 200")
+            return 1
+        # Generated code indents every nesting level, so deep blocks are only obfuscated.
+        generate = not name.startswith("while")
+        try:
+            obfuscate_and_generate(build(), True, generate)
+            recursive = "ok"
+        except RecursionError:
+            recursive = "RecursionError"
+        program = build()
+        start = time.perf_counter()
+        result = obfuscate_and_generate(program, False, generate)
+        stack_seconds = time.perf_counter() - start
+        if generate and result.count(" + ") != args.depth - 1:
+            print(f"{name:<32} DIFFERENT: expected {args.depth - 1} additions in the generated code")
+            return 1
+        print(f"{name:<32} {recursive:>14} {stack_seconds * 1000:>9.1f}")
+    return 0
+
+
+def bench_fusion(args):
+    from obfuscator_passes import Obfuscator
+    from pipeline import Pipeline
+
+    class FullWalk(traversal.Phase):
+        """A phase that visits every node and changes nothing, to time walks alone."""
+
+        def leave_default(self, node, parent):
+            return node
+
+    def obfuscate(program, fuse):
+        obfuscator = Obfuscator(fuse=fuse)
+        random.seed(0)
+        with contextlib.redirect_stdout(io.StringIO()):
+            program = obfuscator.apply_passes(program)
+        return program, obfuscator.walk_count
+
+    def walk_phases(program, count, fuse):
+        phases = [FullWalk(None) for _ in range(count)]
+        for walk_phases in traversal.plan_walks(phases) if fuse else [[phase] for phase in phases]:
+            program = traversal.walk(program, walk_phases, None)
+        return program
+
+    pipeline = Pipeline(frontend="native")
+    print(f"{'source':<32} {'work':<24} {'walks':>5} {'separate ms':>11} {'fused':>5} {'fused ms':>9}")
+    for name, source_text in _load_sources(args.files, args.functions, args.statements):
+        program = pipeline.source_to_ast(source_text, name)
+        print(f"{name[-32:]:<32} {count_nodes(program)} nodes")
+        (separate_tree, separate_walks), (fused_tree, fused_walks) = [obfuscate(copy.deepcopy(program), fuse)
+                                                                      for fuse in (False, True)]
+        difference = first_ast_difference(separate_tree, fused_tree)
+        if difference:
+            print(f"{name[-32:]:<32} DIFFERENT: fused and separate walks disagree at {difference}")
+            return 1
+        separate_seconds = _best_of_on_copies(args.repeat, program, lambda tree: obfuscate(tree, False))
+        fused_seconds = _best_of_on_copies(args.repeat, program, lambda tree: obfuscate(tree, True))
+        print(f"{name[-32:]:<32} {'rename + dead code':<24} {separate_walks:>5} {separate_seconds * 1000:>11.2f} "
+              f"{fused_walks:>5} {fused_seconds * 1000:>9.2f}")
+        for count in (2, 4, 8):
+            separate_seconds = _best_of(args.repeat, walk_phases, program, count, False)[0]
+            fused_seconds = _best_of(args.repeat, walk_phases, program, count, True)[0]
+            print(f"{name[-32:]:<32} {f'{count} full no-op walks':<24} {count:>5} {separate_seconds * 1000:>11.2f} "
+                  f"{1:>5} {fused_seconds * 1000:>9.2f}")
+        print(f"{name[-32:]:<32} fused and separate walks give identical trees")
+    return 0
+
+
+def bench_analyses(args):
+    from analyses import AnalysisManager, Callees
+    from obfuscator_passes import DeadCodeInsertionPass, Obfuscator, ScopedRenamingPass
+    from pipeline import Pipeline
+
+    class Recompute(AnalysisManager):
+        """An AnalysisManager that computes every analysis again on every request."""
+
+        def get(self, analysis, function):
+            self.misses[analysis] = self.misses.get(analysis, 0) + 1
+            return analysis.run(function, self)
+
+    class QueryFunctions(traversal.Phase):
+        """Asks for each function's analyses, as a pass that inspects functions would."""
+        needs = frozenset({"names", "statements"})
+
+        def __init__(self, owner):
+            super().__init__(owner.update)
+            self.owner = owner
+
+        def enter_programnode(self, node):
+            return None
+
+        def enter_default(self, node):
+            return traversal.SKIP
+
+        def enter_functiondefnode(self, node):
+            self.owner.results.append((self.owner.analyses.get(LocalSymbols, node),
+                                       self.owner.analyses.get(Callees, node)))
+            return traversal.SKIP
+
+    class QueryPass(ObfuscationPass):
+        def __init__(self, results):
+            super().__init__()
+            self.results = results
+
+        def phases(self):
+            return [QueryFunctions(self)]
+
+    def obfuscate(program, manager_class):
+        # Renaming, then a few low-probability dead code passes with analysis users after each.
+        results = []
+        obfuscator = Obfuscator(techniques=[])
+        obfuscator.analyses = manager_class()
+        obfuscator.passes = [ScopedRenamingPass(), QueryPass(results)]
+        for _ in range(3):
+            obfuscator.passes += [DeadCodeInsertionPass(probability=0.01), QueryPass(results), QueryPass(results)]
+        for obfuscation_pass in obfuscator.passes:
+            obfuscation_pass.name_gen = obfuscator.names
+            obfuscation_pass.analyses = obfuscator.analyses
+        random.seed(0)
+        with contextlib.redirect_stdout(io.StringIO()):
+            program = obfuscator.apply_passes(program)
+        return program, results, obfuscator.analyses
+
+    def variants(program, manager_class):
+        # The default passes, as Pipeline.obfuscate_variants() runs them: dead code on one renamed tree.
+        obfuscator = Obfuscator(persistent=True)
+        obfuscator.analyses = manager_class()
+        for obfuscation_pass in obfuscator.passes:
+            obfuscation_pass.analyses = obfuscator.analyses
+        with contextlib.redirect_stdout(io.StringIO()):
+            trees = list(obfuscator.variants(program, args.variants, seed=0))
+        return trees, obfuscator.analyses
+
+    pipeline = Pipeline(frontend="native")
+    print(f"{'source':<32} {'analyses':<22} {'ms':>9} {'LocalSymbols hits/misses':>25} {'Callees hits/misses':>20}")
+    for name, source_text in _load_sources(args.files, args.functions, args.statements):
+        program = pipeline.source_to_ast(source_text, name)
+        (recomputed_tree, recomputed_results, _), (cached_tree, cached_results, _) = [
+            obfuscate(copy.deepcopy(program), manager_class) for manager_class in (Recompute, AnalysisManager)]
+        if cached_results != recomputed_results:
+            print(f"{name[-32:]:<32} DIFFERENT: cached analyses disagree with recomputed ones")
+            return 1
+        difference = first_ast_difference(recomputed_tree, cached_tree)
+        if difference:
+            print(f"{name[-32:]:<32} DIFFERENT: trees disagree at {difference}")
+            return 1
+        for label, manager_class in (("recompute", Recompute), ("cached", AnalysisManager)):
+            managers = []
+            seconds = _best_of_on_copies(args.repeat, program,
+                                         lambda tree: managers.append(obfuscate(tree, manager_class)[2]))
+            counters = managers[-1].counters()
+            local_symbols, callees = counters["LocalSymbols"], counters["Callees"]
+            print(f"{name[-32:]:<32} {label:<22} {seconds * 1000:>9.2f} {f'{local_symbols[0]}/{local_symbols[1]}':>25} "
+                  f"{f'{callees[0]}/{callees[1]}':>20}")
+
+        recomputed_trees, _ = variants(program, Recompute)
+        cached_trees, _ = variants(program, AnalysisManager)
+        for recomputed_tree, cached_tree in zip(recomputed_trees, cached_trees):
+            difference = first_ast_difference(recomputed_tree, cached_tree)
+            if difference:
+                print(f"{name[-32:]:<32} DIFFERENT: variants disagree at {difference}")
+                return 1
+        for label, manager_class in (("recompute", Recompute), ("cached", AnalysisManager)):
+            seconds, (_, manager) = _best_of(args.repeat, variants, program, manager_class)
+            local_symbols = manager.counters()["LocalSymbols"]
+            print(f"{name[-32:]:<32} {f'{args.variants} variants, {label}':<22} {seconds * 1000:>9.2f} "
+                  f"{f'{local_symbols[0]}/{local_symbols[1]}':>25} {'-':>20}")
+        print(f"{name[-32:]:<32} cached and recomputed analyses and trees are identical")
+    return 0
+
+
+class IdentifierRenamingPass(ObfuscationPass):
+    """The two-walk renamer ScopedRenamingPass replaced, as the reference for bench_renaming.
+
+    The first walk picks one flat rename map per function; the second
+    renames every identifier by the maps of the whole program, so names
+    shadowed in nested blocks collapse into one.
+    """
+
+    def __init__(self, rename_functions=True, rename_variables=True, rename_parameters=True, persistent=False):
+        super().__init__(persistent)
+        self.rename_functions = rename_functions
+        self.rename_variables = rename_variables
+        self.rename_parameters = rename_parameters
+        self.global_symbol_map = {}
+        # Function renames decided outside this AST, e.g. for the rest of the
+        # program when only some of its functions are obfuscated.
+        self.preset_symbol_map = {}
+        # FunctionDefNode -> its local rename map (symbol ID -> symbol ID), from the definition phase.
+        self.function_scope_maps = {}
+        # Symbol ID -> renamed symbol ID or None, for the scope being visited.
+        self.renamed_symbols = []
+        # Local rename map of the function being visited, if any.
+        self.scope_map = None
+
+    def phases(self):
+        return [_RenameDefinitions(self), _RenameUses(self)]
+
+    def _new_symbol(self, original_name):
+        return SYMBOLS.intern(self.name_gen.new_name(original_name))
+
+
+class _RenameDefinitions(traversal.Phase):
+    """Picks new names for functions, and for each function's parameters and locals."""
+    reads = frozenset({"names", "statements"})
+    writes = frozenset({"rename_plan"})
+
+    def __init__(self, renamer):
+        super().__init__(renamer.update)
+        self.renamer = renamer
+
+    def begin(self, root):
+        renamer = self.renamer
+        renamer.name_gen.reset()
+        renamer.global_symbol_map = dict(renamer.preset_symbol_map)
+        renamer.function_scope_maps = {}
+
+    def enter_programnode(self, node):
+        return None
+
+    def enter_default(self, node):
+        return traversal.SKIP
+
+    def enter_functiondefnode(self, node):
+        renamer = self.renamer
+        original_func_name = node.name.name
+        if renamer.rename_functions and original_func_name not in renamer.global_symbol_map:
+            if original_func_name not in ["main", "printf", "scanf"]:  # Exclude built-ins/entry
+                renamer.global_symbol_map[original_func_name] = renamer.name_gen.new_name(original_func_name)
+
+        params, local_vars = renamer.analyses.get(LocalSymbols, node)
+        current_function_local_map = {}
+        if renamer.rename_parameters:
+            for symbol_id in params:
+                current_function_local_map[symbol_id] = renamer._new_symbol(SYMBOLS.names[symbol_id])
+        if renamer.rename_variables:
+            for symbol_id in local_vars:
+                if symbol_id not in current_function_local_map:
+                    current_function_local_map[symbol_id] = renamer._new_symbol(SYMBOLS.names[symbol_id])
+        renamer.function_scope_maps[node] = current_function_local_map
+        return traversal.SKIP
+
+
+class _RenameUses(traversal.Phase):
+    """Renames every identifier by the plan _RenameDefinitions made for the whole program."""
+    needs = frozenset({"rename_plan"})
+    reads = writes = frozenset({"names"})
+
+    def __init__(self, renamer):
+        super().__init__(renamer.update)
+        self.renamer = renamer
+        # Per function being visited: (original name's symbol ID, shadowed renames, enclosing scope map,
+        # renames before it).
+        self.functions = []
+        # Original symbol IDs of the variables being declared.
+        self.declared = []
+        # Identifiers renamed so far, to tell which functions changed.
+        self.renames = 0
+
+    def begin(self, root):
+        renamer = self.renamer
+        global_renames = [(SYMBOLS.intern(original_name), SYMBOLS.intern(new_name))
+                          for original_name, new_name in renamer.global_symbol_map.items()
+                          if original_name not in ["printf", "scanf"]]
+        renamer.renamed_symbols = [None] * len(SYMBOLS)
+        for symbol_id, new_symbol_id in global_renames:
+            renamer.renamed_symbols[symbol_id] = new_symbol_id
+
+    def end(self, root):
+        self.renamer.function_scope_maps = {}
+        self.renamer.renamed_symbols = []
+
+    def enter_functiondefnode(self, node):
+        renamer = self.renamer
+        retrieved_local_map = renamer.function_scope_maps.get(node, {})
+        # Locals shadow globals in renamed_symbols until the function is done.
+        renamed_symbols = renamer.renamed_symbols
+        shadowed = [(symbol_id, renamed_symbols[symbol_id]) for symbol_id in retrieved_local_map]
+        for symbol_id, new_symbol_id in retrieved_local_map.items():
+            renamed_symbols[symbol_id] = new_symbol_id
+        self.functions.append((node.name.symbol_id, shadowed, renamer.scope_map, self.renames))
+        renamer.scope_map = retrieved_local_map
+
+    def leave_functiondefnode(self, node, parent):
+        renamer = self.renamer
+        original_symbol_id, shadowed, renamer.scope_map, renames = self.functions.pop()
+        for symbol_id, previous in shadowed:
+            renamer.renamed_symbols[symbol_id] = previous
+        if self.renames != renames:
+            renamer.function_modified(node)
+        # The function's own name follows the global plan only, whatever the locals shadow.
+        symbol_id = original_symbol_id
+        original_func_name = SYMBOLS.names[original_symbol_id]
+        if renamer.rename_functions and original_func_name in renamer.global_symbol_map:
+            symbol_id = SYMBOLS.intern(renamer.global_symbol_map[original_func_name])
+        return self.update(node, name=self.update(node.name, symbol_id=symbol_id))
+
+    def enter_paramnode(self, node):
+        return traversal.SKIP
+
+    def leave_paramnode(self, node, parent):
+        scope_map = self.renamer.scope_map
+        if self.renamer.rename_parameters:
+            if scope_map and node.name and node.name.symbol_id in scope_map:
+                self.renames += 1
+                name = self.update(node.name, symbol_id=scope_map[node.name.symbol_id])
+                return self.update(node, name=name)
+        return node
+
+    def enter_vardeclnode(self, node):
+        self.declared.append(node.name.symbol_id if node.name else None)
+
+    def leave_vardeclnode(self, node, parent):
+        # The declared name follows the function's scope map only.
+        symbol_id = self.declared.pop()
+        scope_map = self.renamer.scope_map
+        if self.renamer.rename_variables and scope_map and symbol_id in scope_map:
+            symbol_id = scope_map[symbol_id]
+            self.renames += 1
+        if node.name:
+            return self.update(node, name=self.update(node.name, symbol_id=symbol_id))
+        return node
+
+    def leave_identifiernode(self, node, parent):
+        new_symbol_id = self.renamer.renamed_symbols[node.symbol_id]
+        if new_symbol_id is not None:
+            self.renames += 1
+            return self.update(node, symbol_id=new_symbol_id)
+        return node
+
+
+def _shadowing_program(functions):
+    """Functions that call each other forwards and redeclare their variables in nested blocks and for loops."""
+    lines = []
+    for i in range(functions):
+        callee = f"f_{(i + 1) % functions}"
+        lines += [f"int f_{i}(int a) {{",
+                  "    int x = a;",
+                  "    {",
+                  "        int x = 2;",
+                  "        a = a + x;",
+                  "        {",
+                  "            char x = 'c';",
+                  "            a = a - x;",
+                  "        }",
+                  "    }",
+                  "    for (int x = 0; x < 3; x = x + 1) {",
+                  f"        a = a + x + {callee}(x);",
+                  "    }",
+                  "    return x + a;",
+                  "}"]
+    lines += ["int main() {", "    return f_0(1);", "}"]
+    return "\n".join(lines) + "\n"
+
+
+def _binding_structure(program, drop_unused=False):
+    """Each identifier of `program` in order, as the position of the declaration it refers to under C's
+    block scoping, or as its name if it refers to none.
+
+    drop_unused=True leaves out the declarations of variables that are never
+    referred to, so inserted dead code only shows if it captures a reference.
+    """
+    declarations = {}
+    functions = [d for d in program.declarations if isinstance(d, custom_ast.FunctionDefNode)]
+    for position, function in enumerate(functions):
+        declarations.setdefault(function.name.name, []).append(("function", position))
+    structure = []
+    # Indices into `structure` of the declarations themselves.
+    declared_at = set()
+    scopes = []
+    counter = 0
+    pending = [(program, False)]
+    while pending:
+        node, leaving = pending.pop()
+        if leaving:
+            for name in scopes.pop():
+                declarations[name].pop()
+            continue
+        if isinstance(node, list):
+            pending.extend((item, False) for item in reversed(node))
+            continue
+        if not isinstance(node, custom_ast.Node):
+            continue
+        opens_scope = isinstance(node, (custom_ast.FunctionDefNode, custom_ast.BlockNode, custom_ast.ForNode))
+        if opens_scope:
+            scopes.append([])
+            pending.append((node, True))
+        if isinstance(node, (custom_ast.ParamNode, custom_ast.VarDeclNode)):
+            counter += 1
+            declarations.setdefault(node.name.name, []).append(("variable", counter))
+            scopes[-1].append(node.name.name)
+            declared_at.add(len(structure))
+            structure.append(("variable", counter))
+            pending.append((node.initializer if isinstance(node, custom_ast.VarDeclNode) else None, False))
+            continue
+        if isinstance(node, custom_ast.IdentifierNode):
+            bound = declarations.get(node.name)
+            structure.append(bound[-1] if bound else node.name)
+            continue
+        pending.extend((getattr(node, field), False) for field in reversed(node._child_fields))
+    if drop_unused:
+        referenced = {entry for i, entry in enumerate(structure) if i not in declared_at}
+        numbers = {}
+        kept = []
+        for i, entry in enumerate(structure):
+            if i in declared_at and entry not in referenced:
+                continue
+            if isinstance(entry, tuple) and entry[0] == "variable":
+                entry = ("variable", numbers.setdefault(entry[1], len(numbers) + 1))
+            kept.append(entry)
+        structure = kept
+    return structure
+
+
+def bench_renaming(args):
+    from obfuscator_passes import Obfuscator, ScopedRenamingPass
+    from pipeline import Pipeline
+
+    if args.files:
+        sources = _load_sources(args.files, args.functions, args.statements)
+    else:
+        functions = args.functions * 10
+        sources = [(f"<generated {functions}x3>", generate_program(functions, 3)),
+                   (f"<shadowing x{functions}>", _shadowing_program(functions))]
+
+    def rename(program, renaming_class):
+        renaming_pass = renaming_class()
+        visited = traversal.nodes_visited
+        walks = len(traversal.plan_walks(renaming_pass.phases()))
+        program = renaming_pass.apply(program)
+        return program, walks, traversal.nodes_visited - visited
+
+    def obfuscate(program):
+        # The default techniques; dead code may only add variables nobody refers to.
+        obfuscator = Obfuscator()
+        visited = traversal.nodes_visited
+        random.seed(0)
+        program = obfuscator.apply_passes(program)
+        return program, obfuscator.walk_count, traversal.nodes_visited - visited
+
+    # (label, function, whether unused variables are left out of the bindings, whether they must be kept)
+    runs = [("IdentifierRenamingPass", lambda tree: rename(tree, IdentifierRenamingPass), False, False),
+            ("ScopedRenamingPass", lambda tree: rename(tree, ScopedRenamingPass), False, True),
+            ("rename + dead code", obfuscate, True, True)]
+    pipeline = Pipeline(frontend="native")
+    print(f"{'source':<32} {'pass':<24} {'walks':>5} {'visited':>8} {'ms':>9}  bindings")
+    for name, source_text in sources:
+        program = pipeline.source_to_ast(source_text, name)
+        for label, run, drop_unused, required in runs:
+            original = _binding_structure(program, drop_unused)
+            result, walks, visited = run(copy.deepcopy(program))
+            # Reparsed, so the check also covers the generated code.
+            kept = _binding_structure(pipeline.source_to_ast(pipeline.generate(result), name), drop_unused) == original
+            seconds = _best_of_on_copies(args.repeat, program, run)
+            print(f"{name[-32:]:<32} {label:<24} {walks:>5} {visited:>8} {seconds * 1000:>9.2f}  "
+                  f"{'kept' if kept else 'CHANGED'}")
+            if required and not kept:
+                return 1
+    return 0
+
+
+def bench_ast_builder(args):
+    from ast_builder_visitor import ASTBuilderVisitor, FastASTBuilderVisitor
+    from pipeline import Pipeline
+
+    if args.files:
+        sources = _load_sources(args.files, args.functions, args.statements)
+    else:
+        sources = [(f"<expressions x{args.statements * 100}>", generate_expression_program(args.statements * 100))]
+
+    pipeline = Pipeline()
+    print(f"{'source':<32} {'builder':<24} {'nodes':>8} {'ms':>9} {'us/node':>8}  AST")
+    for name, source_text in sources:
+        parse_tree = pipeline.parse(source_text, name)
+        reference_ast = None
+        for builder in (ASTBuilderVisitor(), FastASTBuilderVisitor()):
+            seconds, program = _best_of(args.repeat, builder.visit, parse_tree)
+            nodes = count_nodes(program)
+            if reference_ast is None:
+                reference_ast = program
+            difference = first_ast_difference(reference_ast, program)
+            print(f"{name[-32:]:<32} {builder.__class__.__name__:<24} {nodes:>8} {seconds * 1000:>9.2f} "
+                  f"{seconds * 1e6 / nodes:>8.2f}  {'identical' if difference is None else 'DIFFERENT: ' + difference}")
+            if difference is not None:
+                return 1
+    return 0
+
+
+def bench_parallel_parse(args):
+    from parallel_parse import ParallelParser
+    from pipeline import Pipeline
+
+    pipeline = Pipeline()
+    worker_counts = [1]
+    while worker_counts[-1] * 2 <= (os.cpu_count() or 1):
+        worker_counts.append(worker_counts[-1] * 2)
+
+    print(f"{'source':<32} {'workers':>8} {'ms':>10} {'speedup':>8}  AST")
+    for name, source_text in _load_sources(args.files, args.functions, args.statements):
+        pipeline.source_to_ast(source_text, name)
+        serial_seconds, reference_ast = _best_of(args.repeat, pipeline.source_to_ast, source_text, name)
+        print(f"{name[-32:]:<32} {'serial':>8} {serial_seconds * 1000:>10.2f} {1:>7.1f}x")
+        for workers in worker_counts:
+            with ParallelParser(workers=workers) as parallel_parser:
+                # The untimed run starts the pool and warms every worker's DFA cache.
+                parallel_parser.parse(source_text, name)
+                seconds, program = _best_of(args.repeat, parallel_parser.parse, source_text, name)
+            difference = first_ast_difference(reference_ast, program)
+            print(f"{name[-32:]:<32} {workers:>8} {seconds * 1000:>10.2f} {serial_seconds / seconds:>7.1f}x  "
+                  f"{'identical' if difference is None else 'DIFFERENT: ' + difference}")
+            if difference is not None:
+                return 1
+    return 0
+
+
+_RSS_CHILD = """
+import resource, sys, time
+from pipeline import Pipeline
+pipeline = Pipeline(frontend=sys.argv[2], input_mode=sys.argv[3])
+baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+start = time.perf_counter()
+program = pipeline.file_to_ast(sys.argv[1])
+elapsed = time.perf_counter() - start
+print(baseline, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, elapsed)
+"""
+
+
+_DFA_CHILD = """
+import sys, time
+start = time.perf_counter()
+if sys.argv[1] != "-":
+    from dfa_cache import load_dfa
+    if not load_dfa(sys.argv[1]):
+        sys.exit("could not load " + sys.argv[1])
+from pipeline import Pipeline
+pipeline = Pipeline()
+print(time.perf_counter() - start)
+for path in sys.argv[2:]:
+    start = time.perf_counter()
+    pipeline.file_to_ast(path)
+    print(time.perf_counter() - start)
+"""
+
+
+def bench_dfa_warmup(args):
+    # Each configuration needs a fresh interpreter, since the DFA cache lives on the parser class.
+    here = os.path.dirname(os.path.abspath(__file__))
+    with tempfile.TemporaryDirectory() as directory:
+        training_dir = os.path.join(directory, "training")
+        os.makedirs(training_dir)
+        for seed in range(5):
+            with open(os.path.join(training_dir, f"train_{seed}.mc"), 'w') as f:
+                f.write(generate_program(args.functions, args.statements, seed=1000 + seed))
+        if args.files:
+            paths = args.files
+        else:
+            paths = []
+            for seed in range(10):
+                paths.append(os.path.join(directory, f"file_{seed}.mc"))
+                with open(paths[-1], 'w') as f:
+                    f.write(generate_program(args.functions, args.statements, seed=seed))
+
+        dfa_path = os.path.join(directory, "minic.dfa")
+        completed = subprocess.run([sys.executable, "dfa_cache.py", training_dir, "-o", dfa_path],
+                                   cwd=here, capture_output=True, text=True)
+        if completed.returncode != 0:
+            print(completed.stderr)
+            return 1
+        print(completed.stdout.strip())
+
+        print(f"{'DFA cache':<10} {'startup ms':>11} {'first file ms':>14} {'steady ms':>10}")
+        for label, dfa_argument in (("cold", "-"), ("loaded", dfa_path)):
+            first_times, steady_times, startup_times = [], [], []
+            for _ in range(args.repeat):
+                completed = subprocess.run([sys.executable, "-c", _DFA_CHILD, dfa_argument] + paths,
+                                           cwd=here, capture_output=True, text=True)
+                if completed.returncode != 0:
+                    print(completed.stderr)
+                    return 1
+                startup, first, *rest = [float(value) for value in completed.stdout.split()[-len(paths) - 1:]]
+                startup_times.append(startup)
+                first_times.append(first)
+                steady_times.append(sum(rest) / len(rest) if rest else first)
+            print(f"{label:<10} {min(startup_times) * 1000:>11.2f} {min(first_times) * 1000:>14.2f} "
+                  f"{min(steady_times) * 1000:>10.2f}")
+    return 0
+
+
+def bench_input_memory(args):
+    # Peak RSS can only grow within a process, so every configuration runs in a fresh interpreter.
+    configurations = [("antlr", "memory"), ("antlr-stream", "memory"), ("antlr-stream", "mmap")]
+    temporary_path = None
+    if args.files:
+        paths = args.files
+    else:
+        with tempfile.NamedTemporaryFile('w', suffix=".mc", delete=False) as f:
+            f.write(generate_program(args.functions, args.statements))
+            temporary_path = f.name
+        paths = [temporary_path]
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    try:
+        print(f"{'source':<32} {'frontend':<13} {'input':<7} {'MiB':>8} {'s':>8} {'base RSS':>9} {'peak RSS':>9} {'delta':>8}")
+        for path in paths:
+            size = os.path.getsize(path)
+            for frontend, input_mode in configurations:
+                completed = subprocess.run([sys.executable, "-c", _RSS_CHILD, path, frontend, input_mode],
+                                           cwd=here, capture_output=True, text=True)
+                if completed.returncode != 0:
+                    print(completed.stderr)
+                    return 1
+                baseline_kib, peak_kib, seconds = completed.stdout.split()[-3:]
+                baseline_mib, peak_mib = int(baseline_kib) / 1024, int(peak_kib) / 1024
+                print(f"{path[-32:]:<32} {frontend:<13} {input_mode:<7} {size / 2 ** 20:>8.2f} {float(seconds):>8.2f} "
+                      f"{baseline_mib:>9.1f} {peak_mib:>9.1f} {peak_mib - baseline_mib:>8.1f}")
+    finally:
+        if temporary_path:
+            os.remove(temporary_path)
+    return 0
+
+
+BENCHMARKS = {
+    "frontend": (bench_frontend, "ANTLR parser + ASTBuilderVisitor vs. native_frontend (also checks the ASTs match)"),
+    "ast-builder": (bench_ast_builder, "per-node cost of ASTBuilderVisitor vs. FastASTBuilderVisitor"),
+    "dfa-warmup": (bench_dfa_warmup, "first-file and steady-state parse latency with and without a warmed DFA cache"),
+    "input-memory": (bench_input_memory, "peak RSS (MiB) of in-memory vs. mmap + windowed token stream input"),
+    "parallel-parse": (bench_parallel_parse, "serial parse vs. ParallelParser with 1, 2, 4, ... workers (checks the ASTs match)"),
+    "lexer": (bench_lexer, "MiniCLexer vs. RegexLexer throughput in MB/s (also checks the tokens match)"),
+    "arena": (bench_arena, "object tree vs. ASTArena: memory, conversion, copy, histogram, generate and obfuscate"),
+    "binary-ast": (bench_binary_ast, "pickle vs. ast_binary size and speed, lazy mmap loading (checks byte-exact codegen)"),
+    "dispatch": (bench_dispatch, "visit dispatch and generic traversal: getattr + dir() vs. per-class dispatch tables"),
+    "analyses": (bench_analyses, "per-function analyses recomputed on every request vs. cached until invalidated"),
+    "renaming": (bench_renaming, "two-walk flat-map renaming vs. single-walk block-scoped renaming on function-heavy code"),
+    "fusion": (bench_fusion, "obfuscation passes and no-op phases in separate walks vs. fused into shared walks"),
+    "traversal": (bench_traversal, "recursive vs. explicit-stack passes and code generator, and 100k-deep inputs"),
+    "variants": (bench_variants, "time and retained memory of N obfuscated variants: reparse vs. deepcopy vs. persistent"),
+    "symbols": (bench_symbols, "AST memory, renaming and code generation time on identifier-heavy code"),
+    "node-memory": (bench_node_memory, "bytes per AST node with the old __dict__ layout vs. __slots__ vs. shared leaves"),
+    "parse-memory": (bench_parse_memory, "time and peak traced memory of building the AST with each frontend"),
+}
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Performance benchmarks for the Mini-C obfuscator.")
+    arg_parser.add_argument("benchmark", choices=sorted(BENCHMARKS), help="which benchmark to run")
+    arg_parser.add_argument("files", nargs="*", help="Mini-C sources to use instead of a generated program")
+    arg_parser.add_argument("--functions", type=int, default=20, help="functions in the generated program")
+    arg_parser.add_argument("--statements", type=int, default=20, help="statements per generated function")
+    arg_parser.add_argument("--depth", type=int, default=100000, help="nesting depth for the traversal benchmark")
+    arg_parser.add_argument("--variants", type=int, default=100, help="obfuscated variants for the variants benchmark")
+    arg_parser.add_argument("--repeat", type=int, default=3, help="timed repetitions, best is reported")
+    args = arg_parser.parse_args()
+
+    benchmark, _ = BENCHMARKS[args.benchmark]
+    sys.exit(benchmark(args))
+
+
+if __name__ == '__main__':
+    main()
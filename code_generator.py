@@ -1,6 +1,17 @@
+import logging
+
 import ast_nodes as ast
+import traversal
+from symbols import SYMBOLS
+
+logger = logging.getLogger(__name__)
+
 
 class CodeGenerator:
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._dispatch = ast.DispatchTable(cls, cls.generic_visit)
+
     def __init__(self):
         self.indent_level = 0
         self.output_parts = []
@@ -26,40 +37,37 @@ class CodeGenerator:
         return "".join(self.output_parts)
 
     def visit(self, node):
-        if node is None:
-            return
-        method_name = 'visit_' + node.__class__.__name__.lower()
-        visitor_method = getattr(self, method_name, self.generic_visit)
-        return visitor_method(node)
+        # visit_* methods with children are generators that yield them; see traversal.run().
+        return traversal.run(self, node)
 
     def generic_visit(self, node):
-        print(f"Warning: CodeGenerator has no specific visit method for {node.__class__.__name__}")
+        logger.warning("CodeGenerator has no specific visit method for %s", node.__class__.__name__)
         self._emit(f"/* Unhandled AST node in CodeGenerator: {node.__class__.__name__} */")
 
     def visit_programnode(self, node: ast.ProgramNode):
         for i, decl in enumerate(node.declarations):
-            self.visit(decl)
+            yield decl
             if i < len(node.declarations) - 1:
                 self._emit("\n") 
 
     def visit_functiondefnode(self, node: ast.FunctionDefNode):
         self._emit(self._indent_str()) 
-        self.visit(node.return_type)
+        yield node.return_type
         self._emit(f" {node.name.name}(") 
         if node.params:
             for i, param in enumerate(node.params):
-                self.visit(param)
+                yield param
                 if i < len(node.params) - 1:
                     self._emit(", ")
         self._emit(") {\n") 
         self.indent_level += 1
         if node.body: 
-            self.visit(node.body) 
+            yield node.body 
         self.indent_level -= 1
         self._emit_line("}") 
 
     def visit_paramnode(self, node: ast.ParamNode):
-        self.visit(node.param_type)
+        yield node.param_type
         self._emit(f" {node.name.name}") 
 
     def visit_typenode(self, node: ast.TypeNode):
@@ -68,38 +76,38 @@ class CodeGenerator:
     def visit_blocknode(self, node: ast.BlockNode):
         if node.statements:
             for stmt in node.statements:
-                self.visit(stmt)
+                yield stmt
 
     def visit_vardeclnode(self, node: ast.VarDeclNode):
         self._emit(self._indent_str()) 
-        self.visit(node.var_type)
+        yield node.var_type
         self._emit(f" {node.name.name}") 
         if node.initializer:
             self._emit(" = ")
-            self.visit(node.initializer)
+            yield node.initializer
         self._emit(";\n") 
 
     def visit_assignmentnode(self, node: ast.AssignmentNode):
-        self.visit(node.lvalue) 
+        yield node.lvalue 
         self._emit(" = ")
-        self.visit(node.rvalue)
+        yield node.rvalue
 
     def visit_ifnode(self, node: ast.IfNode):
         self._emit(self._indent_str()) 
         self._emit("if (")
-        self.visit(node.condition)
+        yield node.condition
         self._emit(") ")
         
         if isinstance(node.then_block, ast.BlockNode):
             self._emit("{\n")
             self.indent_level += 1
-            self.visit(node.then_block) 
+            yield node.then_block 
             self.indent_level -= 1
             self._emit_line("}") 
         else: 
             self._emit("\n") 
             self.indent_level += 1
-            self.visit(node.then_block) 
+            yield node.then_block 
             self.indent_level -= 1
 
         if node.else_block:
@@ -107,30 +115,30 @@ class CodeGenerator:
             if isinstance(node.else_block, ast.BlockNode):
                 self._emit("{\n")
                 self.indent_level += 1
-                self.visit(node.else_block)
+                yield node.else_block
                 self.indent_level -= 1
                 self._emit_line("}")
             else: 
                 self._emit("\n")
                 self.indent_level += 1
-                self.visit(node.else_block)
+                yield node.else_block
                 self.indent_level -= 1
 
     def visit_whilenode(self, node: ast.WhileNode):
         self._emit(self._indent_str())
         self._emit("while (")
-        self.visit(node.condition)
+        yield node.condition
         self._emit(") ")
         if isinstance(node.body, ast.BlockNode):
             self._emit("{\n")
             self.indent_level += 1
-            self.visit(node.body)
+            yield node.body
             self.indent_level -= 1
             self._emit_line("}")
         else: 
             self._emit("\n")
             self.indent_level += 1
-            self.visit(node.body)
+            yield node.body
             self.indent_level -= 1
 
     def visit_fornode(self, node: ast.ForNode):
@@ -138,31 +146,31 @@ class CodeGenerator:
         self._emit("for (")
         if node.init:
             if isinstance(node.init, ast.VarDeclNode):
-                self.visit(node.init.var_type)
+                yield node.init.var_type
                 self._emit(f" {node.init.name.name}")
                 if node.init.initializer:
                     self._emit(" = ")
-                    self.visit(node.init.initializer)
+                    yield node.init.initializer
             else: 
-                self.visit(node.init)
+                yield node.init
         self._emit("; ") 
         if node.condition:
-            self.visit(node.condition)
+            yield node.condition
         self._emit("; ") 
         if node.update:
-            self.visit(node.update)
+            yield node.update
         self._emit(") ") 
 
         if isinstance(node.body, ast.BlockNode):
             self._emit("{\n")
             self.indent_level += 1
-            self.visit(node.body)
+            yield node.body
             self.indent_level -= 1
             self._emit_line("}")
         else: 
             self._emit("\n")
             self.indent_level += 1
-            self.visit(node.body)
+            yield node.body
             self.indent_level -= 1
 
     def visit_returnnode(self, node: ast.ReturnNode):
@@ -170,22 +178,22 @@ class CodeGenerator:
         self._emit("return")
         if node.expr:
             self._emit(" ")
-            self.visit(node.expr)
+            yield node.expr
         self._emit(";\n")
 
     def visit_functioncallnode(self, node: ast.FunctionCallNode):
-        self.visit(node.name) 
+        yield node.name 
         self._emit("(")
         if node.args:
             for i, arg in enumerate(node.args):
-                self.visit(arg)
+                yield arg
                 if i < len(node.args) - 1:
                     self._emit(", ")
         self._emit(")")
 
     def visit_exprstatementnode(self, node: ast.ExprStatementNode):
         self._emit(self._indent_str()) 
-        self.visit(node.expr)
+        yield node.expr
         self._emit(";\n") 
 
     def visit_binaryopnode(self, node: ast.BinaryOpNode):
@@ -193,26 +201,26 @@ class CodeGenerator:
         is_right_complex = isinstance(node.right, ast.BinaryOpNode)
 
         if is_left_complex: self._emit("(")
-        self.visit(node.left)
+        yield node.left
         if is_left_complex: self._emit(")")
 
         self._emit(f" {node.op} ")
 
         if is_right_complex: self._emit("(")
-        self.visit(node.right)
+        yield node.right
         if is_right_complex: self._emit(")")
 
     def visit_unaryopnode(self, node: ast.UnaryOpNode):
         self._emit(node.op)
         if isinstance(node.expr, ast.BinaryOpNode): 
              self._emit("(")
-             self.visit(node.expr)
+             yield node.expr
              self._emit(")")
         else:
-             self.visit(node.expr)
+             yield node.expr
 
     def visit_identifiernode(self, node: ast.IdentifierNode):
-        self._emit(node.name)
+        self._emit(SYMBOLS.names[node.symbol_id])
 
     def visit_numberliteralnode(self, node: ast.NumberLiteralNode):
         self._emit(str(node.value))
@@ -236,4 +244,7 @@ class CodeGenerator:
         self._emit(f'"{escaped_value}"')
 
     def visit_boolliteralnode(self, node: ast.BoolLiteralNode):
-        self._emit("true" if node.value else "false")
\ No newline at end of file
+        self._emit("true" if node.value else "false")
+
+
+CodeGenerator._dispatch = ast.DispatchTable(CodeGenerator, CodeGenerator.generic_visit)
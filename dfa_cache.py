@@ -0,0 +1,118 @@
+import argparse
+import hashlib
+import os
+import pickle
+import sys
+import tempfile
+
+import antlr4
+
+from generated_parser import MiniCLexer as lexer_module
+from generated_parser import MiniCParser as parser_module
+from generated_parser.MiniCLexer import MiniCLexer
+from generated_parser.MiniCParser import MiniCParser
+
+DFA_CACHE_VERSION = 1
+
+# Pickling follows ATN transitions recursively.
+_PICKLE_RECURSION_LIMIT = 20000
+
+_installed_path = None
+
+
+def grammar_key():
+    digest = hashlib.sha256(f"dfa-cache-v{DFA_CACHE_VERSION}".encode())
+    for module in (lexer_module, parser_module):
+        with open(module.__file__, 'rb') as f:
+            digest.update(f.read())
+    # The pickles hold runtime objects, so a reinstalled runtime invalidates
+    # them. Its file stamp stands in for the version, which would need
+    # importlib.metadata, itself slower to import than a warm-up.
+    runtime = os.stat(antlr4.__file__)
+    digest.update(f"{antlr4.__file__}:{runtime.st_size}:{runtime.st_mtime_ns}".encode())
+    return digest.hexdigest()
+
+
+def dfa_state_count():
+    return {name: sum(len(dfa._states) for dfa in recognizer.decisionsToDFA)
+            for name, recognizer in (("lexer", MiniCLexer), ("parser", MiniCParser))}
+
+
+def _with_recursion_limit(func, *args):
+    previous = sys.getrecursionlimit()
+    sys.setrecursionlimit(max(previous, _PICKLE_RECURSION_LIMIT))
+    try:
+        return func(*args)
+    finally:
+        sys.setrecursionlimit(previous)
+
+
+def export_dfa(path):
+    """Write the DFA state that MiniCLexer and MiniCParser have built so far to `path`.
+
+    The DFA states point into their ATN, so each ATN is saved along with its
+    DFA list and both are installed together by load_dfa().
+    """
+    state = {"grammar": grammar_key(),
+             "lexer": (MiniCLexer.atn, MiniCLexer.decisionsToDFA),
+             "parser": (MiniCParser.atn, MiniCParser.decisionsToDFA)}
+    data = _with_recursion_limit(pickle.dumps, state, pickle.HIGHEST_PROTOCOL)
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temporary_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.replace(temporary_path, path)
+
+
+def load_dfa(path):
+    """Install the DFA state saved by export_dfa() as the class-level ATN and DFA cache.
+
+    Only lexers and parsers created afterwards use it, so call this before
+    building a Pipeline. Returns False, leaving the current state alone, if
+    the file is missing, unreadable or was made for a different grammar.
+    """
+    global _installed_path
+    if path == _installed_path:
+        return True
+    try:
+        with open(path, 'rb') as f:
+            state = _with_recursion_limit(pickle.load, f)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        return False
+    if not isinstance(state, dict) or state.get("grammar") != grammar_key():
+        return False
+    MiniCLexer.atn, MiniCLexer.decisionsToDFA = state["lexer"]
+    MiniCParser.atn, MiniCParser.decisionsToDFA = state["parser"]
+    _installed_path = path
+    return True
+
+
+def main():
+    from batch import collect_jobs
+    from pipeline import Pipeline, PipelineError
+
+    arg_parser = argparse.ArgumentParser(description="Warm the ANTLR DFA cache on a training corpus and save it.")
+    arg_parser.add_argument("sources", nargs="+", help="input files, directories or glob patterns")
+    arg_parser.add_argument("-o", "--output", required=True, help="DFA cache file to write")
+    args = arg_parser.parse_args()
+
+    jobs, problems = collect_jobs(args.sources, "")
+    for source, message in problems:
+        print(f"{source}: {message}")
+    pipeline = Pipeline()
+    parsed = 0
+    for input_path, _ in jobs:
+        try:
+            pipeline.file_to_ast(input_path)
+            parsed += 1
+        except (OSError, UnicodeDecodeError, PipelineError) as e:
+            print(f"{input_path}: {e}")
+
+    export_dfa(args.output)
+    counts = dfa_state_count()
+    print(f"Parsed {parsed} of {len(jobs)} file(s); saved {counts['parser']} parser and "
+          f"{counts['lexer']} lexer DFA state(s) to '{args.output}'.")
+
+
+if __name__ == '__main__':
+    main()
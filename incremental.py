@@ -0,0 +1,224 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+
+from ast_cache import tool_fingerprint
+from obfuscator_passes import ScopedRenamingPass
+from pipeline import FRONTENDS, PARSE_MODES, Pipeline, PipelineError
+from source_splitter import SourceSplitError, split_top_level_functions
+
+STATE_FORMAT_VERSION = 1
+UNRENAMED_FUNCTIONS = ("main", "printf", "scanf")
+
+_IDENTIFIER = re.compile(r"[a-zA-Z_][a-zA-Z_0-9]*")
+
+
+class IncrementalObfuscator:
+    """Re-obfuscates only the function definitions that changed since the last run.
+
+    The source is cut into top-level function spans with
+    source_splitter.split_top_level_functions, and each span is parsed,
+    obfuscated and generated on its own. Output per span is stored in a JSON
+    state file, keyed by the span text and the renames of the functions it
+    mentions, so unchanged functions are spliced back in without parsing.
+
+    To keep independently obfuscated functions consistent, function renames
+    are kept in a program-wide map that only grows (obf_1, obf_2, ... in
+    order of first appearance), and each function's locals and dead code
+    variables are named after its own obfuscated name (obf_3_1, obf_3_d1,
+    main_1, ...). The output therefore differs from a whole-program run, but
+    is the same whichever functions were rebuilt.
+
+    Spans go through the pipeline's obfuscate() and generate(), so their
+    passes share walks as usual and `metrics` and `tracer` (see Pipeline)
+    record each rebuilt span.
+    """
+
+    def __init__(self, state_path, techniques=None, parse_mode="ll", frontend="antlr", metrics=None, tracer=None):
+        self.state_path = state_path
+        self.pipeline = Pipeline(techniques=techniques, parse_mode=parse_mode, frontend=frontend,
+                                 metrics=metrics, tracer=tracer)
+        self.fingerprint = self._fingerprint()
+        self.global_map = {}
+        self.outputs = {}
+        self.reused = 0
+        self.rebuilt = 0
+        self.timings = {}
+        self._load_state()
+
+    def _fingerprint(self):
+        digest = hashlib.sha256(tool_fingerprint())
+        here = os.path.dirname(os.path.abspath(__file__))
+        for file_name in ("obfuscator_passes.py", "analyses.py", "traversal.py", "code_generator.py", "incremental.py"):
+            with open(os.path.join(here, file_name), 'rb') as f:
+                digest.update(f.read())
+        for obfuscation_pass in self.pipeline.obfuscator.passes:
+            digest.update(obfuscation_pass.__class__.__name__.encode())
+        return digest.hexdigest()
+
+    def _load_state(self):
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return
+        if state.get("version") != STATE_FORMAT_VERSION or state.get("fingerprint") != self.fingerprint:
+            return
+        self.global_map = state["global_map"]
+        self.outputs = state["functions"]
+
+    def _save_state(self):
+        state = {"version": STATE_FORMAT_VERSION, "fingerprint": self.fingerprint,
+                 "global_map": self.global_map, "functions": self.outputs}
+        directory = os.path.dirname(os.path.abspath(self.state_path))
+        fd, temporary_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(temporary_path, self.state_path)
+
+    def _update_global_map(self, spans):
+        used = set(self.global_map.values())
+        counter = 0
+        for span in spans:
+            if span.name is None or span.name in UNRENAMED_FUNCTIONS or span.name in self.global_map:
+                continue
+            name = ""
+            while not name or name in used:
+                counter += 1
+                name = f"obf_{counter}"
+            used.add(name)
+            self.global_map[span.name] = name
+
+    def _span_key(self, span_text):
+        mentioned = {name: self.global_map[name] for name in set(_IDENTIFIER.findall(span_text))
+                     if name in self.global_map}
+        digest = hashlib.sha256(span_text.encode('utf-8'))
+        digest.update(json.dumps(sorted(mentioned.items())).encode('utf-8'))
+        return digest.hexdigest()
+
+    def _obfuscate_span(self, span, span_text, source_name):
+        # Locals and dead code variables share the function's own name space.
+        self.pipeline.obfuscator.names.prefix = f"{self.global_map.get(span.name, span.name)}_"
+        for obfuscation_pass in self.pipeline.obfuscator.passes:
+            if isinstance(obfuscation_pass, ScopedRenamingPass):
+                obfuscation_pass.preset_symbol_map = self.global_map
+
+        with self.pipeline.source_scope():
+            try:
+                program = self.pipeline.source_to_ast(span_text, source_name)
+            except PipelineError as e:
+                # Line numbers inside the message are relative to the function.
+                raise PipelineError(f"{e} (in the function definition starting at line {span.line})")
+            return self.pipeline.generate(self.pipeline.obfuscate(program))
+
+    def update(self, source_text, source_name="<string>"):
+        """Return the obfuscated program, rebuilding only functions not seen before."""
+        self.reused = 0
+        self.rebuilt = 0
+        self.timings = {}
+
+        start = time.perf_counter()
+        try:
+            spans = split_top_level_functions(source_text)
+        except SourceSplitError as e:
+            raise PipelineError(f"Splitting failed for '{source_name}': {e}")
+        self._update_global_map(spans)
+        self.timings["split"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        outputs = {}
+        parts = []
+        for span in spans:
+            span_text = source_text[span.start:span.end]
+            key = self._span_key(span_text)
+            output = outputs.get(key)
+            if output is None:
+                output = self.outputs.get(key)
+            if output is None:
+                output = self._obfuscate_span(span, span_text, source_name)
+                self.rebuilt += 1
+            else:
+                self.reused += 1
+            outputs[key] = output
+            parts.append(output)
+        self.timings["obfuscate"] = time.perf_counter() - start
+
+        # Outputs of functions that no longer exist are dropped; their names
+        # stay in global_map so nobody else's rename shifts.
+        self.outputs = outputs
+        start = time.perf_counter()
+        self._save_state()
+        self.timings["save_state"] = time.perf_counter() - start
+        return "\n".join(parts)
+
+    def update_file(self, input_path, output_path):
+        with open(input_path, 'r', encoding='utf-8') as f:
+            source_text = f.read()
+        generated_code = self.update(source_text, input_path)
+        with open(output_path, 'w', encoding='utf-8') as f:
+            f.write(generated_code)
+        return generated_code
+
+
+def _run_once(obfuscator, input_path, output_path):
+    start = time.perf_counter()
+    try:
+        obfuscator.update_file(input_path, output_path)
+    except (OSError, UnicodeDecodeError, PipelineError) as e:
+        print(f"Error: {e}")
+        return False
+    elapsed = time.perf_counter() - start
+    print(f"Wrote '{output_path}': {obfuscator.rebuilt} function(s) rebuilt, "
+          f"{obfuscator.reused} reused in {elapsed * 1000:.1f} ms.")
+    return True
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description="Obfuscate a Mini-C file, re-processing only the functions changed since the last run.")
+    arg_parser.add_argument("input_file", help="Path to the input Mini-C file")
+    arg_parser.add_argument("output_file", nargs="?", default="output.mc", help="Path to the output file")
+    arg_parser.add_argument("--state", default=None,
+                            help="state file of the previous run (default: <output_file>.incremental.json)")
+    arg_parser.add_argument("--techniques", nargs="+", default=None,
+                            help="obfuscation techniques (default: rename_identifiers dead_code)")
+    arg_parser.add_argument("--parse-mode", choices=PARSE_MODES, default="ll",
+                            help="'sll' tries fast SLL prediction first and falls back to full LL on failure")
+    arg_parser.add_argument("--frontend", choices=FRONTENDS, default="antlr",
+                            help="'native' parses with the hand-written parser instead of ANTLR")
+    arg_parser.add_argument("--watch", action="store_true", help="keep running and update whenever the input changes")
+    arg_parser.add_argument("--interval", type=float, default=0.5, help="seconds between checks in --watch mode")
+    args = arg_parser.parse_args()
+
+    state_path = args.state or args.output_file + ".incremental.json"
+    obfuscator = IncrementalObfuscator(state_path, techniques=args.techniques, parse_mode=args.parse_mode,
+                                       frontend=args.frontend)
+    if not args.watch:
+        if not _run_once(obfuscator, args.input_file, args.output_file):
+            sys.exit(1)
+        return
+
+    print(f"Watching '{args.input_file}' (Ctrl+C to stop)...")
+    last_seen = None
+    try:
+        while True:
+            try:
+                stat = os.stat(args.input_file)
+                seen = (stat.st_mtime_ns, stat.st_size)
+            except OSError:
+                seen = None
+            if seen is not None and seen != last_seen:
+                last_seen = seen
+                _run_once(obfuscator, args.input_file, args.output_file)
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
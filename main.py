@@ -1,98 +1,177 @@
-import sys
-from antlr4 import FileStream, CommonTokenStream, InputStream, tree
+import contextlib
+import time
 
-from generated_parser.MiniCLexer import MiniCLexer
-from generated_parser.MiniCParser import MiniCParser
+_main_started = time.perf_counter()
 
-from ast_builder_visitor import ASTBuilderVisitor
-import ast_nodes as custom_ast
+import argparse
+import logging
+import sys
 
-import code_generator
-from obfuscator_passes import Obfuscator
+from options import AST_BACKENDS, FRONTENDS, INPUT_MODES, LEXER_MODES, PARSE_MODES
 
+logger = logging.getLogger(__name__)
 
-print(f"DEBUG: Path to imported 'code_generator' module: {code_generator.__file__}")
+LOG_LEVELS = ("debug", "info", "warning", "error")
+METRICS_FORMATS = ("table", "jsonl")
 
 
+def print_stage_timings(timings):
+    logger.info("--- Stage Timings ---")
+    for stage, seconds in timings.items():
+        logger.info("%12s: %9.3f ms", stage, seconds * 1000)
+    logger.info("%12s: %9.3f ms", "total", sum(timings.values()) * 1000)
 
-def main():
-    if len(sys.argv) < 2:
-        print("Usage: python main.py <input_file.mc> [output_file.mc]")
-        sys.exit(1)
 
-    input_filepath = sys.argv[1]
-    output_filepath = "output.mc"
-    if len(sys.argv) > 2:
-        output_filepath = sys.argv[2]
+def print_startup_timings(startup):
+    logger.info("--- Startup (since main.py started) ---")
+    for stage in ("imports", "pipeline", "first token"):
+        if stage in startup:
+            logger.info("%12s: %9.3f ms", stage, startup[stage] * 1000)
+        else:
+            logger.info("%12s: %9s", stage, "n/a")
 
-    try:
-        input_stream = FileStream(input_filepath, encoding='utf-8')
-    except FileNotFoundError:
-        print(f"Error: Input file '{input_filepath}' not found.")
-        sys.exit(1)
-    except Exception as e:
-        print(f"Error reading input file: {e}")
-        sys.exit(1)
 
-    print(f"Attempting to parse '{input_filepath}'...")
+def write_metrics(metrics, metrics_format, path):
+    with open(path, 'w') if path else contextlib.nullcontext(sys.stdout) as f:
+        if metrics_format == "jsonl":
+            metrics.write_jsonl(f)
+        else:
+            f.write(metrics.summary_table() + "\n")
 
-    lexer = MiniCLexer(input_stream)
-    stream = CommonTokenStream(lexer)
-    parser = MiniCParser(stream)
 
-    parse_tree = parser.program()
+def record_first_token(lexer, startup):
+    def first_next_token():
+        del lexer.nextToken
+        startup["first token"] = time.perf_counter() - _main_started
+        return lexer.nextToken()
 
-    if parser.getNumberOfSyntaxErrors() > 0:
-        print(f"Parsing failed for '{input_filepath}' due to {parser.getNumberOfSyntaxErrors()} syntax error(s).")
-        sys.exit(1)
-
-    print("ANTLR parsing successful. Building custom AST...")
+    lexer.nextToken = first_next_token
 
-    ast_builder = ASTBuilderVisitor()
-    custom_ast_tree = ast_builder.visit(parse_tree)
 
-    if not custom_ast_tree or not isinstance(custom_ast_tree, custom_ast.ProgramNode):
-        print("Custom AST construction failed or did not produce a ProgramNode.")
-        if custom_ast_tree:
-            print(f"AST Builder returned type: {type(custom_ast_tree)}")
-        sys.exit(1)
-
-    print("Custom AST built successfully.")
+def main():
+    arg_parser = argparse.ArgumentParser(description="Obfuscate a Mini-C source file.")
+    arg_parser.add_argument("input_file", help="Mini-C source to obfuscate")
+    arg_parser.add_argument("output_file", nargs="?", default="output.mc", help="where to write the result")
+    arg_parser.add_argument("--parse-mode", choices=PARSE_MODES, default="ll",
+                            help="'sll' tries fast SLL prediction first and falls back to full LL on failure")
+    arg_parser.add_argument("--frontend", choices=FRONTENDS, default="antlr",
+                            help="'native' parses with the hand-written parser instead of ANTLR")
+    arg_parser.add_argument("--input-mode", choices=INPUT_MODES, default="memory",
+                            help="'mmap' reads the file through a memory map and a windowed token stream")
+    arg_parser.add_argument("--parse-jobs", type=int, default=1,
+                            help="parse the file's function definitions in this many worker processes")
+    arg_parser.add_argument("--lexer", choices=LEXER_MODES, default="antlr",
+                            help="'regex' lexes with one compiled regex instead of the generated ANTLR lexer")
+    arg_parser.add_argument("--ast-backend", choices=AST_BACKENDS, default="objects",
+                            help="'arena' obfuscates a flat array copy of the AST (see ast_arena.py)")
+    arg_parser.add_argument("--shared-leaves", action="store_true",
+                            help="share one read-only node per type, boolean, small integer and ASCII character")
+    arg_parser.add_argument("--cache-dir", default=None, help="directory of the on-disk AST cache (off by default)")
+    arg_parser.add_argument("--cache-size", type=int, default=512, help="AST cache size limit in MiB")
+    arg_parser.add_argument("--dfa-cache", default=None, help="warmed ANTLR DFA cache written by dfa_cache.py")
+    arg_parser.add_argument("--time-startup", action="store_true",
+                            help="report time from startup to imports done, pipeline ready and first token lexed")
+    arg_parser.add_argument("--log-level", choices=LOG_LEVELS, default="info",
+                            help="'debug' also prints each pass and the generated code, 'warning' only problems")
+    arg_parser.add_argument("--metrics", choices=METRICS_FORMATS, default=None,
+                            help="record time, node counts and output size per stage and pass (see metrics.py)")
+    arg_parser.add_argument("--metrics-out", default=None, help="write the metrics here instead of to stdout")
+    arg_parser.add_argument("--metrics-memory", action="store_true",
+                            help="also record each stage's peak traced memory (slows every stage down)")
+    arg_parser.add_argument("--trace", default=None, metavar="OUT_JSON",
+                            help="write nested stage, pass and function spans in Chrome trace-event format")
+    args = arg_parser.parse_args()
+    logging.basicConfig(level=args.log_level.upper(), format="%(message)s", stream=sys.stdout)
+    # Only now, so -h and argument errors do not wait for the pipeline (and the ANTLR runtime) to load.
+    from pipeline import Pipeline, PipelineError
+    startup = {"imports": time.perf_counter() - _main_started}
+
+    input_filepath = args.input_file
+    output_filepath = args.output_file
 
     techniques_to_apply = ["rename_identifiers", "dead_code"]
+    metrics = None
+    if args.metrics:
+        from metrics import Metrics
+        metrics = Metrics(memory=args.metrics_memory)
+    tracer = None
+    if args.trace:
+        from tracing import Tracer
+        tracer = Tracer(process_name="main.py")
+    try:
+        if args.dfa_cache and args.frontend != "native":
+            from dfa_cache import load_dfa
+            if not load_dfa(args.dfa_cache):
+                logger.warning("Warning: DFA cache '%s' is missing, unreadable or for another grammar; "
+                               "starting cold.", args.dfa_cache)
+        cache = None
+        if args.cache_dir:
+            from ast_cache import ASTCache
+            cache = ASTCache(args.cache_dir, max_bytes=args.cache_size * 2 ** 20)
+        pipeline = Pipeline(techniques=techniques_to_apply, parse_mode=args.parse_mode,
+                            frontend=args.frontend, input_mode=args.input_mode, cache=cache,
+                            parse_jobs=args.parse_jobs, lexer_mode=args.lexer, ast_backend=args.ast_backend,
+                            shared_leaves=args.shared_leaves, metrics=metrics, tracer=tracer)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    startup["pipeline"] = time.perf_counter() - _main_started
+    if args.time_startup and pipeline.lexer is not None:
+        record_first_token(pipeline.lexer, startup)
 
-    obfuscator = Obfuscator(techniques=techniques_to_apply)
+    logger.info("Attempting to parse '%s'...", input_filepath)
+    file_started = tracer.now() if tracer is not None else None
 
-    print("\n--- Applying Obfuscation Passes ---")
-    modified_ast = obfuscator.apply_passes(custom_ast_tree)
-    print("--- Obfuscation Complete ---\n")
+    try:
+        custom_ast_tree = pipeline.file_to_ast(input_filepath)
+    except FileNotFoundError:
+        print(f"Error: Input file '{input_filepath}' not found.")
+        sys.exit(1)
+    except OSError as e:
+        print(f"Error reading input file: {e}")
+        sys.exit(1)
+    except PipelineError as e:
+        print(e)
+        sys.exit(1)
+    finally:
+        pipeline.close()
 
+    if cache is not None:
+        logger.info("AST cache %s in '%s'.", 'hit' if cache.hits else 'miss', args.cache_dir)
+    if pipeline.sll_fallbacks:
+        logger.info("SLL prediction failed, re-parsed with full LL.")
+    logger.info("Custom AST built successfully.")
 
-    generator = code_generator.CodeGenerator()
+    logger.info("\n--- Applying Obfuscation Passes ---")
+    modified_ast = pipeline.obfuscate(custom_ast_tree)
+    logger.info("--- Obfuscation Complete ---\n")
 
-    print(f"Type of generator object: {type(generator)}")
-    print(f"Attributes of generator object (dir(generator)): {dir(generator)}")
-    if hasattr(generator, 'generate'):
-        print("Generator object HAS 'generate' attribute.")
-    else:
-        print(
-            "Generator object DOES NOT HAVE 'generate' attribute. Check the file printed by the DEBUG line at the top.")
+    generated_code = pipeline.generate(modified_ast)
+    if tracer is not None:
+        tracer.complete(input_filepath, "file", file_started)
 
-    generated_code = generator.generate(modified_ast)  # This line was causing the error
+    print_stage_timings(pipeline.timings)
+    if args.time_startup:
+        print_startup_timings(startup)
 
-    print("\n--- Generated (Obfuscated) Code ---")
-    print(generated_code)
-    print("--- End Generated (Obfuscated) Code ---\n")
+    logger.debug("\n--- Generated (Obfuscated) Code ---\n%s\n--- End Generated (Obfuscated) Code ---\n",
+                 generated_code)
 
     if output_filepath:
         try:
             with open(output_filepath, 'w') as f:
                 f.write(generated_code)
-            print(f"Generated code written to '{output_filepath}'")
+            logger.info("Generated code written to '%s'", output_filepath)
         except Exception as e:
             print(f"Error writing to output file '{output_filepath}': {e}")
             sys.exit(1)
 
+    if metrics is not None:
+        metrics.close()
+        write_metrics(metrics, args.metrics, args.metrics_out)
+    if tracer is not None:
+        tracer.write(args.trace)
+
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
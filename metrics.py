@@ -0,0 +1,296 @@
+import contextlib
+import json
+import time
+import tracemalloc
+
+import ast_nodes as ast
+import traversal
+from stage import StageResult
+
+# The fields of a record, in output order.
+FIELDS = ("source", "stage", "wall_ms", "cpu_ms", "nodes_visited", "nodes_created", "nodes_removed",
+          "peak_kib", "output_bytes")
+
+
+def _key(node):
+    arena = getattr(node, "_arena", None)
+    return node if arena is None else (id(arena), node._index)
+
+
+def node_keys(root):
+    """The distinct nodes of the tree under `root`, as keys that stay the same for ast_arena views."""
+    keys = set()
+    pending = [root]
+    while pending:
+        node = pending.pop()
+        if node is None:
+            continue
+        if isinstance(node, ast.Node):
+            keys.add(_key(node))
+            pending.extend(getattr(node, field) for field in node._child_fields)
+        else:  # a list, or an ast_arena.ArenaList
+            pending.extend(node)
+    return keys
+
+
+def _changed_nodes(old_values, new_values, before, known):
+    """(created, removed) node counts of replacing `old_values` by `new_values`, child fields' values, in a tree.
+
+    Only the nodes that differ are looked at: the walk stops at nodes in
+    `before` (the tree's nodes when the stage started) and in `known` (those
+    already made since), and adds the ones it creates to `known`.
+    """
+    created = 0
+    kept = set()
+    pending = list(new_values)
+    while pending:
+        node = pending.pop()
+        if isinstance(node, ast.Node):
+            key = _key(node)
+            if key in before or key in known:
+                kept.add(key)
+                continue
+            known.add(key)
+            created += 1
+            pending.extend(getattr(node, field) for field in node._child_fields)
+        elif node is not None:
+            pending.extend(node)
+    removed = 0
+    pending = list(old_values)
+    while pending:
+        node = pending.pop()
+        if isinstance(node, ast.Node):
+            key = _key(node)
+            if key in kept or key not in before:
+                continue
+            removed += 1
+            pending.extend(getattr(node, field) for field in node._child_fields)
+        elif node is not None:
+            pending.extend(node)
+    return created, removed
+
+
+class _PhaseCounts:
+    __slots__ = ("wall", "cpu", "created", "removed")
+
+    def __init__(self):
+        self.wall = self.cpu = 0.0
+        self.created = self.removed = 0
+
+
+def _timed(function, counts):
+    def timed(*args):
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            return function(*args)
+        finally:
+            counts.wall += time.perf_counter() - wall
+            counts.cpu += time.process_time() - cpu
+    return timed
+
+
+class _TimedHooks(dict):
+    """A phase's enter_ or leave_ dispatch table (see traversal.Phase) whose hooks add their time to a _PhaseCounts."""
+
+    def __init__(self, hooks, counts):
+        super().__init__()
+        self.hooks = hooks
+        self.counts = counts
+
+    def __missing__(self, node_class):
+        hook = self.hooks[node_class]
+        if hook is not None:
+            hook = _timed(hook, self.counts)
+        self[node_class] = hook
+        return hook
+
+
+class Metrics:
+    """One record per stage of each source the pipeline handles.
+
+    A record has the FIELDS: wall and CPU time, the AST nodes run() and
+    walk() visited, the nodes created and removed (the difference between
+    the trees the stage started from and left), the peak of memory allocated
+    above what was allocated when the stage started, and the bytes of text
+    it produced. Fields that do not apply to a stage are None. Stages can
+    be nested (a pass within "obfuscate"); the time the inner ones spend
+    counting nodes is left out of the outer one's. The passes whose phases
+    share a walk each get a record of their part of it (see phases()).
+
+    memory=True traces allocations with tracemalloc, which slows every stage
+    down severalfold; otherwise peak_kib is None. count_nodes=False skips
+    the extra walks that count nodes created and removed.
+    """
+
+    def __init__(self, memory=False, count_nodes=True):
+        self.memory = memory
+        self.count_nodes = count_nodes
+        self.records = []
+        # Name of the source being handled, put in each record.
+        self.source = None
+        self._open = []
+        self._started_tracing = False
+
+    @contextlib.contextmanager
+    def stage(self, name, tree=None):
+        """Measure the code in the with block as stage `name`.
+
+        `tree` is the AST the stage starts from, if any. The block is given a
+        StageResult to put what it produced in.
+        """
+        result = StageResult()
+        overhead_wall, overhead_cpu = time.perf_counter(), time.process_time()
+        before = node_keys(tree) if self.count_nodes and tree is not None else None
+        if self.memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracing = True
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+        result._before = before
+        self._open.append(result)
+        visited = traversal.nodes_visited
+        cpu = time.process_time()
+        wall = time.perf_counter()
+        overhead_wall, overhead_cpu = wall - overhead_wall, cpu - overhead_cpu
+        try:
+            yield result
+        finally:
+            self._open.pop()
+        end_wall, end_cpu = time.perf_counter(), time.process_time()
+        wall = end_wall - wall - result._overhead_wall
+        cpu = end_cpu - cpu - result._overhead_cpu
+        visited = traversal.nodes_visited - visited
+        peak_kib = None
+        if self.memory:
+            # Stages within this one reset the peak, so they pass theirs on.
+            peak = max(tracemalloc.get_traced_memory()[1], result._peak)
+            for outer in self._open:
+                outer._peak = max(outer._peak, peak)
+            peak_kib = round((peak - baseline) / 1024, 1)
+        created = removed = None
+        if self.count_nodes and (before is not None or result.tree is not None):
+            before = before or set()
+            after = node_keys(result.tree) if result.tree is not None else set()
+            created, removed = len(after - before), len(before - after)
+        if self.memory:
+            tracemalloc.reset_peak()
+        overhead_wall += time.perf_counter() - end_wall
+        overhead_cpu += time.process_time() - end_cpu
+        for outer in self._open:
+            outer._overhead_wall += overhead_wall
+            outer._overhead_cpu += overhead_cpu
+        result.wall = wall
+        result._before = None
+        self._record(name, wall, cpu, visited or None, created, removed, peak_kib,
+                     None if result.output is None else len(result.output.encode('utf-8')))
+
+    def _record(self, name, wall, cpu, visited=None, created=None, removed=None, peak_kib=None, output_bytes=None):
+        self.records.append({
+            "source": self.source, "stage": name, "wall_ms": round(wall * 1000, 3), "cpu_ms": round(cpu * 1000, 3),
+            "nodes_visited": visited, "nodes_created": created, "nodes_removed": removed, "peak_kib": peak_kib,
+            "output_bytes": output_bytes,
+        })
+
+    @contextlib.contextmanager
+    def phases(self, stage, phases, names, update):
+        """Record the part each of `phases` has in the walk in the with block, as a stage named by `names`.
+
+        For traversal.Phases sharing a walk: `stage` is the walk's own
+        StageResult and `update` the one given to traversal.walk(). The with
+        block gets the `update` to walk with instead. A phase's record has the
+        time of its begin(), end() and hooks, and the nodes its changes
+        through its own update() created and removed. Copies of the nodes
+        above a change, which the walk's update makes in persistent mode, are
+        counted for the walk only.
+        """
+        counts = [_PhaseCounts() for _ in phases]
+        originals = [phase.update for phase in phases]
+        known = set()
+        count_nodes = self.count_nodes and stage._before is not None
+        for phase, phase_counts in zip(phases, counts):
+            phase._enter = _TimedHooks(type(phase)._enter, phase_counts)
+            phase._leave = _TimedHooks(type(phase)._leave, phase_counts)
+            phase.begin = _timed(phase.begin, phase_counts)
+            phase.end = _timed(phase.end, phase_counts)
+            if count_nodes:
+                phase.update = self._counting_update(phase.update, phase_counts, stage._before, known)
+
+        def walk_update(node, **changes):
+            result = update(node, **changes)
+            if result is not node:
+                known.add(_key(result))
+            return result
+
+        try:
+            yield walk_update if count_nodes else update
+        finally:
+            for phase, original in zip(phases, originals):
+                for attribute in ("_enter", "_leave", "begin", "end"):
+                    delattr(phase, attribute)
+                phase.update = original
+        for name, phase_counts in zip(names, counts):
+            self._record(name, phase_counts.wall, phase_counts.cpu, None,
+                         phase_counts.created if count_nodes else None, phase_counts.removed if count_nodes else None)
+
+    def _counting_update(self, update, counts, before, known):
+        def counting_update(node, **changes):
+            fields = [field for field in changes if field in node._child_fields]
+            old_values = [getattr(node, field) for field in fields]
+            result = update(node, **changes)
+            start_wall, start_cpu = time.perf_counter(), time.process_time()
+            if result is not node:
+                created, removed = _changed_nodes([node], [result], before, known)
+            else:
+                created, removed = _changed_nodes(old_values, [getattr(node, field) for field in fields],
+                                                  before, known)
+            counts.created += created
+            counts.removed += removed
+            # Left out of the hook that made the change, and of the stages around it.
+            overhead_wall = time.perf_counter() - start_wall
+            overhead_cpu = time.process_time() - start_cpu
+            counts.wall -= overhead_wall
+            counts.cpu -= overhead_cpu
+            for outer in self._open:
+                outer._overhead_wall += overhead_wall
+                outer._overhead_cpu += overhead_cpu
+            return result
+        return counting_update
+
+    def close(self):
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def write_jsonl(self, f):
+        for record in self.records:
+            f.write(json.dumps(record) + "\n")
+
+    def summary_table(self):
+        """The records summed per stage (peak: the largest), as a text table in order of first appearance."""
+        totals = {}
+        for record in self.records:
+            total = totals.get(record["stage"])
+            if total is None:
+                totals[record["stage"]] = total = dict.fromkeys(FIELDS[2:])
+                total["runs"] = 0
+            total["runs"] += 1
+            for field in FIELDS[2:]:
+                value = record[field]
+                if value is not None:
+                    current = total[field] or 0
+                    total[field] = max(current, value) if field == "peak_kib" else current + value
+        columns = ("runs",) + FIELDS[2:]
+        lines = [f"{'stage':<40}" + "".join(f"{column:>14}" for column in columns)]
+        for stage, total in totals.items():
+            cells = []
+            for column in columns:
+                value = total[column]
+                if value is None:
+                    cells.append(f"{'-':>14}")
+                elif isinstance(value, float):
+                    cells.append(f"{value:>14.3f}")
+                else:
+                    cells.append(f"{value:>14}")
+            lines.append(f"{stage[:40]:<40}" + "".join(cells))
+        return "\n".join(lines)
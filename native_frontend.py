@@ -0,0 +1,333 @@
+import logging
+import re
+
+import ast_nodes as custom_ast
+
+logger = logging.getLogger(__name__)
+
+
+class MiniCSyntaxError(Exception):
+    def __init__(self, message, line, column):
+        super().__init__(f"line {line}:{column} {message}")
+        self.line = line
+        self.column = column
+
+
+KEYWORDS = {
+    "int": "INT", "char": "CHAR", "bool": "BOOL",
+    "if": "IF", "else": "ELSE", "while": "WHILE", "for": "FOR", "return": "RETURN",
+    "true": "TRUE", "false": "FALSE",
+}
+
+OPERATORS = {
+    "(": "LPAREN", ")": "RPAREN", "{": "LBRACE", "}": "RBRACE", ";": "SEMICOLON", ",": "COMMA",
+    ">=": "GE", "<=": "LE", "==": "EQ", "!=": "NE", "&&": "AND", "||": "OR",
+    "=": "ASSIGN", ">": "GT", "<": "LT", "!": "NOT",
+    "+": "PLUS", "-": "MINUS", "*": "TIMES", "/": "DIVIDE", "%": "MODULO",
+}
+
+# Alternatives are tried in order, so comments come before '/' and two-character
+# operators before their one-character prefixes to get ANTLR's longest match.
+# The groups are named after the MiniC.g4 lexer rules.
+TOKEN_PATTERN = re.compile(r"""
+    (?P<WS>[ \t\r\n]+)
+  | (?P<LINE_COMMENT>//[^\r\n]*)
+  | (?P<ID>[a-zA-Z_][a-zA-Z_0-9]*)
+  | (?P<NUMBER>[0-9]+)
+  | (?P<CHAR_LITERAL>'(?:[^'\\]|\\.)')
+  | (?P<STRING_LITERAL>"(?:[^"\\]|\\.)*")
+  | (?P<OP>>=|<=|==|!=|&&|\|\||[(){};,=><!+\-*/%])
+""", re.VERBOSE | re.DOTALL)
+
+SKIPPED = ("WS", "LINE_COMMENT")
+
+
+def tokenize(source_text):
+    """Split Mini-C source into (type, text, line, column) tuples, ending with an EOF token.
+
+    Types are the MiniC.g4 token names; lines start at 1 and columns at 0 as in ANTLR.
+    """
+    tokens = []
+    append = tokens.append
+    line = 1
+    line_start = 0
+    pos = 0
+    length = len(source_text)
+    match = TOKEN_PATTERN.match
+
+    while pos < length:
+        m = match(source_text, pos)
+        if m is None:
+            raise MiniCSyntaxError(f"token recognition error at: '{source_text[pos]}'", line, pos - line_start)
+        kind = m.lastgroup
+        text = m.group()
+        if kind not in SKIPPED:
+            if kind == "ID":
+                kind = KEYWORDS.get(text, "ID")
+            elif kind == "OP":
+                kind = OPERATORS[text]
+            append((kind, text, line, pos - line_start))
+        newlines = text.count("\n")
+        if newlines:
+            line += newlines
+            line_start = pos + text.rindex("\n") + 1
+        pos = m.end()
+
+    append(("EOF", "<EOF>", line, pos - line_start))
+    return tokens
+
+
+def decode_char_literal(text):
+    val_str = text[1:-1]
+    if val_str == '\\n':
+        return '\n'
+    elif val_str == '\\t':
+        return '\t'
+    elif val_str == '\\r':
+        return '\r'
+    elif val_str == "\\'":
+        return "'"
+    elif val_str == '\\\\':
+        return '\\'
+    return val_str
+
+
+def decode_string_literal(text):
+    return text[1:-1].replace('\\n', '\n').replace('\\t', '\t').replace('\\r', '\r') \
+        .replace('\\"', '"').replace("\\'", "'").replace('\\\\', '\\')
+
+
+TYPE_TOKENS = frozenset(("INT", "CHAR", "BOOL"))
+UNARY_OPERATORS = frozenset(("PLUS", "MINUS", "NOT"))
+
+# Binding power of each binary operator, mirroring the MiniC.g4 precedence chain
+# from logicalOrExpression down to multiplicativeExpression.
+BINARY_PRECEDENCE = {
+    "OR": 1,
+    "AND": 2,
+    "EQ": 3, "NE": 3,
+    "LT": 4, "LE": 4, "GT": 4, "GE": 4,
+    "PLUS": 5, "MINUS": 5,
+    "TIMES": 6, "DIVIDE": 6, "MODULO": 6,
+}
+
+
+class NativeParser:
+    """Recursive-descent parser for MiniC.g4 that builds ast_nodes without a parse tree.
+
+    Statements are parsed by recursive descent and expressions with a Pratt
+    parser. The resulting AST, including line numbers, matches what
+    ASTBuilderVisitor produces from the ANTLR parse tree.
+    """
+
+    def __init__(self, tokens, leaves=None):
+        self.tokens = tokens
+        self.pos = 0
+        self.leaves = leaves or custom_ast.LeafFactory()
+
+    def _peek(self):
+        return self.tokens[self.pos][0]
+
+    def _advance(self):
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def _expect(self, kind):
+        token = self.tokens[self.pos]
+        if token[0] != kind:
+            self._error(f"expecting {kind}")
+        self.pos += 1
+        return token
+
+    def _error(self, expectation):
+        kind, text, line, column = self.tokens[self.pos]
+        raise MiniCSyntaxError(f"mismatched input '{text}' {expectation}", line, column)
+
+    def parse_program(self):
+        if self._peek() == "EOF":
+            self._error("expecting a function definition")
+        line_no = self.tokens[self.pos][2]
+        declarations = []
+        while self._peek() != "EOF":
+            declarations.append(self.parse_function_definition())
+        return custom_ast.ProgramNode(declarations, line_no=line_no)
+
+    def parse_function_definition(self):
+        return_type = self._parse_type()
+        name_token = self._expect("ID")
+        func_name = custom_ast.IdentifierNode(name_token[1], line_no=name_token[2])
+
+        self._expect("LPAREN")
+        params = []
+        if self._peek() != "RPAREN":
+            params.append(self._parse_parameter())
+            while self._peek() == "COMMA":
+                self.pos += 1
+                params.append(self._parse_parameter())
+        self._expect("RPAREN")
+
+        lbrace = self._expect("LBRACE")
+        body = custom_ast.BlockNode(self._parse_block_content(), line_no=lbrace[2])
+        self._expect("RBRACE")
+        return custom_ast.FunctionDefNode(return_type, func_name, params, body, line_no=return_type.line_no)
+
+    def _parse_type(self):
+        token = self.tokens[self.pos]
+        if token[0] not in TYPE_TOKENS:
+            self._error("expecting {'int', 'char', 'bool'}")
+        self.pos += 1
+        return self.leaves.type_node(token[1], line_no=token[2])
+
+    def _parse_parameter(self):
+        param_type = self._parse_type()
+        name_token = self._expect("ID")
+        return custom_ast.ParamNode(param_type, custom_ast.IdentifierNode(name_token[1], line_no=name_token[2]),
+                                    line_no=param_type.line_no)
+
+    def _parse_block_content(self):
+        statements = []
+        while self._peek() not in ("RBRACE", "EOF"):
+            statements.append(self.parse_statement())
+        return statements
+
+    def parse_statement(self):
+        kind = self._peek()
+        if kind in TYPE_TOKENS:
+            node = self._parse_variable_declaration()
+            self._expect("SEMICOLON")
+            return node
+        elif kind == "IF":
+            return self._parse_if()
+        elif kind == "WHILE":
+            return self._parse_while()
+        elif kind == "FOR":
+            return self._parse_for()
+        elif kind == "RETURN":
+            line_no = self._advance()[2]
+            expr = None
+            if self._peek() != "SEMICOLON":
+                expr = self.parse_expression()
+            self._expect("SEMICOLON")
+            return custom_ast.ReturnNode(expr, line_no=line_no)
+        elif kind == "LBRACE":
+            line_no = self._advance()[2]
+            statements = self._parse_block_content()
+            self._expect("RBRACE")
+            return custom_ast.BlockNode(statements, line_no=line_no)
+
+        line_no = self.tokens[self.pos][2]
+        expr = self.parse_expression()
+        self._expect("SEMICOLON")
+        return custom_ast.ExprStatementNode(expr, line_no=line_no)
+
+    def _parse_variable_declaration(self):
+        var_type = self._parse_type()
+        name_token = self._expect("ID")
+        initializer = None
+        if self._peek() == "ASSIGN":
+            self.pos += 1
+            initializer = self.parse_expression()
+        return custom_ast.VarDeclNode(var_type, custom_ast.IdentifierNode(name_token[1], line_no=name_token[2]),
+                                      initializer, line_no=var_type.line_no)
+
+    def _parse_if(self):
+        line_no = self._advance()[2]
+        self._expect("LPAREN")
+        condition = self.parse_expression()
+        self._expect("RPAREN")
+        then_stmt = self.parse_statement()
+        else_stmt = None
+        if self._peek() == "ELSE":
+            self.pos += 1
+            else_stmt = self.parse_statement()
+        return custom_ast.IfNode(condition, then_stmt, else_stmt, line_no=line_no)
+
+    def _parse_while(self):
+        line_no = self._advance()[2]
+        self._expect("LPAREN")
+        condition = self.parse_expression()
+        self._expect("RPAREN")
+        return custom_ast.WhileNode(condition, self.parse_statement(), line_no=line_no)
+
+    def _parse_for(self):
+        line_no = self._advance()[2]
+        self._expect("LPAREN")
+        init = condition = update = None
+        if self._peek() in TYPE_TOKENS:
+            init = self._parse_variable_declaration()
+        elif self._peek() != "SEMICOLON":
+            init = self.parse_expression()
+        self._expect("SEMICOLON")
+        if self._peek() != "SEMICOLON":
+            condition = self.parse_expression()
+        self._expect("SEMICOLON")
+        if self._peek() != "RPAREN":
+            update = self.parse_expression()
+        self._expect("RPAREN")
+        return custom_ast.ForNode(init, condition, update, self.parse_statement(), line_no=line_no)
+
+    def parse_expression(self):
+        start_line = self.tokens[self.pos][2]
+        left = self._parse_binary(1)
+        if self._peek() == "ASSIGN":
+            assign_token = self._advance()
+            if not isinstance(left, custom_ast.IdentifierNode):
+                logger.warning("Line %s: LHS of assignment is not a simple Identifier. AST structure "
+                               "for AssignmentNode might be problematic.", start_line)
+            return custom_ast.AssignmentNode(left, self.parse_expression(), line_no=assign_token[2])
+        return left
+
+    def _parse_binary(self, min_precedence):
+        left = self._parse_unary()
+        tokens = self.tokens
+        while True:
+            kind, text, line, _ = tokens[self.pos]
+            precedence = BINARY_PRECEDENCE.get(kind)
+            if precedence is None or precedence < min_precedence:
+                return left
+            self.pos += 1
+            right = self._parse_binary(precedence + 1)
+            left = custom_ast.BinaryOpNode(left, text, right, line_no=line)
+
+    def _parse_unary(self):
+        kind, text, line, _ = self.tokens[self.pos]
+        if kind in UNARY_OPERATORS:
+            self.pos += 1
+            return custom_ast.UnaryOpNode(text, self._parse_unary(), line_no=line)
+        return self._parse_primary()
+
+    def _parse_primary(self):
+        kind, text, line, _ = self._advance()
+        if kind == "ID":
+            if self._peek() == "LPAREN":
+                self.pos += 1
+                args = []
+                if self._peek() != "RPAREN":
+                    args.append(self.parse_expression())
+                    while self._peek() == "COMMA":
+                        self.pos += 1
+                        args.append(self.parse_expression())
+                self._expect("RPAREN")
+                return custom_ast.FunctionCallNode(custom_ast.IdentifierNode(text, line_no=line), args, line_no=line)
+            return custom_ast.IdentifierNode(text, line_no=line)
+        elif kind == "NUMBER":
+            return self.leaves.number(int(text), line_no=line)
+        elif kind == "CHAR_LITERAL":
+            return self.leaves.char(decode_char_literal(text), line_no=line)
+        elif kind == "STRING_LITERAL":
+            return custom_ast.StringLiteralNode(decode_string_literal(text), line_no=line)
+        elif kind == "TRUE":
+            return self.leaves.boolean(True, line_no=line)
+        elif kind == "FALSE":
+            return self.leaves.boolean(False, line_no=line)
+        elif kind == "LPAREN":
+            expr = self.parse_expression()
+            self._expect("RPAREN")
+            return expr
+        self.pos -= 1
+        self._error("expecting an expression")
+
+
+def parse_program(source_text):
+    return NativeParser(tokenize(source_text)).parse_program()
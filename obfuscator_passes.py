@@ -1,335 +1,487 @@
+import contextlib
+import logging
 import random
-import string
+
 import ast_nodes as ast
+import traversal
+from analyses import AnalysisManager, Callees, LocalSymbols
+from stage import StageResult
+from symbols import SYMBOLS
+
+logger = logging.getLogger(__name__)
 
 
 class NameGenerator:
+    """Makes names <prefix><tag><number>, counting separately per tag.
+
+    Passes that share a generator under different tags never make the same
+    name, whatever order they ask in.
+    """
+
     def __init__(self, prefix="obf_"):
         self.prefix = prefix
         self.used_names = set()
-        self.counter = 0
+        self.counters = {}
 
-    def new_name(self, original_name=""):
+    def new_name(self, original_name="", tag=""):
         name = ""
         while not name or name in self.used_names:
-            self.counter += 1
-            name = f"{self.prefix}{self.counter}"
+            counter = self.counters[tag] = self.counters.get(tag, 0) + 1
+            name = f"{self.prefix}{tag}{counter}"
         self.used_names.add(name)
         return name
 
     def reset(self):
         self.used_names = set()
-        self.counter = 0
+        self.counters = {}
 
 
 class ObfuscationPass:
-    def __init__(self):
+    """Base class of the passes.
+
+    Visit methods return the node to put in place of the one they were given,
+    and make every change through update(). By default that edits the node
+    in place, or a private copy of it if it is a leaf shared through an
+    ast_nodes.LeafPool. With persistent=True it leaves the input tree
+    untouched: a changed node is replaced by a copy, so the result shares
+    every subtree the pass did not change with the input (see
+    Obfuscator.variants()).
+    Visit methods that have children to visit are generators that yield each
+    child and get its replacement back; traversal.run() drives them from an
+    explicit stack, so deeply nested trees do not hit the recursion limit.
+
+    Per-function facts come from `self.analyses` (an analyses.AnalysisManager,
+    shared by all the passes of an Obfuscator); a pass that changes a
+    function must report it with function_modified(). New names come from
+    `self.name_gen`, which an Obfuscator also shares between its passes, so
+    names made by different passes never clash.
+    """
+    # Whether apply() always gives the same result for the same tree.
+    deterministic = True
+    # Analyses whose results stay valid for the functions this pass modifies.
+    preserves = ()
+
+    def __init__(self, persistent=False):
         self.name_gen = NameGenerator()
-
-    def visit(self, node, symbol_map=None, **kwargs):
-        if node is None:
-            return None
-
-        method_name = 'visit_' + node.__class__.__name__.lower()
-        visitor_method = getattr(self, method_name, self.generic_visit)
-        return visitor_method(node, symbol_map, **kwargs)
-
-    def generic_visit(self, node, symbol_map=None, **kwargs):
-        for attr_name in dir(node):
-            if not attr_name.startswith('_') and attr_name not in ['line_no', 'parent', 'temp_local_scope_map']:
-                try:
-                    attr_value = getattr(node, attr_name)
-                    if isinstance(attr_value, ast.Node):
-                        new_child = self.visit(attr_value, symbol_map, **kwargs)
-                        if new_child is not attr_value:
-                            setattr(node, attr_name, new_child)
-                    elif isinstance(attr_value, list):
-                        new_list_content = []
-                        changed = False
-                        for item in attr_value:
-                            if isinstance(item, ast.Node):
-                                visited_item = self.visit(item, symbol_map, **kwargs)
-                                new_list_content.append(visited_item)
-                                if visited_item is not item:
-                                    changed = True
-                            else:
-                                new_list_content.append(item)
-
-                        if changed:
-                            setattr(node, attr_name, new_list_content)
-                except AttributeError:
-                    pass
+        self.persistent = persistent
+        self.analyses = AnalysisManager()
+
+    def function_modified(self, function):
+        # A persistent pass leaves `function` as it was and changes a copy.
+        if not self.persistent:
+            self.analyses.invalidate(function, self.preserves)
+
+    def update(self, node, **changes):
+        if self.persistent:
+            return ast.replace(node, **changes)
+        for field, value in changes.items():
+            if getattr(node, field) is not value:
+                # A leaf shared through a LeafPool is replaced by a private copy.
+                node = ast.unshare(node)
+                setattr(node, field, value)
         return node
 
-    def apply(self, ast_root):
-        raise NotImplementedError("Each obfuscation pass must implement 'apply'")
-
-
-class IdentifierRenamingPass(ObfuscationPass):
-    def __init__(self, rename_functions=True, rename_variables=True, rename_parameters=True):
-        super().__init__()
-        self.rename_functions = rename_functions
-        self.rename_variables = rename_variables
-        self.rename_parameters = rename_parameters
-        self.global_symbol_map = {}
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._dispatch = ast.DispatchTable(cls, cls.generic_visit)
+
+    def visit(self, node):
+        return traversal.run(self, node)
+
+    def generic_visit(self, node):
+        if not node._child_fields:
+            return node
+        return self._visit_children(node)
+
+    def _visit_children(self, node):
+        changes = {}
+        for field in node._child_fields:
+            value = getattr(node, field)
+            if value is None:
+                continue
+            if isinstance(value, ast.Node):
+                new_child = yield value
+                if new_child is not value:
+                    changes[field] = new_child
+            else:  # a list, or an ast_arena.ArenaList
+                new_items = []
+                changed = False
+                for item in value:
+                    new_item = yield item
+                    new_items.append(new_item)
+                    if new_item is not item:
+                        changed = True
+                if changed:
+                    changes[field] = new_items
+        return self.update(node, **changes) if changes else node
+
+    def phases(self):
+        """The walks this pass is made of, as traversal.Phase objects, or None if it only has apply().
+
+        Obfuscator fuses the phases of consecutive passes into as few walks
+        as traversal.plan_walks() allows.
+        """
+        return None
 
     def apply(self, ast_root):
+        phases = self.phases()
+        if phases is None:
+            raise NotImplementedError("Each obfuscation pass must implement 'apply' or 'phases'")
         self.name_gen.reset()
-        self.global_symbol_map = {}
-        self.visit(ast_root, is_definition_phase=True)
-        self.visit(ast_root, is_definition_phase=False)
+        for walk_phases in traversal.plan_walks(phases):
+            ast_root = traversal.walk(ast_root, walk_phases, self.update)
         return ast_root
 
-    def visit_programnode(self, node, symbol_map=None, **kwargs):
-        if node.declarations:
-            for i in range(len(node.declarations)):
-                node.declarations[i] = self.visit(node.declarations[i], symbol_map, **kwargs)
-        return node
-
-    def visit_functiondefnode(self, node, symbol_map=None, **kwargs):
-        is_definition_phase = kwargs.get('is_definition_phase')
-        original_func_name = node.name.name
-
-        if is_definition_phase:
-            if self.rename_functions and original_func_name not in self.global_symbol_map:
-                if original_func_name not in ["main", "printf", "scanf"]:  # Exclude built-ins/entry
-                    self.global_symbol_map[original_func_name] = self.name_gen.new_name(original_func_name)
-
-            current_function_local_map = {}
-            if self.rename_parameters and node.params:
-                for param in node.params:
-                    if param.name and param.name.name:  # Ensure param and its name exist
-                        original_param_name = param.name.name
-                        current_function_local_map[original_param_name] = self.name_gen.new_name(original_param_name)
-
-            if self.rename_variables and node.body:
-                self._collect_local_vars_for_map(node.body, current_function_local_map)
-            node.temp_local_scope_map = current_function_local_map  # Attach map to node
-
-        else:
-            if self.rename_functions and original_func_name in self.global_symbol_map:
-                node.name.name = self.global_symbol_map[original_func_name]
-
-            retrieved_local_map = getattr(node, 'temp_local_scope_map', {})
-
-            if self.rename_parameters and node.params:
-                for i in range(len(node.params)):
-                    # ParamNode itself needs to be visited to rename its IdentifierNode (name)
-                    node.params[i] = self.visit(node.params[i], symbol_map,
-                                                current_function_scope_map=retrieved_local_map, **kwargs)
-
-            if node.body:
-                body_kwargs = kwargs.copy()
-                body_kwargs['current_function_scope_map'] = retrieved_local_map
-                node.body = self.visit(node.body, symbol_map, **body_kwargs)
-        return node
-
-    def _collect_local_vars_for_map(self, node_to_scan, local_map):
-        if isinstance(node_to_scan, ast.BlockNode) and node_to_scan.statements:
-            for stmt in node_to_scan.statements:
-                self._collect_local_vars_for_map(stmt, local_map)
-        elif isinstance(node_to_scan, ast.VarDeclNode):
-            if node_to_scan.name and node_to_scan.name.name:
-                original_var_name = node_to_scan.name.name
-                if original_var_name not in local_map:
-                    local_map[original_var_name] = self.name_gen.new_name(original_var_name)
-        elif isinstance(node_to_scan, ast.IfNode):
-            if node_to_scan.then_block: self._collect_local_vars_for_map(node_to_scan.then_block, local_map)
-            if node_to_scan.else_block: self._collect_local_vars_for_map(node_to_scan.else_block, local_map)
-        elif isinstance(node_to_scan, ast.WhileNode) and node_to_scan.body:
-            self._collect_local_vars_for_map(node_to_scan.body, local_map)
-        elif isinstance(node_to_scan, ast.ForNode):
-            if node_to_scan.init and isinstance(node_to_scan.init, ast.VarDeclNode):
-                self._collect_local_vars_for_map(node_to_scan.init, local_map)  # Var in for-init
-            if node_to_scan.body: self._collect_local_vars_for_map(node_to_scan.body, local_map)
-
-    def visit_paramnode(self, node, symbol_map=None, **kwargs):
-        is_definition_phase = kwargs.get('is_definition_phase')
-        current_function_scope_map = kwargs.get('current_function_scope_map')
-        if not is_definition_phase and self.rename_parameters:
-            if current_function_scope_map and node.name and node.name.name in current_function_scope_map:
-                node.name.name = current_function_scope_map[node.name.name]
 
-        return node
+ObfuscationPass._dispatch = ast.DispatchTable(ObfuscationPass, ObfuscationPass.generic_visit)
 
-    def visit_vardeclnode(self, node, symbol_map=None, **kwargs):
-        is_definition_phase = kwargs.get('is_definition_phase')
-        current_function_scope_map = kwargs.get('current_function_scope_map')
 
-        if not is_definition_phase and self.rename_variables:
-            if current_function_scope_map and node.name and node.name.name in current_function_scope_map:
-                node.name.name = current_function_scope_map[node.name.name]
+class ScopedRenamingPass(ObfuscationPass):
+    """Renames identifiers in a single walk, giving every declaration its own new name.
 
-        if node.initializer:
-            node.initializer = self.visit(node.initializer, symbol_map, **kwargs)
-        return node
+    Functions are renamed by a scan of the program's top-level declarations
+    before the walk, so calls to functions defined further down resolve.
+    Parameters and variables are resolved through a stack of scopes (the
+    function, each block and each for statement), so a variable that
+    shadows another in a nested block or a for initializer gets a name of
+    its own, and a use is renamed to the declaration visible where it is.
+    """
 
-    def visit_identifiernode(self, node, symbol_map=None, **kwargs):
-        is_definition_phase = kwargs.get('is_definition_phase')
-        current_function_scope_map = kwargs.get('current_function_scope_map')
-
-        if not is_definition_phase and node.name:
-            original_id_name = node.name
-            if current_function_scope_map and original_id_name in current_function_scope_map:
-                node.name = current_function_scope_map[original_id_name]
-            elif original_id_name in self.global_symbol_map:
-                if original_id_name not in ["printf", "scanf"]:
-                    node.name = self.global_symbol_map[original_id_name]
+    def __init__(self, rename_functions=True, rename_variables=True, rename_parameters=True, persistent=False):
+        super().__init__(persistent)
+        self.rename_functions = rename_functions
+        self.rename_variables = rename_variables
+        self.rename_parameters = rename_parameters
+        self.global_symbol_map = {}
+        # Function renames decided outside this AST, e.g. for the rest of the
+        # program when only some of its functions are obfuscated.
+        self.preset_symbol_map = {}
+        # Symbol ID -> renamed symbol ID or None, for the scopes being visited.
+        self.renamed_symbols = []
+
+    def phases(self):
+        return [_RenameScoped(self)]
+
+    def _new_symbol(self, original_name):
+        return SYMBOLS.intern(self.name_gen.new_name(original_name))
+
+
+class _RenameScoped(traversal.Phase):
+    reads = writes = needs = frozenset({"names"})
+
+    def __init__(self, renamer):
+        super().__init__(renamer.update)
+        self.renamer = renamer
+        # Per scope being visited: (symbol ID, its previous rename) for each name declared in it.
+        self.scopes = []
+        # Per function being visited: identifiers renamed before it.
+        self.functions = []
+        # Identifiers renamed so far, to tell which functions changed.
+        self.renames = 0
+
+    def begin(self, root):
+        renamer = self.renamer
+        renamer.global_symbol_map = dict(renamer.preset_symbol_map)
+        if renamer.rename_functions:
+            for declaration in getattr(root, "declarations", None) or ():
+                if isinstance(declaration, ast.FunctionDefNode):
+                    name = declaration.name.name
+                    if name not in renamer.global_symbol_map and name not in ["main", "printf", "scanf"]:
+                        renamer.global_symbol_map[name] = renamer.name_gen.new_name(name)
+        global_renames = [(SYMBOLS.intern(original_name), SYMBOLS.intern(new_name))
+                          for original_name, new_name in renamer.global_symbol_map.items()
+                          if original_name not in ["printf", "scanf"]]
+        renamer.renamed_symbols = [None] * len(SYMBOLS)
+        for symbol_id, new_symbol_id in global_renames:
+            renamer.renamed_symbols[symbol_id] = new_symbol_id
+
+    def end(self, root):
+        self.renamer.renamed_symbols = []
+
+    def _declare(self, name_node):
+        if name_node and name_node.name:
+            symbol_id = name_node.symbol_id
+            renamed_symbols = self.renamer.renamed_symbols
+            self.scopes[-1].append((symbol_id, renamed_symbols[symbol_id]))
+            renamed_symbols[symbol_id] = self.renamer._new_symbol(name_node.name)
+
+    def _enter_scope(self, node):
+        self.scopes.append([])
+
+    def _leave_scope(self, node, parent):
+        renamed_symbols = self.renamer.renamed_symbols
+        for symbol_id, previous in reversed(self.scopes.pop()):
+            renamed_symbols[symbol_id] = previous
         return node
 
-    def visit_functioncallnode(self, node, symbol_map=None, **kwargs):
+    enter_blocknode = enter_fornode = _enter_scope
+    leave_blocknode = leave_fornode = _leave_scope
 
-        if node.name:
-            node.name = self.visit(node.name, symbol_map, **kwargs)
+    def enter_functiondefnode(self, node):
+        self.functions.append(self.renames)
+        self._enter_scope(node)
 
-        if node.args:
-            new_args = []
-            for arg in node.args:
-                visited_arg = self.visit(arg, symbol_map, **kwargs)
-                if visited_arg is not None:
-                    new_args.append(visited_arg)
-            node.args = new_args
+    def leave_functiondefnode(self, node, parent):
+        node = self._leave_scope(node, parent)
+        if self.renames != self.functions.pop():
+            self.renamer.function_modified(node)
         return node
 
-    def visit_assignmentnode(self, node, symbol_map=None, **kwargs):
-        if node.lvalue: node.lvalue = self.visit(node.lvalue, symbol_map, **kwargs)
-        if node.rvalue: node.rvalue = self.visit(node.rvalue, symbol_map, **kwargs)
-        return node
+    def enter_paramnode(self, node):
+        if self.renamer.rename_parameters:
+            self._declare(node.name)
 
-    def visit_ifnode(self, node, symbol_map=None, **kwargs):
-        if node.condition: node.condition = self.visit(node.condition, symbol_map, **kwargs)
-        if node.then_block: node.then_block = self.visit(node.then_block, symbol_map, **kwargs)
-        if node.else_block: node.else_block = self.visit(node.else_block, symbol_map, **kwargs)
-        return node
+    def enter_vardeclnode(self, node):
+        # As in C, the new variable is already in scope in its own initializer.
+        if self.renamer.rename_variables:
+            self._declare(node.name)
 
-    def visit_whilenode(self, node, symbol_map=None, **kwargs):
-        if node.condition: node.condition = self.visit(node.condition, symbol_map, **kwargs)
-        if node.body: node.body = self.visit(node.body, symbol_map, **kwargs)
+    def leave_identifiernode(self, node, parent):
+        new_symbol_id = self.renamer.renamed_symbols[node.symbol_id]
+        if new_symbol_id is not None:
+            self.renames += 1
+            return self.update(node, symbol_id=new_symbol_id)
         return node
 
-    def visit_fornode(self, node, symbol_map=None, **kwargs):
-        if node.init: node.init = self.visit(node.init, symbol_map, **kwargs)
-        if node.condition: node.condition = self.visit(node.condition, symbol_map, **kwargs)
-        if node.update: node.update = self.visit(node.update, symbol_map, **kwargs)
-        if node.body: node.body = self.visit(node.body, symbol_map, **kwargs)
-        return node
 
-    def visit_returnnode(self, node, symbol_map=None, **kwargs):
-        if node.expr:
-            node.expr = self.visit(node.expr, symbol_map, **kwargs)
-        return node
-
-    def visit_binaryopnode(self, node, symbol_map=None, **kwargs):
-        if node.left: node.left = self.visit(node.left, symbol_map, **kwargs)
-        if node.right: node.right = self.visit(node.right, symbol_map, **kwargs)
-        return node
+# --- 2. Dead Code Insertion Pass ---
+class DeadCodeInsertionPass(ObfuscationPass):
+    deterministic = False
+    # Only adds declarations of unused variables initialized with literals.
+    preserves = (Callees,)
 
-    def visit_unaryopnode(self, node, symbol_map=None, **kwargs):
-        if node.expr: node.expr = self.visit(node.expr, symbol_map, **kwargs)
-        return node
+    def __init__(self, probability=0.25, leaves=None, persistent=False):
+        super().__init__(persistent)
+        self.probability = probability
+        self.leaves = leaves or ast.LeafFactory()
 
-    def visit_blocknode(self, node, symbol_map=None, **kwargs):
-        if node.statements:
-            for i in range(len(node.statements)):
-                node.statements[i] = self.visit(node.statements[i], symbol_map, **kwargs)
-        return node
+    def phases(self):
+        return [_DeadCodeInsertion(self)]
 
-    def visit_exprstatementnode(self, node, symbol_map=None, **kwargs):
-        if node.expr: node.expr = self.visit(node.expr, symbol_map, **kwargs)
-        return node
+    def _create_random_dead_statement(self, *used_names):
+        # A dead variable named like one the code uses would capture its references.
+        var_name = self.name_gen.new_name("unused_var_", tag="d")
+        while any(var_name in names for names in used_names):
+            var_name = self.name_gen.new_name("unused_var_", tag="d")
+        rand_val = random.randint(-10000, 10000)
+        dead_var_decl = ast.VarDeclNode(
+            var_type=self.leaves.type_node("int"),
+            name=ast.IdentifierNode(var_name),
+            initializer=self.leaves.number(rand_val)
+        )
+        return dead_var_decl
 
-    def visit_typenode(self, node, symbol_map=None, **kwargs):
-        return node
 
-    def visit_numberliteralnode(self, node, symbol_map=None, **kwargs):
+class _DeadCodeInsertion(traversal.Phase):
+    """After each statement of a block, maybe inserts an unused variable declaration."""
+    reads = writes = frozenset({"statements"})
+
+    def __init__(self, inserter):
+        super().__init__(inserter.update)
+        self.inserter = inserter
+        # Per block being visited: the dead statement (or None) to insert after each statement so far.
+        self.insertions = []
+        # Per function being visited: [whether dead code went into it, its parameter and variable names].
+        self.functions = []
+        self.function_names = set()
+
+    def begin(self, root):
+        # Besides its own variables, code can only refer to these functions or
+        # to printf and scanf, which a new name (ending in a number) never is.
+        self.function_names = {declaration.name.name for declaration in getattr(root, "declarations", None) or ()
+                               if isinstance(declaration, ast.FunctionDefNode)}
+
+    def _after_statement(self, node, parent):
+        # Decided once the statement itself is done, in case it's a block itself
+        # and dead code needs to be inserted within it.
+        if isinstance(parent, ast.BlockNode):
+            dead_stmt = None
+            if not isinstance(node, ast.ReturnNode) and random.random() < self.inserter.probability:
+                local_names = self.functions[-1][1] if self.functions else ()
+                dead_stmt = self.inserter._create_random_dead_statement(self.function_names, local_names)
+            self.insertions[-1].append(dead_stmt)
         return node
 
-    def visit_charliteralnode(self, node, symbol_map=None, **kwargs):
-        return node
+    leave_default = _after_statement
 
-    def visit_stringliteralnode(self, node, symbol_map=None, **kwargs):
-        return node
+    # Only blocks and the statements that contain them need visiting.
+    def enter_default(self, node):
+        return traversal.SKIP
 
-    def visit_boolliteralnode(self, node, symbol_map=None, **kwargs):
-        return node
+    def enter_programnode(self, node):
+        return None
 
+    enter_ifnode = enter_whilenode = enter_fornode = enter_programnode
 
-# --- 2. Dead Code Insertion Pass ---
-class DeadCodeInsertionPass(ObfuscationPass):
-    def __init__(self, probability=0.25):
-        super().__init__()
-        self.probability = probability
+    def enter_functiondefnode(self, node):
+        params, local_vars = self.inserter.analyses.get(LocalSymbols, node)
+        self.functions.append([False, {SYMBOLS.names[symbol_id] for symbol_id in params + local_vars}])
 
-    def apply(self, ast_root):
-        self.name_gen.reset()
-        self.visit(ast_root)  # Pass ast_root, symbol_map=None, **kwargs (empty kwargs ok for this pass)
-        return ast_root
+    def leave_functiondefnode(self, node, parent):
+        if self.functions.pop()[0]:
+            self.inserter.function_modified(node)
+        return node
 
-    def _create_random_dead_statement(self):
-        var_name = self.name_gen.new_name("unused_var_")
-        rand_val = random.randint(-10000, 10000)
-        dead_var_decl = ast.VarDeclNode(
-            var_type=ast.TypeNode("int"),
-            name=ast.IdentifierNode(var_name),
-            initializer=ast.NumberLiteralNode(rand_val)
-        )
-        return dead_var_decl
+    def enter_blocknode(self, node):
+        self.insertions.append([])
 
-    def visit_blocknode(self, node, symbol_map=None, **kwargs):
+    def leave_blocknode(self, node, parent):
+        insertions = self.insertions.pop()
         if node.statements is not None:
             new_statements = []
-            for stmt in node.statements:
-                # Visit the original statement first, in case it's a block itself
-                # and dead code needs to be inserted within it.
-                visited_stmt = self.visit(stmt, symbol_map, **kwargs)
-                new_statements.append(visited_stmt)
-
-                if not isinstance(visited_stmt, ast.ReturnNode) and random.random() < self.probability:
-                    dead_stmt = self._create_random_dead_statement()
-                    if dead_stmt:
-                        new_statements.append(dead_stmt)
-            node.statements = new_statements
-        return node
-
-    # Need to ensure that complex statements containing blocks are visited so their blocks can be processed.
-    def visit_functiondefnode(self, node, symbol_map=None, **kwargs):
-        if node.body: node.body = self.visit(node.body, symbol_map, **kwargs)
-        return node
+            for stmt, dead_stmt in zip(node.statements, insertions):
+                new_statements.append(stmt)
+                if dead_stmt:
+                    new_statements.append(dead_stmt)
+            node = self.update(node, statements=new_statements)
+            if self.functions and any(insertions):
+                self.functions[-1][0] = True
+        return self._after_statement(node, parent)
 
-    def visit_ifnode(self, node, symbol_map=None, **kwargs):
-        # For dead code, we only care about transforming blocks, not expressions
-        if node.then_block: node.then_block = self.visit(node.then_block, symbol_map, **kwargs)
-        if node.else_block: node.else_block = self.visit(node.else_block, symbol_map, **kwargs)
-        return node
-
-    def visit_whilenode(self, node, symbol_map=None, **kwargs):
-        if node.body: node.body = self.visit(node.body, symbol_map, **kwargs)
-        return node
 
-    def visit_fornode(self, node, symbol_map=None, **kwargs):
-        if node.body: node.body = self.visit(node.body, symbol_map, **kwargs)
-        return node
+# Technique name -> factory(leaves, persistent) of its pass, in the order Obfuscator runs them.
+PASSES = {
+    "rename_identifiers": lambda leaves, persistent: ScopedRenamingPass(persistent=persistent),
+    "dead_code": lambda leaves, persistent: DeadCodeInsertionPass(probability=0.25, leaves=leaves,
+                                                                  persistent=persistent),
+}
 
 
 class Obfuscator:
-    def __init__(self, techniques=None):
-        self.passes = []
+    """Runs the chosen passes in order.
+
+    With fuse=True (the default) the phases of consecutive passes that
+    define phases() share walks wherever traversal.plan_walks() allows, so
+    renaming and dead code insertion share a single walk of the tree.
+    `walk_count` counts the walks made so far.
+
+    The passes share one NameGenerator, `names`, which apply_passes() resets;
+    dead code variables are named under their own tag, so they never take a
+    name the renamer gave out.
+
+    The passes share one AnalysisManager, `analyses`, so an analysis of a
+    function is computed once and again only after a pass reports that it
+    modified the function in a way the analysis depends on. Results are kept
+    across runs on the same tree, such as the variants of one tree, and
+    dropped when apply_passes() is given another one.
+    `analyses.counters()` gives each analysis's hits and misses.
+
+    With a metrics.Metrics as `metrics`, each walk, and each pass that only
+    has apply(), is recorded as a stage named after its phases or pass.
+    With a tracing.Tracer as `tracer`, they are recorded as trace spans,
+    with a span per function within each walk.
+    """
+
+    def __init__(self, techniques=None, leaves=None, persistent=False, fuse=True):
         if techniques is None:
             techniques = ["rename_identifiers", "dead_code"]
+        self.names = NameGenerator()
+        self.analyses = AnalysisManager()
+        self.passes = []
+        for name, make_pass in PASSES.items():
+            if name in techniques:
+                obfuscation_pass = make_pass(leaves, persistent)
+                obfuscation_pass.name_gen = self.names
+                obfuscation_pass.analyses = self.analyses
+                self.passes.append(obfuscation_pass)
+        self.persistent = persistent
+        self.fuse = fuse
+        self.walk_count = 0
+        # The tree `analyses` holds results for.
+        self._analysed_root = None
+        self.metrics = None
+        self.tracer = None
+
+    def _run_phases(self, ast_root, phases, owners):
+        walks = traversal.plan_walks(phases) if self.fuse else [[phase] for phase in phases]
+        for walk_phases in walks:
+            update = walk_phases[0].update
+            if self.metrics is None and self.tracer is None:
+                ast_root = traversal.walk(ast_root, walk_phases, update)
+            else:
+                name = "+".join(type(phase).__name__.lstrip("_") for phase in walk_phases)
+                pass_phases = walk_phases
+                if self.tracer is not None:
+                    from tracing import FunctionSpans
+                    walk_phases = [FunctionSpans(self.tracer, name)] + walk_phases
+                with self._stage(f"walk {name}", ast_root) as stage:
+                    if self.metrics is None:
+                        ast_root = stage.tree = traversal.walk(ast_root, walk_phases, update)
+                    else:
+                        # Each pass's own share of the walk, for when several are fused into it.
+                        names = [f"pass {owners[phase]}" for phase in pass_phases]
+                        with self.metrics.phases(stage, pass_phases, names, update) as update:
+                            ast_root = stage.tree = traversal.walk(ast_root, walk_phases, update)
+            self.walk_count += 1
+        return ast_root
 
-        if "rename_identifiers" in techniques:
-            self.passes.append(IdentifierRenamingPass())
-        if "dead_code" in techniques:
-            self.passes.append(DeadCodeInsertionPass(probability=0.25))
+    def _apply_pass(self, obfuscation_pass, ast_root):
+        if self.metrics is None and self.tracer is None:
+            return obfuscation_pass.apply(ast_root)
+        with self._stage(f"pass {type(obfuscation_pass).__name__}", ast_root) as stage:
+            ast_root = stage.tree = obfuscation_pass.apply(ast_root)
+        return ast_root
 
-    def apply_passes(self, ast_root):
+    @contextlib.contextmanager
+    def _stage(self, name, tree):
+        with self.tracer.span(name, "pass") if self.tracer is not None else contextlib.nullcontext():
+            if self.metrics is None:
+                yield StageResult()
+            else:
+                with self.metrics.stage(name, tree) as stage:
+                    yield stage
+
+    def clear_analyses(self):
+        """Drop the cached analyses, and with them the last tree they kept alive."""
+        self.analyses.clear()
+        self._analysed_root = None
+
+    def apply_passes(self, ast_root, passes=None):
+        if ast_root is not self._analysed_root:
+            # Cached results keep their functions alive, so only one tree's are kept.
+            self.analyses.clear()
+            self._analysed_root = ast_root
+        self.names.reset()
+        return self._apply_passes(ast_root, passes)
+
+    def _apply_passes(self, ast_root, passes):
         current_ast = ast_root
-        for p_instance in self.passes:
-            print(f"Applying pass: {p_instance.__class__.__name__}")
-            current_ast = p_instance.apply(current_ast)
+        pending_phases = []
+        # Phase -> name of the pass it belongs to.
+        owners = {}
+        for p_instance in self.passes if passes is None else passes:
+            logger.debug("Applying pass: %s", p_instance.__class__.__name__)
+            phases = p_instance.phases()
+            if phases is not None:
+                pending_phases.extend(phases)
+                owners.update(dict.fromkeys(phases, type(p_instance).__name__))
+                continue
+            current_ast = self._run_phases(current_ast, pending_phases, owners)
+            pending_phases = []
+            current_ast = self._apply_pass(p_instance, current_ast)
             if current_ast is None:
-                print(
-                    f"Error: Pass {p_instance.__class__.__name__} returned None. Reverting to original AST for this pass.")
+                logger.error("Pass %s returned None. Reverting to original AST for this pass.",
+                             p_instance.__class__.__name__)
 
                 return ast_root
-        return current_ast
+        return self._run_phases(current_ast, pending_phases, owners)
+
+    def variants(self, ast_root, count, seed=None):
+        """Yield `count` obfuscated versions of `ast_root` without modifying it.
+
+        Needs persistent=True. The leading deterministic passes run once and
+        their result is shared by every variant; the remaining passes run
+        per variant, with random seeded from `seed` + i when a seed is given.
+        Each variant shares all the subtrees its passes left alone with the
+        tree they started from.
+        """
+        if not self.persistent:
+            raise ValueError("Obfuscator.variants() needs an Obfuscator(persistent=True)")
+        split = 0
+        while split < len(self.passes) and self.passes[split].deterministic:
+            split += 1
+        base = self.apply_passes(ast_root, self.passes[:split])
+        for i in range(count):
+            if seed is not None:
+                random.seed(seed + i)
+            yield self.apply_passes(base, self.passes[split:])
@@ -0,0 +1,7 @@
+# The choices of Pipeline's configuration options, kept apart from pipeline.py so command lines
+# can be parsed before the pipeline and the ANTLR runtime are imported.
+PARSE_MODES = ("ll", "sll")
+FRONTENDS = ("antlr", "antlr-stream", "native")
+INPUT_MODES = ("memory", "mmap")
+LEXER_MODES = ("antlr", "regex")
+AST_BACKENDS = ("objects", "arena")
@@ -0,0 +1,151 @@
+import multiprocessing
+import os
+
+from antlr4 import CommonTokenStream, InputStream, Token
+
+from generated_parser.MiniCLexer import MiniCLexer
+from generated_parser.MiniCParser import MiniCParser
+
+from ast_builder_visitor import FastASTBuilderVisitor
+import ast_binary
+import ast_nodes as custom_ast
+from pipeline import PipelineError
+from syntax_errors import SyntaxErrorCollector
+from source_splitter import SourceSplitError, split_top_level_functions
+from symbols import SYMBOLS
+
+_worker_parser = None
+
+
+class FunctionParser:
+    """Parses one function definition at a time, starting at the functionDefinition rule.
+
+    The lexer starts at the function's line and column in the whole file, so
+    line_no values and error positions are absolute.
+    """
+
+    def __init__(self):
+        self.lexer = MiniCLexer(None)
+        self.parser = MiniCParser(None)
+        self.error_collector = SyntaxErrorCollector()
+        for recognizer in (self.lexer, self.parser):
+            recognizer.removeErrorListeners()
+            recognizer.addErrorListener(self.error_collector)
+        self.ast_builder = FastASTBuilderVisitor()
+
+    def parse(self, function_text, line, column):
+        self.error_collector.errors = []
+        self.lexer.inputStream = InputStream(function_text)
+        self.lexer.line = line
+        self.lexer.column = column
+        token_stream = CommonTokenStream(self.lexer)
+        token_stream.fill()
+        self.parser.setTokenStream(token_stream)
+        tree = self.parser.functionDefinition()
+
+        trailing = token_stream.LT(1)
+        if trailing.type != Token.EOF:
+            self.error_collector.errors.append(f"line {trailing.line}:{trailing.column} extraneous input "
+                                               f"'{trailing.text}' expecting <EOF>")
+        if self.error_collector.errors:
+            return None, self.error_collector.errors
+        return self.ast_builder.visit(tree), []
+
+
+def _init_worker():
+    global _worker_parser
+    _worker_parser = FunctionParser()
+
+
+def _parse_chunk(chunk):
+    # ast_binary data is several times smaller than a pickle of the same nodes.
+    results = []
+    # The trees are sent by name, so the worker need not remember the names.
+    with SYMBOLS.scope():
+        for function_text, line, column in chunk:
+            function_def, errors = _worker_parser.parse(function_text, line, column)
+            results.append((None if errors else ast_binary.dumps(function_def), errors))
+    return results
+
+
+class ParallelParser:
+    """Parses the function definitions of one big source in worker processes.
+
+    The source is split with source_splitter.split_top_level_functions, the
+    spans are grouped into chunks of similar size, and each worker parses its
+    chunk with its own MiniCLexer/MiniCParser. The resulting FunctionDefNodes
+    are merged, in source order, into one ProgramNode. Sources with a single
+    chunk are parsed in this process. The pool is started on first use and
+    kept until close().
+    """
+
+    def __init__(self, workers=None, min_chunk_chars=16 * 1024):
+        self.workers = workers or os.cpu_count() or 1
+        self.min_chunk_chars = min_chunk_chars
+        self._pool = None
+        self._local_parser = None
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _chunks(self, source_text, spans):
+        target = max(len(source_text) // (self.workers * 4), self.min_chunk_chars)
+        chunks = []
+        chunk = []
+        chunk_chars = 0
+        for span in spans:
+            column = span.start - (source_text.rfind("\n", 0, span.start) + 1)
+            chunk.append((source_text[span.start:span.end], span.line, column))
+            chunk_chars += span.end - span.start
+            if chunk_chars >= target:
+                chunks.append(chunk)
+                chunk = []
+                chunk_chars = 0
+        if chunk:
+            chunks.append(chunk)
+        return chunks
+
+    def parse(self, source_text, source_name="<string>"):
+        try:
+            spans = split_top_level_functions(source_text)
+        except SourceSplitError as e:
+            raise PipelineError(f"Parsing failed for '{source_name}' due to 1 syntax error(s): {e}")
+        if not spans:
+            # The grammar needs at least one function definition, so report it like the ANTLR parser would.
+            line = source_text.count("\n") + 1
+            column = len(source_text) - (source_text.rfind("\n") + 1)
+            raise PipelineError(f"Parsing failed for '{source_name}' due to 1 syntax error(s): "
+                                f"line {line}:{column} mismatched input '<EOF>' expecting {{'int', 'char', 'bool'}}")
+
+        chunks = self._chunks(source_text, spans)
+        if self.workers == 1 or len(chunks) <= 1:
+            if self._local_parser is None:
+                self._local_parser = FunctionParser()
+            results = [[self._local_parser.parse(*function) for function in chunk] for chunk in chunks]
+        else:
+            if self._pool is None:
+                self._pool = multiprocessing.Pool(processes=self.workers, initializer=_init_worker)
+            results = [[(None if errors else ast_binary.loads(data), errors) for data, errors in chunk_results]
+                       for chunk_results in self._pool.map(_parse_chunk, chunks)]
+
+        declarations = []
+        errors = []
+        for chunk_results in results:
+            for function_def, function_errors in chunk_results:
+                if function_errors:
+                    errors.extend(function_errors)
+                else:
+                    declarations.append(function_def)
+        if errors:
+            raise PipelineError(f"Parsing failed for '{source_name}' due to {len(errors)} syntax error(s): "
+                                + "; ".join(errors))
+        return custom_ast.ProgramNode(declarations, line_no=spans[0].line)
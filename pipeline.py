@@ -0,0 +1,393 @@
+import contextlib
+import time
+
+import ast_nodes as custom_ast
+from code_generator import CodeGenerator
+from obfuscator_passes import Obfuscator
+from options import AST_BACKENDS, FRONTENDS, INPUT_MODES, LEXER_MODES, PARSE_MODES
+from stage import StageResult
+from symbols import SYMBOLS
+
+
+class PipelineError(Exception):
+    """Raised when a source cannot be turned into obfuscated code."""
+
+
+class Pipeline:
+    """Lexer, parser, AST builder, obfuscator and code generator kept alive across many sources.
+
+    parse_mode "ll" parses with ANTLR's default full-LL prediction. "sll"
+    first tries the faster SLL prediction with a bail-out error strategy and
+    only re-parses with full LL and normal error reporting if that fails.
+    frontend "antlr-stream" turns off parse tree construction and builds the
+    AST from parse events with ASTBuilderListener, so only the AST is kept in
+    memory. frontend "native" skips ANTLR entirely and parses straight into ast_nodes
+    with native_frontend.NativeParser.
+    input_mode "mmap" makes file_to_ast() read files through a memory map and
+    a WindowedTokenStream instead of decoding them into one string and
+    keeping every token (ANTLR frontends only).
+    lexer_mode "regex" lexes in-memory sources with regex_lexer.RegexLexer
+    instead of the generated MiniCLexer (ANTLR frontends only).
+    parse_jobs > 1 parses the function definitions of each source in that many
+    worker processes with parallel_parse.ParallelParser (frontend "antlr",
+    input_mode "memory" only); call close() to stop the workers.
+    ast_backend "arena" copies each AST into an ast_arena.ASTArena before
+    obfuscating and runs the passes and code generator over its views, so
+    the tree that was parsed (or cached) is left untouched.
+    shared_leaves=True builds types, booleans, small integers and ASCII
+    characters from one ast_nodes.LeafPool, so equal leaves are one shared,
+    read-only node without a line number (ASTs from the cache or from
+    parallel workers come back unshared).
+    With an ast_cache.ASTCache as `cache`, ASTs of previously seen sources
+    are loaded from disk instead of being parsed again.
+    With persistent=True the passes leave their input tree as it is and
+    return a new tree that shares every unchanged subtree with it, which is
+    what obfuscate_variants() relies on.
+    Wall-clock seconds per stage of the latest source are kept in `timings`.
+    With a metrics.Metrics as `metrics`, every stage, and every walk of the
+    obfuscation passes, is also recorded there with its CPU time, node
+    counts, memory peak and output size.
+    With a tracing.Tracer as `tracer`, the same stages, each walk and each
+    function within the walks and the code generator are recorded as
+    nested trace spans, under a span per source in run() and run_file().
+
+    Modules only some configurations need (the ANTLR runtime, generated
+    lexer and parser and AST builders, the native frontend, streams, the
+    AST cache) are imported on first use to keep single-file startup short;
+    with frontend "native", `lexer` and `parser` are None.
+    """
+
+    def __init__(self, techniques=None, parse_mode="ll", frontend="antlr", input_mode="memory", cache=None,
+                 parse_jobs=1, lexer_mode="antlr", ast_backend="objects", shared_leaves=False,
+                 persistent=False, metrics=None, tracer=None):
+        if parse_mode not in PARSE_MODES:
+            raise ValueError(f"Unknown parse mode '{parse_mode}', expected one of {PARSE_MODES}")
+        if frontend not in FRONTENDS:
+            raise ValueError(f"Unknown frontend '{frontend}', expected one of {FRONTENDS}")
+        if input_mode not in INPUT_MODES:
+            raise ValueError(f"Unknown input mode '{input_mode}', expected one of {INPUT_MODES}")
+        if input_mode == "mmap" and frontend == "native":
+            raise ValueError("input mode 'mmap' needs an ANTLR frontend")
+        if lexer_mode not in LEXER_MODES:
+            raise ValueError(f"Unknown lexer mode '{lexer_mode}', expected one of {LEXER_MODES}")
+        if lexer_mode == "regex" and (frontend == "native" or input_mode != "memory"):
+            raise ValueError("lexer mode 'regex' needs an ANTLR frontend and input mode 'memory'")
+        if parse_jobs > 1 and (frontend != "antlr" or input_mode != "memory" or lexer_mode != "antlr"):
+            raise ValueError("parallel parsing needs frontend 'antlr', input mode 'memory' and lexer mode 'antlr'")
+        if ast_backend not in AST_BACKENDS:
+            raise ValueError(f"Unknown AST backend '{ast_backend}', expected one of {AST_BACKENDS}")
+        self.parse_mode = parse_mode
+        self.frontend = frontend
+        self.input_mode = input_mode
+        self.lexer_mode = lexer_mode
+        self.ast_backend = ast_backend
+        self.cache = cache
+        self.timings = {}
+        self.metrics = metrics
+        self.tracer = tracer
+        self.sll_fallbacks = 0
+
+        self.leaves = custom_ast.LeafPool() if shared_leaves else None
+        self.lexer = self.parser = None
+        self.ast_builder = self.ast_listener = None
+        if frontend != "native":
+            self._init_antlr()
+        self.obfuscator = Obfuscator(techniques=techniques, leaves=self.leaves, persistent=persistent)
+        self.obfuscator.metrics = metrics
+        self.obfuscator.tracer = tracer
+        if tracer is None:
+            self.generator = CodeGenerator()
+        else:
+            from tracing import TracingCodeGenerator
+            self.generator = TracingCodeGenerator(tracer)
+
+        self.parallel_parser = None
+        if parse_jobs > 1:
+            from parallel_parse import ParallelParser
+            self.parallel_parser = ParallelParser(workers=parse_jobs)
+
+    def _init_antlr(self):
+        from antlr4.CommonTokenFactory import CommonTokenFactory
+        from antlr4.error.ErrorStrategy import BailErrorStrategy, DefaultErrorStrategy
+        from generated_parser.MiniCLexer import MiniCLexer
+        from generated_parser.MiniCParser import MiniCParser
+        from ast_builder_visitor import FastASTBuilderVisitor
+        from syntax_errors import SyntaxErrorCollector
+
+        self.lexer = MiniCLexer(None)
+        self.parser = MiniCParser(None)
+        self.error_collector = SyntaxErrorCollector()
+        for recognizer in (self.lexer, self.parser):
+            recognizer.removeErrorListeners()
+            recognizer.addErrorListener(self.error_collector)
+        self.default_error_strategy = DefaultErrorStrategy()
+        self.bail_error_strategy = BailErrorStrategy()
+        self.copying_token_factory = CommonTokenFactory(copyText=True)
+
+        self.ast_builder = FastASTBuilderVisitor(self.leaves)
+        if self.frontend == "antlr-stream":
+            from ast_builder_listener import ASTBuilderListener
+            self.ast_listener = ASTBuilderListener(self.leaves)
+        self.parser.buildParseTrees = self.frontend != "antlr-stream"
+
+    def close(self):
+        if self.parallel_parser is not None:
+            self.parallel_parser.close()
+
+    def span(self, name, category="file"):
+        """A trace span around the with block, or nothing if there is no tracer."""
+        if self.tracer is None:
+            return contextlib.nullcontext()
+        return self.tracer.span(name, category)
+
+    @contextlib.contextmanager
+    def _stage(self, name, tree=None):
+        # Times the with block into `timings`, and measures and traces it if asked to.
+        if self.metrics is None and self.tracer is None:
+            start = time.perf_counter()
+            yield StageResult()
+            self.timings[name] = time.perf_counter() - start
+            return
+        with self.span(name, "stage"):
+            if self.metrics is None:
+                start = time.perf_counter()
+                yield StageResult()
+                self.timings[name] = time.perf_counter() - start
+            else:
+                with self.metrics.stage(name, tree) as result:
+                    yield result
+                self.timings[name] = result.wall
+
+    def _start_source(self, source_name):
+        self.timings = {}
+        if self.metrics is not None:
+            self.metrics.source = source_name
+
+    def parse(self, source_text, source_name="<string>"):
+        from antlr4 import CommonTokenStream, InputStream
+        from antlr4.CommonTokenFactory import CommonTokenFactory
+
+        self.error_collector.errors = []
+
+        with self._stage("lex"):
+            if self.lexer_mode == "regex":
+                from regex_lexer import RegexLexer
+
+                token_source = RegexLexer(source_text, source_name)
+                token_source.removeErrorListeners()
+                token_source.addErrorListener(self.error_collector)
+            else:
+                input_stream = InputStream(source_text)
+                input_stream.name = source_name
+                self.lexer._factory = CommonTokenFactory.DEFAULT
+                self.lexer.inputStream = input_stream
+                token_source = self.lexer
+            token_stream = CommonTokenStream(token_source)
+            token_stream.fill()
+
+        def rewind():
+            token_stream.seek(0)
+            return token_stream
+
+        return self._parse_tokens(rewind, source_name)
+
+    def parse_file_windowed(self, input_path):
+        """Parse from a memory-mapped file through a WindowedTokenStream.
+
+        Neither the source text nor the full token list is ever held in memory;
+        lexing happens on demand while parsing, so there is no separate "lex"
+        timing. Pair it with frontend "antlr-stream" so no parse tree keeps
+        the tokens alive either.
+        """
+        from streams import MmapCharStream, WindowedTokenStream
+
+        with MmapCharStream(input_path) as input_stream:
+            def reopen():
+                # Discarded tokens cannot be rewound, so a second parse re-lexes
+                # the file and its lexer errors are reported afresh.
+                self.error_collector.errors = []
+                self.lexer._factory = self.copying_token_factory
+                input_stream.seek(0)
+                self.lexer.inputStream = input_stream
+                return WindowedTokenStream(self.lexer)
+
+            return self._parse_tokens(reopen, input_path)
+
+    def _parse_tokens(self, open_token_stream, source_name):
+        with self._stage("parse") as stage:
+            if self.parse_mode == "sll":
+                parse_tree = self._parse_sll_then_ll(open_token_stream)
+            else:
+                self._reset_parser(open_token_stream())
+                parse_tree = self.parser.program()
+            if self.frontend == "antlr-stream":
+                stage.tree = self.ast_listener.program
+
+        if self.error_collector.errors:
+            raise PipelineError(f"Parsing failed for '{source_name}' due to "
+                                f"{len(self.error_collector.errors)} syntax error(s): "
+                                + "; ".join(self.error_collector.errors))
+        return parse_tree
+
+    def _reset_parser(self, token_stream):
+        # The Python runtime's Parser.reset() fails while parse listeners are
+        # attached, so the AST listener is re-attached after every reset.
+        self.parser.removeParseListeners()
+        self.parser.setTokenStream(token_stream)
+        if self.frontend == "antlr-stream":
+            self.ast_listener.reset()
+            self.parser.addParseListener(self.ast_listener)
+
+    def _parse_sll_then_ll(self, open_token_stream):
+        from antlr4.atn.PredictionMode import PredictionMode
+        from antlr4.error.Errors import ParseCancellationException
+
+        parser = self.parser
+        self._reset_parser(open_token_stream())
+        parser._interp.predictionMode = PredictionMode.SLL
+        parser._errHandler = self.bail_error_strategy
+        parser.removeErrorListener(self.error_collector)
+        try:
+            return parser.program()
+        except ParseCancellationException:
+            self.sll_fallbacks += 1
+        finally:
+            parser._errHandler = self.default_error_strategy
+            parser._interp.predictionMode = PredictionMode.LL
+            parser.addErrorListener(self.error_collector)
+
+        # SLL is weaker than full LL and bails on the first problem, so only a
+        # full LL parse from the first token can tell a real syntax error from
+        # an SLL conflict.
+        self._reset_parser(open_token_stream())
+        return parser.program()
+
+    def build_ast(self, parse_tree, source_name="<string>"):
+        with self._stage("build_ast") as stage:
+            program = stage.tree = self.ast_builder.visit(parse_tree)
+        if not isinstance(program, custom_ast.ProgramNode):
+            raise PipelineError(f"Custom AST construction failed for '{source_name}': "
+                                f"AST Builder returned type {type(program)}")
+        return program
+
+    def parse_native(self, source_text, source_name="<string>"):
+        from native_frontend import MiniCSyntaxError, NativeParser, tokenize
+
+        try:
+            with self._stage("lex"):
+                tokens = tokenize(source_text)
+
+            with self._stage("parse") as stage:
+                program = stage.tree = NativeParser(tokens, self.leaves).parse_program()
+        except MiniCSyntaxError as e:
+            raise PipelineError(f"Parsing failed for '{source_name}' due to 1 syntax error(s): {e}")
+        return program
+
+    def _tree_to_ast(self, parse_tree, source_name):
+        if self.frontend == "antlr-stream":
+            program = self.ast_listener.program
+            self.ast_listener.reset()
+            if not isinstance(program, custom_ast.ProgramNode):
+                raise PipelineError(f"Custom AST construction failed for '{source_name}': "
+                                    f"AST Builder returned type {type(program)}")
+            return program
+        return self.build_ast(parse_tree, source_name)
+
+    def parse_parallel(self, source_text, source_name="<string>"):
+        with self._stage("parse") as stage:
+            program = stage.tree = self.parallel_parser.parse(source_text, source_name)
+        return program
+
+    def _source_to_ast(self, source_text, source_name):
+        if self.parallel_parser is not None:
+            return self.parse_parallel(source_text, source_name)
+        if self.frontend == "native":
+            return self.parse_native(source_text, source_name)
+        return self._tree_to_ast(self.parse(source_text, source_name), source_name)
+
+    def _cache_lookup(self, compute_key):
+        if self.cache is None:
+            return None, None
+        with self._stage("cache_lookup") as stage:
+            key = compute_key()
+            program = stage.tree = self.cache.get(key)
+        return key, program
+
+    def _cache_store(self, key, program):
+        if self.cache is not None:
+            with self._stage("cache_store"):
+                self.cache.put(key, program)
+
+    def source_to_ast(self, source_text, source_name="<string>"):
+        self._start_source(source_name)
+        key, program = self._cache_lookup(lambda: self.cache.source_key(source_text.encode('utf-8')))
+        if program is None:
+            program = self._source_to_ast(source_text, source_name)
+            self._cache_store(key, program)
+        return program
+
+    def file_to_ast(self, input_path):
+        self._start_source(input_path)
+        if self.input_mode == "mmap":
+            key, program = self._cache_lookup(lambda: self.cache.file_key(input_path))
+            if program is None:
+                program = self._tree_to_ast(self.parse_file_windowed(input_path), input_path)
+                self._cache_store(key, program)
+            return program
+
+        with open(input_path, 'rb') as f:
+            source_bytes = f.read()
+        key, program = self._cache_lookup(lambda: self.cache.source_key(source_bytes))
+        if program is None:
+            program = self._source_to_ast(source_bytes.decode('utf-8'), input_path)
+            self._cache_store(key, program)
+        return program
+
+    def to_arena(self, program):
+        from ast_arena import ArenaNodeView, ASTArena
+
+        if isinstance(program, ArenaNodeView):
+            return program
+        with self._stage("to_arena") as stage:
+            program = stage.tree = ASTArena.from_tree(program).view()
+        return program
+
+    def obfuscate(self, program):
+        if self.ast_backend == "arena":
+            program = self.to_arena(program)
+        with self._stage("obfuscate", program) as stage:
+            program = stage.tree = self.obfuscator.apply_passes(program)
+        return program
+
+    def obfuscate_variants(self, program, count, seed=None):
+        """Yield `count` differently obfuscated trees of `program`, leaving it unchanged (needs persistent=True)."""
+        if self.ast_backend == "arena":
+            program = self.to_arena(program)
+        yield from self.obfuscator.variants(program, count, seed)
+
+    def generate(self, program):
+        with self._stage("generate") as stage:
+            generated_code = stage.output = self.generator.generate(program)
+        return generated_code
+
+    @contextlib.contextmanager
+    def source_scope(self):
+        """Forget the identifiers first seen in the with block once it ends (see SymbolTable.scope()).
+
+        For code that keeps none of the trees it makes in the block, such as
+        run(), so a long-running process does not keep every source's names.
+        """
+        with SYMBOLS.scope():
+            try:
+                yield
+            finally:
+                self.obfuscator.clear_analyses()
+
+    def run(self, source_text, source_name="<string>"):
+        with self.span(source_name), self.source_scope():
+            program = self.source_to_ast(source_text, source_name)
+            return self.generate(self.obfuscate(program))
+
+    def run_file(self, input_path):
+        with self.span(input_path), self.source_scope():
+            return self.generate(self.obfuscate(self.file_to_ast(input_path)))
@@ -0,0 +1,124 @@
+import re
+
+from antlr4.CommonTokenFactory import CommonTokenFactory
+from antlr4.Token import CommonToken, Token
+from antlr4.error.ErrorListener import ConsoleErrorListener, ProxyErrorListener
+
+from generated_parser.MiniCLexer import MiniCLexer
+
+from native_frontend import KEYWORDS, OPERATORS, SKIPPED, TOKEN_PATTERN
+
+_KEYWORD_TYPES = {text: getattr(MiniCLexer, name) for text, name in KEYWORDS.items()}
+_OPERATOR_TYPES = {text: getattr(MiniCLexer, name) for text, name in OPERATORS.items()}
+_GROUP_TYPES = {name: getattr(MiniCLexer, name) for name in ("NUMBER", "CHAR_LITERAL", "STRING_LITERAL")}
+
+# How far MiniCLexer reads into a token that turns out not to match: the
+# start of '&&', '||', a character literal or an unterminated string.
+_UNFINISHED_TOKEN = re.compile(r"""[&|]|'(?:[^'\\]|\\[\s\S]?)?|"(?:[^"\\]|\\[\s\S])*\\?""")
+_ERROR_DISPLAY = str.maketrans({"\n": "\\n", "\t": "\\t", "\r": "\\r"})
+
+
+class RegexLexer:
+    """Drop-in token source for MiniCParser that lexes with one compiled regex.
+
+    It walks native_frontend.TOKEN_PATTERN over the source string and emits
+    CommonTokens with the same types, text, lines, columns and character
+    indexes as MiniCLexer, so it can feed CommonTokenStream unchanged. It
+    works on the str directly, so no InputStream is built. Unrecognised
+    input is reported to the error listeners and skipped the way MiniCLexer
+    recovers: the message quotes the text up to and including the first
+    character no token can continue with, and lexing resumes after it.
+    """
+
+    def __init__(self, source_text="", source_name="<string>", line=1, column=0):
+        self.source_text = source_text
+        self.source_name = source_name
+        self.line = line
+        self.column = column
+        self._factory = CommonTokenFactory.DEFAULT
+        self._listeners = [ConsoleErrorListener.INSTANCE]
+        self._tokens = self._generate_tokens()
+
+    def addErrorListener(self, listener):
+        self._listeners.append(listener)
+
+    def removeErrorListeners(self):
+        self._listeners = []
+
+    def getErrorListenerDispatch(self):
+        return ProxyErrorListener(self._listeners)
+
+    def getSourceName(self):
+        return self.source_name
+
+    def getInputStream(self):
+        return None
+
+    def getCharPositionInLine(self):
+        return self.column
+
+    def nextToken(self):
+        return next(self._tokens)
+
+    def _skip_unrecognised(self, text, pos):
+        unfinished = _UNFINISHED_TOKEN.match(text, pos)
+        resume = min((unfinished.end() if unfinished else pos) + 1, len(text))
+        skipped = text[pos:resume]
+        self.getErrorListenerDispatch().syntaxError(
+            self, None, self.line, self.column,
+            f"token recognition error at: '{skipped.translate(_ERROR_DISPLAY)}'", None)
+        newlines = skipped.count("\n")
+        if newlines:
+            self.line += newlines
+            self.column = resume - (pos + skipped.rindex("\n") + 1)
+        else:
+            self.column += resume - pos
+        return resume
+
+    def _generate_tokens(self):
+        text = self.source_text
+        source = (self, None)
+        default_channel = Token.DEFAULT_CHANNEL
+        keyword_types = _KEYWORD_TYPES
+        operator_types = _OPERATOR_TYPES
+        group_types = _GROUP_TYPES
+        id_type = MiniCLexer.ID
+        length = len(text)
+        pos = 0
+
+        while True:
+            for m in TOKEN_PATTERN.finditer(text, pos):
+                start = m.start()
+                if start != pos:
+                    break
+                pos = m.end()
+                kind = m.lastgroup
+                value = m.group()
+                if kind not in SKIPPED:
+                    if kind == "ID":
+                        token_type = keyword_types.get(value, id_type)
+                    elif kind == "OP":
+                        token_type = operator_types[value]
+                    else:
+                        token_type = group_types[kind]
+                    token = CommonToken(source, token_type, default_channel, start, pos - 1)
+                    token._text = value
+                    yield token
+                    if kind != "STRING_LITERAL" and kind != "CHAR_LITERAL":
+                        self.column += pos - start
+                        continue
+
+                newlines = value.count("\n")
+                if newlines:
+                    self.line += newlines
+                    self.column = pos - (start + value.rindex("\n") + 1)
+                else:
+                    self.column += pos - start
+            if pos == length:
+                break
+            pos = self._skip_unrecognised(text, pos)
+
+        eof = CommonToken(source, Token.EOF, default_channel, length, length - 1)
+        eof._text = "<EOF>"
+        while True:
+            yield eof
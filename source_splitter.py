@@ -0,0 +1,65 @@
+import re
+from collections import namedtuple
+
+FunctionSpan = namedtuple("FunctionSpan", ["start", "end", "line", "name"])
+
+
+class SourceSplitError(ValueError):
+    pass
+
+
+_SKIP = re.compile(r"(?:[ \t\r\n]+|//[^\r\n]*)*")
+_SCAN = re.compile(r"[{}\"']|//")
+_LITERAL = re.compile(r"\"(?:[^\"\\]|\\.)*\"|'(?:[^'\\]|\\.)'", re.DOTALL)
+_HEADER = re.compile(r"[a-zA-Z_][a-zA-Z_0-9]*\s+([a-zA-Z_][a-zA-Z_0-9]*)\s*\(")
+
+
+def split_top_level_functions(source_text):
+    """Split a Mini-C program into the spans of its top-level function definitions.
+
+    This is a cheap brace scan, not a parse: it skips whitespace and comments
+    between functions and, inside a function, string and character literals
+    and comments, and ends each span at the '}' that closes its first '{'.
+    Malformed text ends up inside some span and is reported when that span
+    is parsed. `line` is the 1-based line a span starts on and `name` the
+    function name from its header, or None if the header is not recognisable.
+    """
+    spans = []
+    length = len(source_text)
+    pos = 0
+    line = 1
+    previous_start = 0
+
+    while True:
+        pos = _SKIP.match(source_text, pos).end()
+        if pos >= length:
+            return spans
+
+        start = pos
+        line += source_text.count("\n", previous_start, start)
+        previous_start = start
+        depth = 0
+        while True:
+            m = _SCAN.search(source_text, pos)
+            if m is None:
+                raise SourceSplitError(f"line {line}: unterminated function definition")
+            token = m.group()
+            if token == "{":
+                depth += 1
+                pos = m.end()
+            elif token == "}":
+                depth -= 1
+                pos = m.end()
+                if depth == 0:
+                    break
+                if depth < 0:
+                    raise SourceSplitError(f"line {line}: unbalanced '}}' outside a function definition")
+            elif token == "//":
+                newline = source_text.find("\n", m.end())
+                pos = length if newline < 0 else newline
+            else:
+                literal = _LITERAL.match(source_text, m.start())
+                pos = literal.end() if literal else m.end()
+
+        header = _HEADER.match(source_text, start)
+        spans.append(FunctionSpan(start, pos, line, header.group(1) if header else None))
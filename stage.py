@@ -0,0 +1,19 @@
+class StageResult:
+    """What the code in a stage block produced: the AST it leaves in `tree`, the text in `output`.
+
+    Pipeline and Obfuscator give their stages one whether or not a
+    metrics.Metrics measures them; the rest of the slots are filled in by
+    Metrics.stage().
+    """
+    __slots__ = ("tree", "output", "wall", "_before", "_peak", "_overhead_wall", "_overhead_cpu")
+
+    def __init__(self):
+        self.tree = None
+        self.output = None
+        # Wall-clock seconds, once the stage is over.
+        self.wall = None
+        # node_keys() of the tree the stage started from, if nodes are counted.
+        self._before = None
+        self._peak = 0
+        # Time stages within this one spent counting nodes.
+        self._overhead_wall = self._overhead_cpu = 0.0
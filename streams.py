@@ -0,0 +1,191 @@
+import mmap
+
+from antlr4.Token import Token
+from antlr4.BufferedTokenStream import TokenStream
+from antlr4.error.Errors import IllegalStateException
+
+
+class MmapCharStream:
+    """ANTLR character stream over a memory-mapped file.
+
+    Characters are the file's bytes, so the file is never decoded into one
+    big Python string; token text is decoded as UTF-8 when it is extracted.
+    Non-ASCII characters therefore count as several columns, and a
+    non-ASCII CHAR_LITERAL does not lex, but everything else in Mini-C is
+    ASCII.
+    """
+
+    def __init__(self, path):
+        self.name = path
+        self._file = open(path, 'rb')
+        try:
+            self.data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files cannot be mapped.
+            self.data = b""
+        self._size = len(self.data)
+        self._index = 0
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def index(self):
+        return self._index
+
+    @property
+    def size(self):
+        return self._size
+
+    def reset(self):
+        self._index = 0
+
+    def consume(self):
+        if self._index >= self._size:
+            raise IllegalStateException("cannot consume EOF")
+        self._index += 1
+
+    def LA(self, offset):
+        if offset == 0:
+            return 0
+        if offset < 0:
+            offset += 1
+        pos = self._index + offset - 1
+        if pos < 0 or pos >= self._size:
+            return Token.EOF
+        return self.data[pos]
+
+    def LT(self, offset):
+        return self.LA(offset)
+
+    def mark(self):
+        return -1
+
+    def release(self, marker):
+        pass
+
+    def seek(self, index):
+        self._index = min(index, self._size)
+
+    def getText(self, start, stop):
+        if start >= self._size:
+            return ""
+        return self.data[start:min(stop, self._size - 1) + 1].decode('utf-8', errors='replace')
+
+    def __str__(self):
+        return self.getText(0, self._size - 1)
+
+
+class WindowedTokenStream(TokenStream):
+    """Token stream that forgets tokens once the parser no longer needs them.
+
+    Like ANTLR's UnbufferedTokenStream in other targets: tokens are kept only
+    from the oldest open mark (adaptive prediction marks while it looks
+    ahead), plus the previous token for LT(-1). Memory is bounded by the
+    longest lookahead instead of the whole file. The lexer must copy token
+    text (CommonTokenFactory(copyText=True)) because the characters behind
+    discarded tokens may be gone too.
+    """
+
+    def __init__(self, tokenSource):
+        self.tokenSource = tokenSource
+        self.tokens = []
+        self.buffer_start = 0
+        self.index = 0
+        self.num_markers = 0
+        self.fetchedEOF = False
+        self._sync(0)
+
+    def getTokenSource(self):
+        return self.tokenSource
+
+    @property
+    def sourceName(self):
+        return self.tokenSource.getSourceName()
+
+    def _sync(self, i):
+        # Make sure absolute token index i is buffered (or EOF has been reached).
+        while not self.fetchedEOF and i >= self.buffer_start + len(self.tokens):
+            token = self.tokenSource.nextToken()
+            if token.channel != Token.DEFAULT_CHANNEL and token.type != Token.EOF:
+                continue
+            token.tokenIndex = self.buffer_start + len(self.tokens)
+            self.tokens.append(token)
+            if token.type == Token.EOF:
+                self.fetchedEOF = True
+
+    def LT(self, k):
+        if k == 0:
+            return None
+        if k < 0:
+            i = self.index + k
+            if i < self.buffer_start:
+                return None
+            return self.tokens[i - self.buffer_start]
+        i = self.index + k - 1
+        self._sync(i)
+        offset = i - self.buffer_start
+        if offset >= len(self.tokens):
+            return self.tokens[-1]
+        return self.tokens[offset]
+
+    def LA(self, k):
+        return self.LT(k).type
+
+    def get(self, index):
+        if index < self.buffer_start:
+            raise IllegalStateException(f"token {index} has already been discarded")
+        self._sync(index)
+        return self.tokens[index - self.buffer_start]
+
+    def consume(self):
+        if self.LA(1) == Token.EOF:
+            raise IllegalStateException("cannot consume EOF")
+        self.index += 1
+        if self.num_markers == 0:
+            # Keep the previous token for LT(-1), drop everything before it.
+            discard = self.index - 1 - self.buffer_start
+            if discard > 0:
+                del self.tokens[:discard]
+                self.buffer_start += discard
+        self._sync(self.index)
+
+    def mark(self):
+        self.num_markers += 1
+        return -self.num_markers
+
+    def release(self, marker):
+        if self.num_markers == 0:
+            raise IllegalStateException("release() called with no open mark")
+        self.num_markers -= 1
+
+    def seek(self, index):
+        if index < self.buffer_start:
+            raise IllegalStateException(f"cannot seek to discarded token {index}")
+        self._sync(index)
+        self.index = min(index, self.buffer_start + len(self.tokens) - 1)
+
+    def reset(self):
+        self.seek(0)
+
+    def getText(self, start=None, stop=None):
+        if start is None or stop is None:
+            start_index, stop_index = self.buffer_start, self.buffer_start + len(self.tokens) - 1
+        else:
+            start_index = start.tokenIndex if isinstance(start, Token) else start
+            stop_index = stop.tokenIndex if isinstance(stop, Token) else stop
+        parts = ["..."] if start_index < self.buffer_start else []
+        for i in range(max(start_index, self.buffer_start), min(stop_index, self.buffer_start + len(self.tokens) - 1) + 1):
+            token = self.tokens[i - self.buffer_start]
+            if token.type == Token.EOF:
+                break
+            parts.append(token.text)
+        return "".join(parts)
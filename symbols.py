@@ -0,0 +1,44 @@
+import contextlib
+
+
+class SymbolTable:
+    """Interns identifier text as small integer IDs.
+
+    Every IdentifierNode stores its name as an ID into SYMBOLS, so each
+    distinct name is kept once and passes can index lists by ID instead of
+    hashing strings. IDs are only meaningful inside one process; nodes are
+    pickled by name and re-interned when loaded. Names are kept for the life
+    of the process unless interned within a scope().
+    """
+
+    def __init__(self):
+        self.names = []
+        self.ids = {}
+
+    def __len__(self):
+        return len(self.names)
+
+    def intern(self, name):
+        symbol_id = self.ids.get(name)
+        if symbol_id is None:
+            symbol_id = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return symbol_id
+
+    @contextlib.contextmanager
+    def scope(self):
+        """Forget the names first interned in the with block when it ends.
+
+        Their IDs are given out again afterwards, so no node made in the
+        block may be used after it.
+        """
+        size = len(self.names)
+        try:
+            yield
+        finally:
+            for name in self.names[size:]:
+                del self.ids[name]
+            del self.names[size:]
+
+
+SYMBOLS = SymbolTable()
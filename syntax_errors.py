@@ -0,0 +1,9 @@
+from antlr4.error.ErrorListener import ErrorListener
+
+
+class SyntaxErrorCollector(ErrorListener):
+    def __init__(self):
+        self.errors = []
+
+    def syntaxError(self, recognizer, offendingSymbol, line, column, msg, e):
+        self.errors.append(f"line {line}:{column} {msg}")
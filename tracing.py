@@ -0,0 +1,97 @@
+import contextlib
+import json
+import os
+import time
+
+import traversal
+from code_generator import CodeGenerator
+
+
+class Tracer:
+    """Records nested spans as Chrome trace events, for chrome://tracing or https://ui.perfetto.dev.
+
+    Each span is a complete ("X") event with its start and duration in
+    microseconds of time.perf_counter_ns(), which is the same clock in
+    every process on a machine, so events recorded in worker processes
+    (see take_events()) line up with the parent's when merged. Spans are
+    nested by time, so they must be closed in the reverse order they were
+    opened.
+    """
+
+    def __init__(self, process_name=None):
+        self.pid = os.getpid()
+        self.events = []
+        if process_name:
+            self.events.append({"name": "process_name", "ph": "M", "pid": self.pid, "tid": self.pid,
+                                "args": {"name": process_name}})
+
+    @staticmethod
+    def now():
+        return time.perf_counter_ns() // 1000
+
+    def complete(self, name, category, start, **args):
+        """Record a span from `start` (a now() value) to now."""
+        event = {"name": name, "cat": category, "ph": "X", "ts": start, "dur": self.now() - start,
+                 "pid": self.pid, "tid": self.pid}
+        if args:
+            event["args"] = args
+        self.events.append(event)
+
+    @contextlib.contextmanager
+    def span(self, name, category, **args):
+        start = self.now()
+        try:
+            yield
+        finally:
+            self.complete(name, category, start, **args)
+
+    def take_events(self):
+        """Return the events recorded so far and forget them, e.g. to send them from a worker to its parent."""
+        events, self.events = self.events, []
+        return events
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, f)
+
+
+class FunctionSpans(traversal.Phase):
+    """Records a span per function definition of a walk; goes first among the walk's phases.
+
+    The span covers the function's subtree and the other phases' enter
+    hooks on it, but not their leave hooks on the FunctionDefNode itself.
+    """
+
+    def __init__(self, tracer, category):
+        super().__init__(None)
+        self.tracer = tracer
+        self.category = category
+        self.open = []
+
+    def enter_programnode(self, node):
+        return None
+
+    def enter_default(self, node):
+        return traversal.SKIP
+
+    def enter_functiondefnode(self, node):
+        self.open.append((node.name.name, self.tracer.now()))
+        return traversal.SKIP
+
+    def leave_functiondefnode(self, node, parent):
+        name, start = self.open.pop()
+        self.tracer.complete(f"function {name}", self.category, start)
+        return node
+
+
+class TracingCodeGenerator(CodeGenerator):
+    """A CodeGenerator that records a span per function definition it generates."""
+
+    def __init__(self, tracer):
+        super().__init__()
+        self.tracer = tracer
+
+    def visit_functiondefnode(self, node):
+        start = self.tracer.now()
+        yield from super().visit_functiondefnode(node)
+        self.tracer.complete(f"function {node.name.name}", "generate", start)
@@ -0,0 +1,199 @@
+from types import GeneratorType
+
+import ast_nodes as ast
+
+# Nodes that run() and walk() have visited so far, for metrics.
+nodes_visited = 0
+
+
+def run(visitor, root):
+    """Visit the tree under `root` with `visitor` without recursing in Python.
+
+    `visitor._dispatch` (an ast_nodes.DispatchTable) gives the method for
+    each node. A method that does not yield simply returns the node's
+    result. A method that is a generator hands children to the engine with
+    `new_child = yield child`, which visits `child` and sends back its
+    result. Code before the first yield runs on the way down (a pre-order
+    hook), code after the last on the way back up (a post-order hook), and
+    the generator's return value is the node's result, which passes use
+    to replace the node in its parent. Yielding None sends back None.
+
+    Suspended generators are kept on an explicit stack, so tree depth is
+    limited by memory rather than by the recursion limit.
+    """
+    global nodes_visited
+    if root is None:
+        return None
+    dispatch = visitor._dispatch
+    result = dispatch[type(root)](visitor, root)
+    if type(result) is not GeneratorType:
+        nodes_visited += 1
+        return result
+    stack = [result]
+    value = None
+    visited = 1
+    while stack:
+        try:
+            child = stack[-1].send(value)
+        except StopIteration as stop:
+            stack.pop()
+            value = stop.value
+            continue
+        if child is None:
+            value = None
+            continue
+        visited += 1
+        result = dispatch[type(child)](visitor, child)
+        if type(result) is GeneratorType:
+            stack.append(result)
+            value = None
+        else:
+            value = result
+    nodes_visited += visited
+    return value
+
+
+# Returned by an enter hook to keep its phase out of the node's subtree.
+SKIP = object()
+
+_LEAVE = object()
+
+
+class Phase:
+    """One pass's work for a single walk, as per-node hooks that walk() can fuse with other phases.
+
+    enter_<class name in lower case>(node) runs before the node's children
+    and may return SKIP to keep this phase out of the subtree.
+    leave_<class name>(node, parent) runs after them, once the node holds
+    its children's replacements, and returns the node's own replacement.
+    `parent` is the parent as it was when the walk reached it.
+    enter_default and leave_default, if defined, handle every node class
+    without its own hook.
+
+    To decide what can share a walk, a phase declares sets of aspects of the
+    tree (e.g. "names", "statements"):
+    - `writes`: what it changes or computes;
+    - `reads`: what its leave hooks look at in the node's subtree;
+    - `needs`: what must be final for the whole tree before its walk starts,
+      including anything its enter hooks look at.
+    """
+    reads = writes = needs = frozenset()
+
+    def __init__(self, update):
+        # How changed children are put into their parent; see ObfuscationPass.update().
+        self.update = update
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._enter = ast.DispatchTable(cls, getattr(cls, 'enter_default', None), prefix='enter_')
+        cls._leave = ast.DispatchTable(cls, getattr(cls, 'leave_default', None), prefix='leave_')
+
+    def begin(self, root):
+        """Called before the walk."""
+
+    def end(self, root):
+        """Called after the walk with the new root."""
+
+
+def plan_walks(phases):
+    """Group `phases`, in order, into as few walks as their reads, writes and needs allow.
+
+    A phase joins the walk before it unless it needs something a phase of
+    that walk writes, or writes something a phase of that walk reads.
+    """
+    walks = []
+    written = read = frozenset()
+    for phase in phases:
+        if walks and not phase.needs & written and not phase.writes & read:
+            walks[-1].append(phase)
+            written |= phase.writes
+            read |= phase.reads
+        else:
+            walks.append([phase])
+            written, read = phase.writes, phase.reads
+    return walks
+
+
+def walk(root, phases, update):
+    """Run the hooks of several Phases over the tree under `root` in one walk and return the new root.
+
+    At each node the phases' enter hooks run in order, then the children
+    are walked (by the node class's _child_fields), changed children are
+    put in with `update(node, **changes)`, and the leave hooks run in order,
+    each on the previous one's result. Running phases this way gives the
+    same result as running them one after the other whenever plan_walks()
+    would put them in the same walk. Like run(), it keeps its own stack.
+    """
+    global nodes_visited
+    for phase in phases:
+        phase.begin(root)
+    results = []
+    stack = [(root, None, [(phase._enter, phase._leave, phase) for phase in phases])]
+    push, pop, emit = stack.append, stack.pop, results.append
+    Node = ast.Node
+    visited = 1
+    while stack:
+        frame = pop()
+        if frame[0] is _LEAVE:
+            _, node, parent, active, layout, count = frame
+            children = results[-count:]
+            del results[-count:]
+            changes = None
+            position = 0
+            for field, size in layout:
+                if size is None:
+                    child = children[position]
+                    position += 1
+                    if child is not getattr(node, field):
+                        if changes is None:
+                            changes = {}
+                        changes[field] = child
+                else:
+                    items = children[position:position + size]
+                    position += size
+                    for item, old in zip(items, getattr(node, field)):
+                        if item is not old:
+                            if changes is None:
+                                changes = {}
+                            changes[field] = items
+                            break
+            if changes is not None:
+                node = update(node, **changes)
+        else:
+            node, parent, active = frame
+            node_class = type(node)
+            descending = []
+            for hooks in active:
+                enter = hooks[0][node_class]
+                if enter is None or enter(hooks[2], node) is not SKIP:
+                    descending.append(hooks)
+            if descending and node_class._child_fields:
+                layout = []
+                children = []
+                for field in node_class._child_fields:
+                    value = getattr(node, field)
+                    if value is None:
+                        continue
+                    if isinstance(value, Node):
+                        layout.append((field, None))
+                        children.append(value)
+                    else:  # a list, or an ast_arena.ArenaList
+                        items = list(value)
+                        layout.append((field, len(items)))
+                        children.extend(items)
+                if children:
+                    visited += len(children)
+                    push((_LEAVE, node, parent, active, layout, len(children)))
+                    for child in reversed(children):
+                        push((child, node, descending))
+                    continue
+        for hooks in active:
+            leave = hooks[1][type(node)]
+            if leave is not None:
+                node = leave(hooks[2], node, parent)
+        emit(node)
+    nodes_visited += visited
+    root, = results
+    for phase in phases:
+        phase.end(root)
+    return root